@@ -3,89 +3,538 @@ Medical Image Analysis API
 Extensible API for medical image classification with Grad-CAM visualization.
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Union
+import asyncio
 import base64
+import functools
+import json
 import os
 
 from dotenv import load_dotenv
 load_dotenv()
 
 from app.models import BrainTumorClassifier, PneumoniaClassifier, BoneFractureClassifier, RetinalOCTClassifier
-from app.utils.llm import generate_explanation, get_fallback_explanation
+from app.models.base import BaseClassifier
+from app.models.registry import ModelRegistry
+from app.models.sharing import memory_report
+from app.utils.llm import (
+    generate_explanation_async,
+    stream_explanation,
+    get_fallback_explanation,
+    close_clients,
+    warm_explanation_cache,
+    EXPLANATION_CACHE,
+)
+from app.utils.batching import MicroBatcher
+from app.utils.executor import InferenceExecutor, ExecutorBusyError
+from app.utils.cache import ResultCache
+from app.utils.encoding import IMAGE_FORMATS, ImageEncoding
+from app.utils.preprocessing import ImageTooLargeError, preprocess_shared
+from app.utils.archives import BatchCollector, BatchItem, BatchTooLargeError, is_archive
+from app.utils.jobs import FINISHED_STATUSES, JobManager, JobQueueFullError, JobStore
+from app.utils.responses import (
+    BINARY_MEDIA_TYPE,
+    RESPONSE_FORMATS,
+    pack_binary,
+    pack_multipart,
+    split_images,
+)
 
 # ============================================================================
 # Model Registry - Add new models here
 # ============================================================================
 
-MODELS: Dict[str, Any] = {}
+REGISTRY = ModelRegistry(
+    weights_dir=os.getenv("WEIGHTS_DIR", "./weights"),
+    memory_budget=int(float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024),
+    share_backbone=os.getenv("SHARE_BACKBONE", "0") == "1"
+)
+REGISTRY.register("brain_tumor", BrainTumorClassifier, "Brain tumor")
+REGISTRY.register("pneumonia", PneumoniaClassifier, "Pneumonia")
+REGISTRY.register("bone_fracture", BoneFractureClassifier, "Bone fracture")
+REGISTRY.register("retinal_oct", RetinalOCTClassifier, "Retinal OCT")
 
-def load_models():
-    """Load all available models at startup."""
-    weights_dir = os.getenv("WEIGHTS_DIR", "./weights")
-    
-    # Brain Tumor Model
-    brain_tumor_weights = os.path.join(weights_dir, "brain_tumor_model.pth")
-    brain_tumor_config = os.path.join(weights_dir, "brain_tumor_config.json")
+# Per-model request queues for /predict (see setup_batchers)
+BATCHERS: Dict[str, MicroBatcher] = {}
+
+# Thread pool for all blocking model work (see setup_executor)
+EXECUTOR: Optional[InferenceExecutor] = None
+
+# Uploads larger than this are rejected with 413 (see also MAX_IMAGE_PIXELS)
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+
+# Limits and forward-pass size of /predict/{model_name}/batch
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "1000"))
+BATCH_MAX_UPLOAD_BYTES = int(float(os.getenv("BATCH_MAX_UPLOAD_MB", "512")) * 1024 * 1024)
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "32"))
+
+# Background job workers (see setup_jobs)
+JOBS: Optional[JobManager] = None
+
+# Prediction / Grad-CAM responses keyed by model, weights and image content
+RESULT_CACHE = ResultCache(
+    max_bytes=int(float(os.getenv("RESULT_CACHE_MB", "64")) * 1024 * 1024),
+    disk_dir=os.getenv("RESULT_CACHE_DIR") or None,
+    disk_max_bytes=int(float(os.getenv("RESULT_CACHE_DISK_MB", "512")) * 1024 * 1024)
+)
+
+def preload_models():
+    """
+    Load the models listed in MODEL_WARM ahead of the first request.
     
-    if os.path.exists(brain_tumor_weights) and os.path.exists(brain_tumor_config):
-        try:
-            classifier = BrainTumorClassifier()
-            classifier.load_model(brain_tumor_weights, brain_tumor_config)
-            MODELS["brain_tumor"] = classifier
-            print("✓ Brain tumor model loaded")
-        except Exception as e:
-            print(f"✗ Failed to load brain tumor model: {e}")
+    MODEL_WARM is a comma-separated list of model names, or "all". Every
+    other model is loaded on first use (see ModelRegistry).
+    """
+    warm = os.getenv("MODEL_WARM", "").strip()
+    if warm == "all":
+        names = REGISTRY.available
     else:
-        print(f"✗ Brain tumor model files not found in {weights_dir}")
+        names = [name.strip() for name in warm.split(",") if name.strip()]
+    REGISTRY.preload(names)
+
+
+def run_predict_batch(model_name: str, images: List[bytes]) -> List[Any]:
+    """Batched prediction entry point for the micro-batchers."""
+    return REGISTRY.get(model_name).predict_batch(images)
+
+
+def collect_batch(files: List[UploadFile]) -> List[BatchItem]:
+    """
+    Read the images of a batch upload, unpacking archives.
+    
+    Blocking; runs on the inference executor. Everything is read before the
+    response starts because the uploads are closed once the handler returns.
     
-    # Pneumonia Model
-    pneumonia_weights = os.path.join(weights_dir, "pneumonia_model.pth")
-    pneumonia_config = os.path.join(weights_dir, "pneumonia_config.json")
+    Raises:
+        BatchTooLargeError: If the batch exceeds BATCH_MAX_IMAGES or BATCH_MAX_UPLOAD_MB
+    """
+    collector = BatchCollector(BATCH_MAX_IMAGES, BATCH_MAX_UPLOAD_BYTES, MAX_UPLOAD_BYTES)
+    for file in files:
+        name = file.filename or "upload"
+        if is_archive(file.filename, file.content_type):
+            collector.add_archive(name, file.file)
+        elif file.content_type and file.content_type.startswith("image/"):
+            collector.add_image(name, file.file)
+        else:
+            collector.add(name, ValueError("File must be an image or a zip/tar archive"))
+    return collector.items
 
-    if os.path.exists(pneumonia_weights) and os.path.exists(pneumonia_config):
-        try:
-            classifier = PneumoniaClassifier()
-            classifier.load_model(pneumonia_weights, pneumonia_config)
-            MODELS["pneumonia"] = classifier
-            print("✓ Pneumonia model loaded")
-        except Exception as e:
-            print(f"✗ Failed to load pneumonia model: {e}")
-    else:
-        print(f"✗ Pneumonia model files not found in {weights_dir}")
 
-    # Bone fracture Model
-    bone_fracture_weights = os.path.join(weights_dir, "bone_fracture_model.pth")
-    bone_fracture_config = os.path.join(weights_dir, "bone_fracture_config.json")
+def run_predict_chunk(model_name: str, items: List[BatchItem]) -> List[Dict[str, Any]]:
+    """
+    Predict one chunk of a batch upload as a single tensor batch.
+    
+    Cached results are reused and new ones cached, under the same keys as
+    /predict. Items that fail (unreadable, undecodable) get an "error".
+    """
+    entries = [{"filename": name} for name, _ in items]
+    pending = []
+    
+    for entry, (_, data) in zip(entries, items):
+        if isinstance(data, Exception):
+            entry["error"] = str(data)
+            continue
+        cache_key = result_cache_key(model_name, data)
+        cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            entry.update(cached)
+        else:
+            pending.append((entry, cache_key, data))
+    
+    if pending:
+        results = run_predict_batch(model_name, [data for _, _, data in pending])
+        for (entry, cache_key, _), result in zip(pending, results):
+            if isinstance(result, Exception):
+                entry["error"] = f"Could not process image: {result}"
+            else:
+                RESULT_CACHE.set(cache_key, result)
+                entry.update(result)
+    
+    return entries
+
 
-    if os.path.exists(bone_fracture_weights) and os.path.exists(bone_fracture_config):
+def prepare_shared_inputs(
+    model_names: List[str],
+    image_bytes: bytes
+) -> Tuple[Dict[str, Tuple[BaseClassifier, Any]], Dict[str, str]]:
+    """
+    Load the models and preprocess one upload for all of them.
+    
+    The image is decoded once and models with the same input size and
+    normalization share one input tensor (see preprocess_shared).
+    
+    Returns:
+        (classifier, input tensor) by model name, and an error message for
+        each model that could not be loaded
+        
+    Raises:
+        ImageTooLargeError: If the image exceeds MAX_IMAGE_PIXELS
+    """
+    classifiers = {}
+    errors = {}
+    for name in model_names:
         try:
-            classifier = BoneFractureClassifier()
-            classifier.load_model(bone_fracture_weights, bone_fracture_config)
-            MODELS["bone_fracture"] = classifier
-            print("✓ Bone fracture model loaded")
+            classifiers[name] = REGISTRY.get(name)
         except Exception as e:
-            print(f"✗ Failed to load bone fracture model: {e}")
-    else:
-        print(f"✗ Bone fracture model files not found in {weights_dir}")
+            errors[name] = f"Could not load model: {e}"
+    
+    if not classifiers:
+        return {}, errors
+    
+    tensors = preprocess_shared(
+        image_bytes,
+        {name: classifier.preprocessor for name, classifier in classifiers.items()}
+    )
+    inputs = {name: (classifiers[name], tensors[name]) for name in classifiers}
+    return inputs, errors
+
+
+def setup_batchers():
+    """
+    Create a micro-batching queue for each loaded model.
+    
+    Concurrent /predict requests are grouped for up to BATCH_MAX_WAIT_MS
+    (or until BATCH_MAX_SIZE requests are queued) and run as one forward pass.
+    """
+    max_batch_size = int(os.getenv("BATCH_MAX_SIZE", "8"))
+    max_wait_ms = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+    
+    for name in REGISTRY.available:
+        BATCHERS[name] = MicroBatcher(
+            functools.partial(run_predict_batch, name),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            executor=EXECUTOR.pool
+        )
+    print(f"✓ Micro-batching: max {max_batch_size} requests / {max_wait_ms} ms")
 
-    # Retinal OCT Model
-    retinal_oct_weights = os.path.join(weights_dir, "retinal_oct_model.pth")
-    retinal_oct_config = os.path.join(weights_dir, "retinal_oct_config.json")
 
-    if os.path.exists(retinal_oct_weights) and os.path.exists(retinal_oct_config):
+def setup_executor():
+    """
+    Create the inference executor from environment settings.
+    
+    INFERENCE_WORKERS threads run model work; up to INFERENCE_MAX_QUEUE more
+    requests may wait before new ones are rejected with 503. Set
+    GRADCAM_EXECUTOR=process to run Grad-CAM in GRADCAM_PROCESSES separate
+    processes (each loads its own copy of the models on first use).
+    """
+    global EXECUTOR
+    EXECUTOR = InferenceExecutor(
+        max_workers=int(os.getenv("INFERENCE_WORKERS", "2")),
+        max_queue=int(os.getenv("INFERENCE_MAX_QUEUE", "32")),
+        gradcam_mode=os.getenv("GRADCAM_EXECUTOR", "thread"),
+        gradcam_processes=int(os.getenv("GRADCAM_PROCESSES", "1")),
+        process_initializer=preload_models
+    )
+    print(
+        f"✓ Inference executor: {EXECUTOR.max_workers} worker(s), "
+        f"max {EXECUTOR.max_pending} pending, Grad-CAM in {EXECUTOR.gradcam_mode}"
+    )
+
+
+def run_gradcam(
+    model_name: str,
+    image_bytes: bytes,
+    target_class: Optional[int],
+    output_type: str,
+    encoding: Optional[ImageEncoding] = None
+) -> Dict[str, Any]:
+    """
+    Grad-CAM entry point for the inference executor.
+    
+    Module-level so it can be pickled into Grad-CAM worker processes, which
+    load models into their own registry.
+    """
+    return REGISTRY.get(model_name).get_gradcam(
+        image_bytes,
+        target_class=target_class,
+        output_type=output_type,
+        encoding=encoding
+    )
+
+
+def run_gradcam_classes(
+    model_name: str,
+    image_bytes: bytes,
+    target_classes: Optional[List[int]],
+    output_type: str
+) -> Dict[str, Any]:
+    """Multi-class Grad-CAM entry point for the inference executor."""
+    return REGISTRY.get(model_name).get_gradcam_classes(
+        image_bytes,
+        target_classes=target_classes,
+        output_type=output_type
+    )
+
+
+def result_cache_key(
+    model_name: str,
+    image_bytes: bytes,
+    target_class: Any = None,
+    output_type: str = "predict"
+) -> str:
+    """
+    Cache key for a response of model_name on image_bytes.
+    
+    Hashes the image (and, if warm_metadata has not, the weights), so call it
+    off the event loop from async handlers. Plain prediction keys need the
+    model's backend tag, which is only known once it has been loaded; async
+    handlers use prediction_cache_key, which loads it on EXECUTOR.
+    """
+    weights_hash = REGISTRY.weights_hash(model_name)
+    if output_type == "predict":
+        # Plain predictions may come from an int8, compiled or ONNX model;
+        # key on what was actually loaded, not on what the config asked for
+        backend_tag = REGISTRY.backend_tag(model_name) or REGISTRY.get(model_name).backend_tag
+        weights_hash += ":" + backend_tag
+    return RESULT_CACHE.make_key(
+        model_name,
+        weights_hash,
+        image_bytes,
+        target_class,
+        output_type
+    )
+
+
+async def prediction_cache_key(model_name: str, image_bytes: bytes) -> str:
+    """
+    Plain prediction cache key, computed off the event loop.
+    
+    A model that has never been loaded is loaded on EXECUTOR first (as the
+    prediction itself would), so loads stay bounded and subject to its
+    backpressure.
+    
+    Raises:
+        ExecutorBusyError: If the model needs loading and the executor is full
+    """
+    if REGISTRY.backend_tag(model_name) is None:
+        await EXECUTOR.run(REGISTRY.get, model_name)
+    return await asyncio.to_thread(result_cache_key, model_name, image_bytes)
+
+
+def setup_jobs():
+    """Open the job database and create the job workers (started in lifespan)."""
+    global JOBS
+    JOBS = JobManager(
+        JobStore(os.getenv("JOBS_DB", "./jobs.db")),
+        process_job_chunk,
+        workers=int(os.getenv("JOB_WORKERS", "2")),
+        max_queued=int(os.getenv("JOB_MAX_QUEUED", "100")),
+        chunk_size=int(os.getenv("JOB_CHUNK_SIZE", "8")),
+        retention_seconds=float(os.getenv("JOB_RETENTION_HOURS", "24")) * 3600
+    )
+
+
+async def process_job_chunk(job: Dict[str, Any], items: List[BatchItem]) -> List[Dict[str, Any]]:
+    """
+    Process a chunk of a job's images (see app.utils.jobs.JobManager).
+    
+    "predict" jobs run the chunk as one tensor batch; Grad-CAM jobs go image
+    by image through the same cached path as /predict/{model_name}/gradcam.
+    ExecutorBusyError propagates so the manager retries the chunk.
+    """
+    model_name = job["model"]
+    params = job["params"]
+    
+    if params["output_type"] == "predict":
+        entries = await EXECUTOR.run(run_predict_chunk, model_name, items)
+        return [{k: v for k, v in entry.items() if k != "filename"} for entry in entries]
+    
+    encoding = ImageEncoding.create(params["output_format"], params["quality"], params["compress_level"])
+    results = []
+    for _, image_bytes in items:
         try:
-            classifier = RetinalOCTClassifier()
-            classifier.load_model(retinal_oct_weights, retinal_oct_config)
-            MODELS["retinal_oct"] = classifier
-            print("✓ Retinal OCT model loaded")
+            result = await cached_gradcam(
+                model_name, image_bytes, params["target_class"], params["output_type"], encoding
+            )
+        except ExecutorBusyError:
+            raise
         except Exception as e:
-            print(f"✗ Failed to load retinal OCT model: {e}")
-    else:
-        print(f"✗ Retinal OCT model files not found in {weights_dir}")
+            results.append({"error": f"Could not process image: {e}"})
+            continue
+        
+        if params["include_explanation"]:
+            explanation = await explain_result(model_name, result)
+            
+            # Use fallback if LLM fails
+            if explanation is None:
+                explanation = get_fallback_explanation(
+                    model_name=model_name,
+                    prediction=result["prediction"],
+                    confidence=result["confidence"]
+                )
+            result["explanation"] = explanation
+        results.append(result)
+    
+    return results
+
+
+async def warm_explanations():
+    """
+    Seed the explanation cache from EXPLANATION_CACHE_WARM_FILE, if set.
+    
+    Sample images are looked up under EXPLANATION_CACHE_SAMPLES_DIR and
+    rendered with Grad-CAM so the cache keys match live requests. Runs in the
+    background after startup so it never delays readiness.
+    """
+    explanations_path = os.getenv("EXPLANATION_CACHE_WARM_FILE")
+    if not explanations_path:
+        return
+    samples_dir = os.getenv("EXPLANATION_CACHE_SAMPLES_DIR", "../frontend/public/samples")
+    
+    def render_comparison(model_name: str, image_bytes: bytes) -> Dict[str, Any]:
+        return REGISTRY.get(model_name).get_gradcam(image_bytes, output_type="all")
+    
+    try:
+        # Only models that are already loaded, so warming never forces a load
+        loaded = await EXECUTOR.run(
+            warm_explanation_cache, explanations_path, samples_dir, render_comparison,
+            REGISTRY.loaded
+        )
+        print(f"✓ Explanation cache warmed with {loaded} entries")
+    except Exception as e:
+        print(f"⚠ Could not warm explanation cache: {e}")
+
+
+async def cached_gradcam(
+    model_name: str,
+    image_bytes: bytes,
+    target_class: Optional[int],
+    output_type: str,
+    encoding: Optional[ImageEncoding] = None
+) -> Dict[str, Any]:
+    """Run Grad-CAM on the inference executor, reusing cached results."""
+    encoding = encoding or ImageEncoding()
+    cache_key = await asyncio.to_thread(
+        result_cache_key, model_name, image_bytes, target_class, f"{output_type}:{encoding.tag}"
+    )
+    result = await asyncio.to_thread(RESULT_CACHE.get, cache_key)
+    if result is None:
+        result = await EXECUTOR.run_gradcam(
+            run_gradcam, model_name, image_bytes, target_class, output_type, encoding
+        )
+        await asyncio.to_thread(RESULT_CACHE.set, cache_key, result)
+    return result
+
+
+def image_b64(image: Optional[Union[str, bytes]]) -> Optional[str]:
+    """Base64 string of a result image, whether it was encoded as base64 or raw bytes."""
+    if isinstance(image, bytes):
+        return base64.b64encode(image).decode()
+    return image
+
+
+def explain_result(model_name: str, result: Dict[str, Any]):
+    """Explanation coroutine for a Grad-CAM result, whether its images are base64 or raw."""
+    images = result["images"]
+    return generate_explanation_async(
+        model_name=model_name,
+        prediction=result["prediction"],
+        confidence=result["confidence"],
+        probabilities=result["probabilities"],
+        original_image_b64=image_b64(images.get("original")),
+        overlay_image_b64=image_b64(images.get("overlay")),
+        comparison_image_b64=image_b64(images.get("comparison")),
+        image_media_type=result["image_media_type"],
+    )
+
+
+def gradcam_response(result: Dict[str, Any], response_format: str) -> Union[Dict[str, Any], Response]:
+    """Serialize a Grad-CAM result as JSON, multipart/mixed or the binary container."""
+    if response_format == "json":
+        return result
+    
+    metadata, images = split_images(result)
+    if response_format == "multipart":
+        body, content_type = pack_multipart(metadata, images, result["image_media_type"])
+        return Response(content=body, media_type=content_type)
+    return Response(content=pack_binary(metadata, images), media_type=BINARY_MEDIA_TYPE)
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the HTTP client goes away while we wait on the LLM."""
+    pass
+
+
+async def until_disconnected(request: Request, coro, poll_interval: float = 0.25):
+    """
+    Await coro, cancelling it if the HTTP client disconnects first.
+    
+    Raises:
+        ClientDisconnectedError: If the client disconnected
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnectedError()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def model_info(model_name: str) -> Dict[str, Any]:
+    """Model metadata, read from its config if the model is not loaded."""
+    classifier = REGISTRY.get_loaded(model_name)
+    if classifier is not None:
+        return {**classifier.get_model_info(), "loaded": True}
+    
+    class_names = REGISTRY.class_names(model_name)
+    return {
+        "model_name": model_name,
+        "classes": class_names,
+        "num_classes": len(class_names),
+        "loaded": False
+    }
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Read an uploaded file, up to MAX_UPLOAD_BYTES.
+    
+    Raises:
+        ImageTooLargeError: If the upload is larger than that
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise ImageTooLargeError(f"Upload is {file.size} bytes, limit is {MAX_UPLOAD_BYTES}")
+    
+    data = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ImageTooLargeError(f"Upload is larger than {MAX_UPLOAD_BYTES} bytes")
+    return data
+
+
+def too_large_error(e: Union[ImageTooLargeError, BatchTooLargeError]) -> HTTPException:
+    """Map an oversized upload to 413."""
+    return HTTPException(status_code=413, detail=str(e))
+
+
+def image_encoding(
+    output_format: Optional[str],
+    quality: Optional[int],
+    compress_level: Optional[int]
+) -> ImageEncoding:
+    """Build the requested image encoding, mapping invalid options to 400."""
+    try:
+        return ImageEncoding.create(output_format, quality, compress_level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def busy_error(e: Union[ExecutorBusyError, JobQueueFullError]) -> HTTPException:
+    """Map a full inference queue to 503 so clients back off and retry."""
+    return HTTPException(
+        status_code=503,
+        detail=f"Server busy, try again shortly: {str(e)}",
+        headers={"Retry-After": "1"}
+    )
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -93,8 +542,17 @@ async def lifespan(app: FastAPI):
     # Startup: Load models
     print("=" * 50)
     print("Loading models...")
-    load_models()
-    print(f"Loaded {len(MODELS)} model(s): {list(MODELS.keys())}")
+    preload_models()
+    print(f"Loaded {len(REGISTRY.loaded)} of {len(REGISTRY.available)} model(s): {REGISTRY.loaded}")
+    # Cache keys need every model's weights hash; compute them now rather
+    # than on the first request for a model that is not loaded yet
+    REGISTRY.warm_metadata()
+    setup_executor()
+    setup_batchers()
+    setup_jobs()
+    resumed = await JOBS.start()
+    print(f"✓ Jobs: {JOBS.workers} worker(s), {resumed} unfinished job(s) resumed")
+    warm_task = asyncio.create_task(warm_explanations())
     
     # Check LLM availability
     if os.getenv("ANTHROPIC_API_KEY"):
@@ -105,6 +563,12 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown: Cleanup if needed
     print("Shutting down...")
+    warm_task.cancel()
+    await JOBS.stop()
+    await close_clients()
+    for batcher in BATCHERS.values():
+        await batcher.close()
+    EXECUTOR.shutdown()
 
 
 # ============================================================================
@@ -161,36 +625,144 @@ async def health_check():
     """Detailed health check."""
     return {
         "status": "healthy",
-        "models_loaded": len(MODELS),
-        "available_models": list(MODELS.keys()),
-        "llm_enabled": bool(os.getenv("ANTHROPIC_API_KEY"))
+        "models_loaded": len(REGISTRY.loaded),
+        "available_models": REGISTRY.available,
+        "models": REGISTRY.get_stats(),
+        "llm_enabled": bool(os.getenv("ANTHROPIC_API_KEY")),
+        "inference": EXECUTOR.get_stats() if EXECUTOR else None,
+        "result_cache": RESULT_CACHE.get_stats(),
+        "explanation_cache": EXPLANATION_CACHE.get_stats(),
+        "jobs": await JOBS.get_stats() if JOBS else None
     }
 
 
 @app.get("/models", tags=["Info"])
 async def list_models():
     """List all available models and their details."""
+    loaded = {name: REGISTRY.get_loaded(name) for name in REGISTRY.loaded}
+    memory = memory_report({name: c for name, c in loaded.items() if c is not None})
+    
     models_info = {}
-    for name, model in MODELS.items():
-        models_info[name] = model.get_model_info()
+    for name in REGISTRY.available:
+        models_info[name] = model_info(name)
+        if name in memory:
+            models_info[name]["memory"] = memory[name]
     return {"models": models_info}
 
 
 @app.get("/models/{model_name}", tags=["Info"])
 async def get_model_info(model_name: str):
     """Get detailed information about a specific model."""
-    if model_name not in MODELS:
+    if model_name not in REGISTRY:
         raise HTTPException(
             status_code=404, 
-            detail=f"Model '{model_name}' not found. Available: {list(MODELS.keys())}"
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
         )
-    return MODELS[model_name].get_model_info()
+    return model_info(model_name)
 
 
 # ============================================================================
 # Prediction Endpoints
 # ============================================================================
 
+@app.post("/predict/all", tags=["Prediction"])
+async def predict_all(
+    file: UploadFile = File(..., description="Image file to classify"),
+    models: Optional[str] = Query(
+        default=None,
+        description="Comma-separated model names to run (default: all models)"
+    )
+):
+    """
+    Run several classifiers on one uploaded image.
+    
+    The image is uploaded, decoded and preprocessed once; the selected models
+    then run concurrently on the shared input. Results are cached under the
+    same keys as /predict/{model_name}.
+    
+    Returns one entry per model under `results`: the usual prediction fields,
+    or an `error` if that model could not run.
+    """
+    model_names = REGISTRY.available
+    if models is not None:
+        model_names = list(dict.fromkeys(name.strip() for name in models.split(",") if name.strip()))
+        if not model_names:
+            raise HTTPException(
+                status_code=400,
+                detail="models must name at least one model"
+            )
+        unknown = [name for name in model_names if name not in REGISTRY]
+        if unknown:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Model(s) {unknown} not found. Available: {REGISTRY.available}"
+            )
+    
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=400,
+            detail="File must be an image (JPEG, PNG, etc.)"
+        )
+    
+    try:
+        image_bytes = await read_upload(file)
+        
+        results: Dict[str, Any] = {}
+        cache_keys = {}
+        for name in model_names:
+            try:
+                cache_keys[name] = await prediction_cache_key(name, image_bytes)
+            except ExecutorBusyError:
+                raise
+            except Exception as e:
+                # Predict keys need the model loaded once
+                results[name] = {"model": name, "error": f"Could not load model: {e}"}
+                continue
+            cached = await asyncio.to_thread(RESULT_CACHE.get, cache_keys[name])
+            if cached is not None:
+                results[name] = cached
+        
+        pending = [name for name in model_names if name not in results]
+        if pending:
+            inputs, errors = await EXECUTOR.run(prepare_shared_inputs, pending, image_bytes)
+            for name, message in errors.items():
+                results[name] = {"model": name, "error": message}
+            
+            outputs = await asyncio.gather(
+                *(
+                    EXECUTOR.run(classifier.predict_tensor, input_tensor)
+                    for classifier, input_tensor in inputs.values()
+                ),
+                return_exceptions=True
+            )
+            busy = [output for output in outputs if isinstance(output, ExecutorBusyError)]
+            if busy and len(busy) == len(inputs):
+                # Nothing ran (models that failed to load never reached the executor)
+                raise busy[0]
+            
+            for name, output in zip(inputs, outputs):
+                if isinstance(output, ExecutorBusyError):
+                    results[name] = {"model": name, "error": f"Server busy: {output}"}
+                elif isinstance(output, Exception):
+                    results[name] = {"model": name, "error": f"Prediction failed: {output}"}
+                else:
+                    await asyncio.to_thread(RESULT_CACHE.set, cache_keys[name], output)
+                    results[name] = output
+        
+        return {
+            "models": model_names,
+            "results": {name: results[name] for name in model_names}
+        }
+    
+    except ImageTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+
 @app.post("/predict/{model_name}", tags=["Prediction"])
 async def predict(
     model_name: str,
@@ -202,10 +774,10 @@ async def predict(
     Returns prediction with confidence scores for all classes.
     """
     # Validate model
-    if model_name not in MODELS:
+    if model_name not in REGISTRY:
         raise HTTPException(
             status_code=404,
-            detail=f"Model '{model_name}' not found. Available: {list(MODELS.keys())}"
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
         )
     
     # Validate file type
@@ -217,19 +789,97 @@ async def predict(
     
     try:
         # Read image bytes
-        image_bytes = await file.read()
+        image_bytes = await read_upload(file)
         
-        # Run prediction
-        result = MODELS[model_name].predict(image_bytes)
+        cache_key = await prediction_cache_key(model_name, image_bytes)
+        result = await asyncio.to_thread(RESULT_CACHE.get, cache_key)
+        if result is not None:
+            return result
         
+        # Run prediction (batched with concurrent requests for this model)
+        async with EXECUTOR.reserve():
+            result = await BATCHERS[model_name].submit(image_bytes)
+        
+        await asyncio.to_thread(RESULT_CACHE.set, cache_key, result)
         return result
     
+    except ImageTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 
+@app.post("/predict/{model_name}/batch", tags=["Prediction"])
+async def predict_batch(
+    model_name: str,
+    files: List[UploadFile] = File(..., description="Image files and/or zip/tar archives of images"),
+    response_format: str = Query(
+        default="json",
+        description="Response body: 'json' (array) or 'ndjson' (one result per line, streamed)"
+    )
+):
+    """
+    Run classification on many images in one request.
+    
+    Accepts any mix of image files and zip/tar archives (images inside an
+    archive are named `<archive>/<path>`). Images run through the model
+    BATCH_CHUNK_SIZE at a time, reusing cached /predict results.
+    
+    Every image gets one result, in upload order, with its `index` and
+    `filename` plus the usual prediction fields. An image that cannot be read
+    or decoded gets an `error` instead, as does a chunk rejected because the
+    server is busy; the rest of the batch is unaffected.
+    """
+    # Validate model
+    if model_name not in REGISTRY:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
+        )
+    
+    # Validate response format
+    if response_format not in ["json", "ndjson"]:
+        raise HTTPException(
+            status_code=400,
+            detail="response_format must be 'json' or 'ndjson'"
+        )
+    
+    try:
+        items = await EXECUTOR.run(collect_batch, files)
+    except BatchTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not read upload: {str(e)}")
+    
+    async def results():
+        for start in range(0, len(items), BATCH_CHUNK_SIZE):
+            chunk = items[start:start + BATCH_CHUNK_SIZE]
+            try:
+                entries = await EXECUTOR.run(run_predict_chunk, model_name, chunk)
+            except ExecutorBusyError as e:
+                entries = [{"filename": name, "error": f"Server busy: {e}"} for name, _ in chunk]
+            except Exception as e:
+                entries = [{"filename": name, "error": f"Prediction failed: {e}"} for name, _ in chunk]
+            for offset, entry in enumerate(entries):
+                yield {"index": start + offset, **entry}
+    
+    if response_format == "ndjson":
+        async def lines():
+            async for entry in results():
+                yield json.dumps(entry) + "\n"
+        
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    return [entry async for entry in results()]
+
+
 @app.post("/predict/{model_name}/gradcam", tags=["Prediction"])
 async def predict_with_gradcam(
+    request: Request,
     model_name: str,
     file: UploadFile = File(..., description="Image file to classify"),
     output_type: str = Query(
@@ -243,6 +893,26 @@ async def predict_with_gradcam(
     include_explanation: bool = Query(
         default=False,
         description="Whether to include AI-generated explanation (adds latency)"
+    ),
+    output_format: Optional[str] = Query(
+        default=None,
+        description="Image format: 'png' (lossless), 'jpeg', or 'webp'"
+    ),
+    quality: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=100,
+        description="JPEG/WebP quality, 1-100"
+    ),
+    compress_level: Optional[int] = Query(
+        default=None,
+        ge=0,
+        le=9,
+        description="PNG compression level, 0-9 (lower is faster but larger)"
+    ),
+    response_format: str = Query(
+        default="json",
+        description="Response body: 'json' (base64 images), 'multipart', or 'binary'"
     )
 ):
     """
@@ -255,12 +925,23 @@ async def predict_with_gradcam(
     - `heatmap`: Just the Grad-CAM heatmap
     - `overlay`: Heatmap overlaid on original image
     - `all`: Original, heatmap, overlay, and side-by-side comparison
+    
+    **Image encoding:** `output_format` picks PNG (lossless, default), JPEG
+    or WebP; `image_media_type` in the response names the format.
+    
+    **Response formats:**
+    - `json`: images as base64 strings inside the JSON body
+    - `multipart`: `multipart/mixed` with a JSON `metadata` part, then one
+      raw image part per visualization
+    - `binary`: `application/x-medlens-gradcam`, a 4-byte big-endian header
+      length, a JSON header whose `images` give each image's offset and
+      length, then the raw images (see app.utils.responses)
     """
     # Validate model
-    if model_name not in MODELS:
+    if model_name not in REGISTRY:
         raise HTTPException(
             status_code=404,
-            detail=f"Model '{model_name}' not found. Available: {list(MODELS.keys())}"
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
         )
     
     # Validate output type
@@ -270,6 +951,17 @@ async def predict_with_gradcam(
             detail="output_type must be 'heatmap', 'overlay', or 'all'"
         )
     
+    # Validate response format
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"response_format must be one of {RESPONSE_FORMATS}"
+        )
+    
+    encoding = image_encoding(output_format, quality, compress_level)
+    if response_format != "json":
+        encoding = encoding._replace(binary=True)
+    
     # Validate file type
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(
@@ -279,30 +971,14 @@ async def predict_with_gradcam(
     
     try:
         # Read image bytes
-        image_bytes = await file.read()
+        image_bytes = await read_upload(file)
         
-        # Run prediction with Grad-CAM
-        result = MODELS[model_name].get_gradcam(
-            image_bytes,
-            target_class=target_class,
-            output_type=output_type
-        )
+        # Run prediction with Grad-CAM (or reuse a cached result)
+        result = await cached_gradcam(model_name, image_bytes, target_class, output_type, encoding)
         
         # Generate explanation if requested (adds latency)
         if include_explanation:
-            comparison_b64 = result["images"].get("comparison")
-            original_b64 = result["images"].get("original")
-            overlay_b64 = result["images"].get("overlay")
-            
-            explanation = generate_explanation(
-                model_name=model_name,
-                prediction=result["prediction"],
-                confidence=result["confidence"],
-                probabilities=result["probabilities"],
-                original_image_b64=original_b64,
-                overlay_image_b64=overlay_b64,
-                comparison_image_b64=comparison_b64,
-            )
+            explanation = await until_disconnected(request, explain_result(model_name, result))
             
             # Use fallback if LLM fails
             if explanation is None:
@@ -314,14 +990,194 @@ async def predict_with_gradcam(
             
             result["explanation"] = explanation
         
+        return gradcam_response(result, response_format)
+    
+    except ClientDisconnectedError:
+        return Response(status_code=499)
+    except ImageTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+
+@app.post("/predict/{model_name}/gradcam/stream", tags=["Prediction"])
+async def predict_gradcam_stream(
+    model_name: str,
+    file: UploadFile = File(..., description="Image file to classify"),
+    output_type: str = Query(
+        default="all",
+        description="Visualization type: 'heatmap', 'overlay', or 'all'"
+    ),
+    target_class: Optional[int] = Query(
+        default=None,
+        description="Class index to visualize. If not provided, uses predicted class."
+    )
+):
+    """
+    Run classification with Grad-CAM and stream the AI explanation.
+    
+    Responds with server-sent events:
+    - `prediction`: the same payload as /predict/{model_name}/gradcam, sent
+      as soon as Grad-CAM is done
+    - `explanation_delta`: `{"text": ...}` chunks as the explanation is written
+    - `explanation`: `{"explanation": ..., "fallback": bool}` with the full text
+    - `done`: end of stream
+    """
+    # Validate model
+    if model_name not in REGISTRY:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
+        )
+    
+    # Validate output type
+    if output_type not in ["heatmap", "overlay", "all"]:
+        raise HTTPException(
+            status_code=400,
+            detail="output_type must be 'heatmap', 'overlay', or 'all'"
+        )
+    
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=400,
+            detail="File must be an image (JPEG, PNG, etc.)"
+        )
+    
+    try:
+        # Read image bytes
+        image_bytes = await read_upload(file)
+        
+        # Grad-CAM runs before the stream opens so failures are plain HTTP errors
+        result = await cached_gradcam(model_name, image_bytes, target_class, output_type)
+    
+    except ImageTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+    
+    def sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    async def events():
+        yield sse("prediction", result)
+        
+        chunks = []
+        async for text in stream_explanation(
+            model_name=model_name,
+            prediction=result["prediction"],
+            confidence=result["confidence"],
+            probabilities=result["probabilities"],
+            original_image_b64=result["images"].get("original"),
+            overlay_image_b64=result["images"].get("overlay"),
+            comparison_image_b64=result["images"].get("comparison"),
+            image_media_type=result["image_media_type"],
+        ):
+            chunks.append(text)
+            yield sse("explanation_delta", {"text": text})
+        
+        # Use fallback if LLM fails
+        explanation = "".join(chunks).strip()
+        fallback = not explanation
+        if fallback:
+            explanation = get_fallback_explanation(
+                model_name=model_name,
+                prediction=result["prediction"],
+                confidence=result["confidence"]
+            )
+        yield sse("explanation", {"explanation": explanation, "fallback": fallback})
+        yield sse("done", {})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Don't let proxies buffer the stream
+        }
+    )
+
+
+@app.post("/predict/{model_name}/gradcam/classes", tags=["Prediction"])
+async def predict_gradcam_classes(
+    model_name: str,
+    file: UploadFile = File(..., description="Image file to classify"),
+    target_classes: Optional[List[int]] = Query(
+        default=None,
+        description="Class indices to visualize. If not provided, visualizes every class."
+    ),
+    output_type: str = Query(
+        default="overlay",
+        description="Visualization type: 'heatmap', 'overlay', or 'all'"
+    )
+):
+    """
+    Run classification with Grad-CAM visualizations for several classes.
+    
+    All classes are computed from a single forward and backward pass, so
+    comparing what the model looks at for each diagnosis costs little more
+    than a single Grad-CAM request.
+    """
+    # Validate model
+    if model_name not in REGISTRY:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
+        )
+    
+    # Validate output type
+    if output_type not in ["heatmap", "overlay", "all"]:
+        raise HTTPException(
+            status_code=400,
+            detail="output_type must be 'heatmap', 'overlay', or 'all'"
+        )
+    
+    # Validate class indices
+    num_classes = len(REGISTRY.class_names(model_name))
+    if target_classes and any(c < 0 or c >= num_classes for c in target_classes):
+        raise HTTPException(
+            status_code=400,
+            detail=f"target_classes must be between 0 and {num_classes - 1}"
+        )
+    
+    # Validate file type
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=400,
+            detail="File must be an image (JPEG, PNG, etc.)"
+        )
+    
+    try:
+        # Read image bytes
+        image_bytes = await read_upload(file)
+        
+        cache_key = await asyncio.to_thread(
+            result_cache_key, model_name, image_bytes, target_classes, f"classes:{output_type}"
+        )
+        result = await asyncio.to_thread(RESULT_CACHE.get, cache_key)
+        if result is None:
+            result = await EXECUTOR.run_gradcam(
+                run_gradcam_classes, model_name, image_bytes, target_classes, output_type
+            )
+            await asyncio.to_thread(RESULT_CACHE.set, cache_key, result)
+        
         return result
     
+    except ImageTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 
 @app.post("/explain/{model_name}", tags=["Explanation"])
 async def explain_prediction(
+    request: Request,
     model_name: str,
     prediction: str = Query(..., description="The predicted class"),
     confidence: float = Query(..., description="Confidence score (0-1)"),
@@ -336,10 +1192,10 @@ async def explain_prediction(
     Send the comparison image (side-by-side original and overlay) for best results.
     """
     # Validate model
-    if model_name not in MODELS:
+    if model_name not in REGISTRY:
         raise HTTPException(
             status_code=404,
-            detail=f"Model '{model_name}' not found. Available: {list(MODELS.keys())}"
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
         )
     
     # Validate file type
@@ -351,17 +1207,21 @@ async def explain_prediction(
     
     try:
         # Read image bytes and convert to base64
-        image_bytes = await file.read()
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
+        image_bytes = await read_upload(file)
+        encoded = await EXECUTOR.run(base64.b64encode, image_bytes)
+        image_b64 = encoded.decode('utf-8')
+        media_types = [media_type for _, media_type in IMAGE_FORMATS.values()]
+        media_type = file.content_type if file.content_type in media_types else "image/png"
         
         # Generate explanation
-        explanation = generate_explanation(
+        explanation = await until_disconnected(request, generate_explanation_async(
             model_name=model_name,
             prediction=prediction,
             confidence=confidence,
             probabilities={},  # Not needed for explanation
             comparison_image_b64=image_b64,
-        )
+            image_media_type=media_type,
+        ))
         
         # Use fallback if LLM fails
         if explanation is None:
@@ -373,6 +1233,12 @@ async def explain_prediction(
         
         return {"explanation": explanation}
     
+    except ClientDisconnectedError:
+        return Response(status_code=499)
+    except ImageTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
 
@@ -388,6 +1254,22 @@ async def predict_gradcam_image(
     target_class: Optional[int] = Query(
         default=None,
         description="Class index to visualize. If not provided, uses predicted class."
+    ),
+    output_format: Optional[str] = Query(
+        default=None,
+        description="Image format: 'png' (lossless), 'jpeg', or 'webp'"
+    ),
+    quality: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=100,
+        description="JPEG/WebP quality, 1-100"
+    ),
+    compress_level: Optional[int] = Query(
+        default=None,
+        ge=0,
+        le=9,
+        description="PNG compression level, 0-9 (lower is faster but larger)"
     )
 ):
     """
@@ -397,10 +1279,10 @@ async def predict_gradcam_image(
     (e.g., in an <img> tag) rather than receiving base64 data.
     """
     # Validate model
-    if model_name not in MODELS:
+    if model_name not in REGISTRY:
         raise HTTPException(
             status_code=404,
-            detail=f"Model '{model_name}' not found. Available: {list(MODELS.keys())}"
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
         )
     
     # Map image_type to output_type
@@ -417,15 +1299,16 @@ async def predict_gradcam_image(
             detail="image_type must be 'original', 'heatmap', 'overlay', or 'comparison'"
         )
     
+    # Raw bytes straight from the encoder, no base64 round trip
+    encoding = image_encoding(output_format, quality, compress_level)._replace(binary=True)
+    
     try:
         # Read image bytes
-        image_bytes = await file.read()
+        image_bytes = await read_upload(file)
         
-        # Run prediction with Grad-CAM
-        result = MODELS[model_name].get_gradcam(
-            image_bytes,
-            target_class=target_class,
-            output_type=type_map[image_type]
+        # Run prediction with Grad-CAM (shares cache entries with binary /gradcam responses)
+        result = await cached_gradcam(
+            model_name, image_bytes, target_class, type_map[image_type], encoding
         )
         
         # Get requested image
@@ -434,12 +1317,9 @@ async def predict_gradcam_image(
             # Fallback for heatmap/overlay only modes
             image_key = list(result["images"].keys())[0]
         
-        image_b64 = result["images"][image_key]
-        image_data = base64.b64decode(image_b64)
-        
         return Response(
-            content=image_data,
-            media_type="image/png",
+            content=result["images"][image_key],
+            media_type=result["image_media_type"],
             headers={
                 "X-Prediction": result["prediction"],
                 "X-Confidence": str(result["confidence"]),
@@ -447,10 +1327,167 @@ async def predict_gradcam_image(
             }
         )
     
+    except ImageTooLargeError as e:
+        raise too_large_error(e)
+    except ExecutorBusyError as e:
+        raise busy_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 
+# ============================================================================
+# Jobs
+# ============================================================================
+
+# How often /jobs/{job_id}/results checks for new results while waiting
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+
+
+@app.post("/jobs", tags=["Jobs"], status_code=202)
+async def create_job(
+    model_name: str = Query(..., description="Model to run"),
+    files: List[UploadFile] = File(..., description="Image files and/or zip/tar archives of images"),
+    output_type: str = Query(
+        default="all",
+        description="'predict' (classification only), 'heatmap', 'overlay', or 'all'"
+    ),
+    target_class: Optional[int] = Query(
+        default=None,
+        description="Class index to visualize. If not provided, uses predicted class."
+    ),
+    include_explanation: bool = Query(
+        default=False,
+        description="Whether to include AI-generated explanations (Grad-CAM jobs only)"
+    ),
+    output_format: Optional[str] = Query(
+        default=None,
+        description="Image format: 'png' (lossless), 'jpeg', or 'webp'"
+    ),
+    quality: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=100,
+        description="JPEG/WebP quality, 1-100"
+    ),
+    compress_level: Optional[int] = Query(
+        default=None,
+        ge=0,
+        le=9,
+        description="PNG compression level, 0-9 (lower is faster but larger)"
+    )
+):
+    """
+    Submit images for background processing.
+    
+    Accepts the same uploads as /predict/{model_name}/batch and returns at
+    once with a job id. Follow progress with GET /jobs/{job_id} and read
+    results, as they finish, from GET /jobs/{job_id}/results. Jobs are stored
+    on disk, so unfinished ones resume after a restart; finished jobs are
+    deleted after JOB_RETENTION_HOURS.
+    """
+    # Validate model
+    if model_name not in REGISTRY:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Model '{model_name}' not found. Available: {REGISTRY.available}"
+        )
+    
+    # Validate output type
+    if output_type not in ["predict", "heatmap", "overlay", "all"]:
+        raise HTTPException(
+            status_code=400,
+            detail="output_type must be 'predict', 'heatmap', 'overlay', or 'all'"
+        )
+    if include_explanation and output_type == "predict":
+        raise HTTPException(
+            status_code=400,
+            detail="include_explanation requires a Grad-CAM output_type"
+        )
+    
+    encoding = image_encoding(output_format, quality, compress_level)
+    params = {
+        "output_type": output_type,
+        "target_class": target_class,
+        "include_explanation": include_explanation,
+        "output_format": encoding.format,
+        "quality": encoding.quality,
+        "compress_level": encoding.compress_level
+    }
+    
+    try:
+        JOBS.check_capacity()
+        items = await EXECUTOR.run(collect_batch, files)
+        if not items:
+            raise HTTPException(status_code=400, detail="No images found in upload")
+        job = await EXECUTOR.run(JOBS.store.create, model_name, params, items)
+    
+    except HTTPException:
+        raise
+    except BatchTooLargeError as e:
+        raise too_large_error(e)
+    except (ExecutorBusyError, JobQueueFullError) as e:
+        raise busy_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not create job: {str(e)}")
+    
+    JOBS.submit(job["job_id"])
+    return {
+        **job,
+        "status_url": f"/jobs/{job['job_id']}",
+        "results_url": f"/jobs/{job['job_id']}/results"
+    }
+
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_job(job_id: str):
+    """Get a job's status and progress."""
+    job = await asyncio.to_thread(JOBS.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+
+@app.get("/jobs/{job_id}/results", tags=["Jobs"])
+async def get_job_results(
+    job_id: str,
+    wait: bool = Query(
+        default=True,
+        description="Keep streaming until the job is finished (false returns what is finished now)"
+    ),
+    after: int = Query(
+        default=0,
+        ge=0,
+        description="Only results with a larger seq (to resume an interrupted stream)"
+    )
+):
+    """
+    Stream a job's results as NDJSON, in the order they finish.
+    
+    Each line is one image's result (or `error`) with its `index`,
+    `filename` and `seq`.
+    """
+    if await asyncio.to_thread(JOBS.store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    
+    async def lines():
+        seq = after
+        while True:
+            # Read the status first: results stored before it said "done"
+            # are then guaranteed to be in the fetch below
+            job = await asyncio.to_thread(JOBS.store.get, job_id)
+            if job is None:
+                return
+            rows = await asyncio.to_thread(JOBS.store.results, job_id, seq)
+            for seq, entry in rows:
+                yield json.dumps({"seq": seq, **entry}) + "\n"
+            if not rows:
+                if job["status"] in FINISHED_STATUSES or not wait:
+                    return
+                await asyncio.sleep(JOB_POLL_SECONDS)
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 # ============================================================================
 # Error Handlers
 # ============================================================================
@@ -0,0 +1,131 @@
+"""
+Inference Backends
+Runtimes that execute a classifier's no-grad forward pass for predictions.
+
+The backend is chosen per model with the "backend" key of its
+*_config.json ("torch" or "onnxruntime"), or for all models with the
+INFERENCE_BACKEND environment variable. Grad-CAM always runs the eager
+PyTorch model, whatever backend serves predictions.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict
+
+import torch
+import torch.nn as nn
+
+from .weights import resolve_weights_path
+
+
+BACKENDS = ["torch", "onnxruntime"]
+ONNX_SUFFIX = ".onnx"
+
+
+def backend_name(config: Dict[str, Any]) -> str:
+    """Backend requested by INFERENCE_BACKEND or, failing that, the model config."""
+    name = os.getenv("INFERENCE_BACKEND") or config.get("backend") or "torch"
+    if name not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got '{name}'")
+    return name
+
+
+def onnx_model_path(weights_path: str) -> str:
+    """Where the ONNX export of weights_path is stored."""
+    return os.path.splitext(weights_path)[0] + ONNX_SUFFIX
+
+
+def onnx_is_current(onnx_path: str, weights_path: str) -> bool:
+    """Whether an ONNX export exists and is newer than its weights."""
+    if not os.path.exists(weights_path):
+        weights_path = resolve_weights_path(weights_path)
+    return (
+        os.path.exists(onnx_path)
+        and os.path.getmtime(onnx_path) >= os.path.getmtime(weights_path)
+    )
+
+
+def export_onnx(model: nn.Module, path: str, image_size: int, opset: int = 17) -> None:
+    """
+    Export an eval-mode model to ONNX with a dynamic batch axis.
+
+    The graph has one input ("input", N x 3 x image_size x image_size) and
+    one output ("logits", N x num_classes).
+    """
+    example = torch.zeros(1, 3, image_size, image_size)
+    kwargs = {}
+    if "dynamo" in torch.onnx.export.__code__.co_varnames:
+        kwargs["dynamo"] = False  # The TorchScript exporter handles dynamic_axes directly
+
+    tmp_path = f"{path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model.eval(),
+            example,
+            tmp_path,
+            input_names=["input"],
+            output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset,
+            **kwargs
+        )
+    os.replace(tmp_path, path)
+
+
+class InferenceBackend(ABC):
+    """Maps a preprocessed input batch to logits."""
+
+    name: str = ""
+
+    @abstractmethod
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        pass
+
+
+class TorchBackend(InferenceBackend):
+    """Runs a PyTorch module (eager, compiled or quantized)."""
+
+    name = "torch"
+
+    def __init__(self, module: nn.Module):
+        self.module = module
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.module(batch)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    Runs an ONNX export on the ONNX Runtime CPU execution provider.
+
+    All graph optimizations are enabled. ORT_THREADS sets the number of
+    intra-op threads (0 lets ONNX Runtime decide).
+    """
+
+    name = "onnxruntime"
+
+    def __init__(self, onnx_path: str):
+        """
+        Create the inference session.
+
+        Raises:
+            ImportError: If onnxruntime is not installed
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = int(os.getenv("ORT_THREADS", "0"))
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            onnx_path,
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(None, {self.input_name: batch.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
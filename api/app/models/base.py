@@ -3,11 +3,33 @@ Base Classifier Interface
 All model classifiers should inherit from this base class.
 """
 
+import os
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from PIL import Image
 import torch
-import io
+
+from ..utils.encoding import ImageEncoding, encode_images
+from ..utils.preprocessing import ImagePreprocessor
+from .backends import (
+    InferenceBackend,
+    OnnxRuntimeBackend,
+    TorchBackend,
+    backend_name,
+    onnx_is_current,
+    onnx_model_path,
+)
+from .compilation import (
+    compile_enabled,
+    compile_model,
+    compiled_model_path,
+    load_script_module,
+    optimize_for_inference,
+    save_script_module,
+)
+from .sharing import module_bytes, share_identical_tensors
+from .quantization import load_quantized, quantization_mode, quantize_dynamic, quantized_model_path
+from .weights import load_state_dict, mmap_enabled, resolve_weights_path
 
 
 class BaseClassifier(ABC):
@@ -22,6 +44,20 @@ class BaseClassifier(ABC):
         self.class_names: List[str] = []
         self.model_name: str = ""
         self.gradcam_visualizer = None
+        self.preprocessor: Optional[ImagePreprocessor] = None
+        self.weights_hash: str = ""
+        self.weights_path: str = ""
+        self.weights_mmap: bool = mmap_enabled()
+        self.inference_model: Optional[InferenceBackend] = None
+        self.quantization: str = "none"
+        self.compiled: bool = False
+        # Set by the registry before load_model: already loaded models whose
+        # identical tensors this one should reuse (see _share_weights)
+        self.share_with: List[torch.nn.Module] = []
+        self.shared_bytes: int = 0
+        # Size of the inference backend's own copy of the weights (0 when
+        # predictions run on self.model)
+        self.backend_bytes: int = 0
     
     @abstractmethod
     def load_model(self, weights_path: str, config_path: str) -> None:
@@ -43,17 +79,360 @@ class BaseClassifier(ABC):
         self, 
         image_bytes: bytes, 
         target_class: Optional[int] = None,
-        output_type: str = "all"
+        output_type: str = "all",
+        encoding: Optional[ImageEncoding] = None
     ) -> Dict[str, Any]:
         """Generate Grad-CAM visualization."""
         pass
     
+    def _build_empty_model(self, num_classes: int) -> torch.nn.Module:
+        """
+        Build the architecture on the meta device.
+        
+        Nothing is allocated or randomly initialized; _load_weights then
+        puts the checkpoint tensors in place.
+        """
+        with torch.device('meta'):
+            return self._build_model(num_classes)
+    
+    def _load_weights(self, weights_path: str) -> None:
+        """
+        Load checkpoint weights into self.model.
+        
+        The parameters adopt the loaded tensors (load_state_dict(assign=True))
+        instead of copying them, so memory-mapped weights stay mapped.
+        """
+        self.weights_mmap = self.weights_mmap and self.device.type == 'cpu'
+        self.weights_path = resolve_weights_path(weights_path) if self.weights_mmap else weights_path
+        state_dict = load_state_dict(weights_path, self.device, mmap=self.weights_mmap)
+        self.model.load_state_dict(state_dict, assign=True)
+    
+    def _setup_inference_model(self, weights_path: str) -> None:
+        """
+        Pick the backend used for plain predictions.
+        
+        ONNX Runtime when the config or INFERENCE_BACKEND asks for it and an
+        up-to-date export exists; otherwise PyTorch, running an int8 version
+        when the config asks for one ("quantization"), else a compiled graph
+        when COMPILE_MODELS=1, else the eager fp32 model. Grad-CAM always
+        runs on the eager fp32 model since it needs gradients.
+        
+        Tensors are shared with ``share_with`` first, so an eager backend
+        predicts from the shared tensors too.
+        """
+        self._share_weights()
+        self.quantization = "none"
+        self.compiled = False
+        self.backend_bytes = 0
+        config = getattr(self, "config", None) or {}
+        
+        if backend_name(config) == "onnxruntime":
+            onnx_path = onnx_model_path(weights_path)
+            if not onnx_is_current(onnx_path, weights_path):
+                print(f"⚠ {self.model_name}: no ONNX export, using PyTorch (run scripts/export_onnx.py)")
+            elif self.device.type != 'cpu':
+                print(f"⚠ {self.model_name}: ONNX Runtime backend is CPU-only, using PyTorch")
+            else:
+                try:
+                    self.inference_model = OnnxRuntimeBackend(onnx_path)
+                    self.backend_bytes = os.path.getsize(onnx_path)
+                    self._warn_unshared_backend()
+                    return
+                except Exception as e:
+                    print(f"⚠ {self.model_name}: ONNX Runtime unavailable, using PyTorch: {e}")
+        
+        self.inference_model = TorchBackend(self._torch_inference_model(weights_path, config))
+        self._warn_unshared_backend()
+    
+    def _share_weights(self) -> None:
+        """Point the eager model's tensors at identical ones of share_with."""
+        if self.share_with:
+            self.shared_bytes = share_identical_tensors(self.model, self.share_with)
+            self.share_with = []
+            if self.shared_bytes:
+                print(f"✓ {self.model_name}: sharing {self.shared_bytes / 1024 / 1024:.1f} MB with other models")
+    
+    def _warn_unshared_backend(self) -> None:
+        """
+        Say so when predictions run on a separate copy of the weights.
+        
+        Compiled, static int8 and ONNX backends hold their own copy of every
+        weight, which cannot be shared; only the eager model used for
+        Grad-CAM is. Dynamic int8 reuses the eager backbone and only copies
+        the quantized head.
+        """
+        if not self.shared_bytes or not self.backend_bytes:
+            return
+        print(
+            f"⚠ {self.model_name}: shared tensors only cover the Grad-CAM model; "
+            f"predictions use an unshared {self.backend_tag} copy "
+            f"({self.backend_bytes / 1024 / 1024:.1f} MB)"
+        )
+    
+    def _torch_inference_model(self, weights_path: str, config: Dict[str, Any]) -> torch.nn.Module:
+        """Int8, compiled or eager module for the PyTorch backend."""
+        mode = quantization_mode(config)
+        if mode != "none" and self.device.type != 'cpu':
+            print(f"⚠ {self.model_name}: int8 quantization is CPU-only, using fp32")
+        elif mode == "dynamic":
+            self.quantization = mode
+            quantized = quantize_dynamic(self.model)
+            self.backend_bytes = module_bytes(quantized, exclude=self.model)
+            return quantized
+        elif mode == "static":
+            quantized = load_quantized(quantized_model_path(weights_path), self.weights_hash)
+            if quantized is not None:
+                self.quantization = mode
+                self.backend_bytes = module_bytes(quantized)
+                return quantized
+            print(
+                f"⚠ {self.model_name}: no calibrated int8 model, using fp32 "
+                f"(run scripts/calibrate_quantization.py)"
+            )
+        
+        if compile_enabled():
+            compiled = self._compiled_model(weights_path)
+            if compiled is not None:
+                self.compiled = True
+                return compiled
+        
+        return self.model
+    
+    def _compiled_model(self, weights_path: str) -> Optional[torch.nn.Module]:
+        """Load the cached compiled graph, compiling and caching it on first use."""
+        path = compiled_model_path(weights_path)
+        tags = {
+            "source_sha256": self.weights_hash,
+            "torch": torch.__version__,
+            "device": self.device.type
+        }
+        
+        module = load_script_module(path, tags, device=self.device)
+        if module is None:
+            try:
+                example = torch.zeros(1, 3, self.image_size, self.image_size, device=self.device)
+                module = compile_model(self.model, example)
+            except Exception as e:
+                print(f"⚠ {self.model_name}: compilation failed, using eager mode: {e}")
+                return None
+            try:
+                save_script_module(module, path, tags)
+            except (OSError, RuntimeError) as e:
+                print(f"⚠ {self.model_name}: could not cache compiled model: {e}")
+        
+        # Frozen graphs inline their own copy of the weights
+        self.backend_bytes = module_bytes(module)
+        return optimize_for_inference(module)
+    
+    def predict_batch(self, images: List[bytes]) -> List[Any]:
+        """
+        Run prediction on several images with a single forward pass.
+        
+        Args:
+            images: List of raw image bytes
+            
+        Returns:
+            One entry per image: the same dictionary ``predict`` returns, or
+            the exception raised while decoding that image. A bad upload only
+            fails its own slot, not the whole batch.
+        """
+        results, input_tensor, indices = self._preprocess_batch(images)
+        if input_tensor is None:
+            return results
+        
+        with torch.no_grad():
+            outputs = self.inference_model(input_tensor)
+            probabilities = torch.softmax(outputs, dim=1)
+        
+        for i, probs in zip(indices, probabilities):
+            results[i] = self._format_prediction(probs)
+        
+        return results
+    
+    def predict_tensor(self, input_tensor: torch.Tensor) -> Dict[str, Any]:
+        """
+        Run prediction on an already preprocessed (1, 3, H, W) input.
+        
+        The input is only read, so one tensor can be shared by several models
+        with the same preprocessing (see preprocess_shared).
+        """
+        with torch.no_grad():
+            outputs = self.inference_model(input_tensor)
+            probabilities = torch.softmax(outputs, dim=1)
+        return self._format_prediction(probabilities[0])
+    
+    def get_gradcam_batch(
+        self,
+        images: List[bytes],
+        target_classes: Optional[List[Optional[int]]] = None,
+        output_type: str = "all",
+        encoding: Optional[ImageEncoding] = None
+    ) -> List[Any]:
+        """
+        Generate Grad-CAM visualizations for several images at once.
+        
+        All images share one forward and one backward pass.
+        
+        Args:
+            images: List of raw image bytes
+            target_classes: Class index per image (None = predicted class)
+            output_type: "heatmap", "overlay", or "all"
+            encoding: Image format and compression (default ImageEncoding())
+            
+        Returns:
+            One entry per image: the same dictionary ``get_gradcam`` returns,
+            or the exception raised while decoding that image
+        """
+        results, input_tensor, indices = self._preprocess_batch(images)
+        if input_tensor is None:
+            return results
+        
+        if target_classes is None:
+            target_classes = [None] * len(images)
+        targets = [target_classes[i] for i in indices]
+        
+        heatmaps, outputs = self.gradcam_visualizer.gradcam.generate_batch(
+            input_tensor,
+            targets
+        )
+        probabilities = torch.softmax(outputs, dim=1)
+        visualizations = self.gradcam_visualizer.render_batch(
+            input_tensor,
+            heatmaps,
+            output_type=output_type
+        )
+        
+        for i, probs, target, images_dict in zip(indices, probabilities, targets, visualizations):
+            if target is None:
+                target = probs.argmax().item()
+            results[i] = {
+                **self._format_prediction(probs),
+                **self._format_visualization(target, images_dict, encoding)
+            }
+        
+        return results
+    
+    def get_gradcam_classes(
+        self,
+        image_bytes: bytes,
+        target_classes: Optional[List[int]] = None,
+        output_type: str = "overlay",
+        encoding: Optional[ImageEncoding] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate Grad-CAM visualizations of several classes for one image.
+        
+        Uses one forward pass and one vectorized backward pass for all
+        classes, e.g. to compare what the model looks at for each diagnosis.
+        
+        Args:
+            image_bytes: Raw image bytes
+            target_classes: Class indices to visualize (None = all classes)
+            output_type: "heatmap", "overlay", or "all"
+            encoding: Image format and compression (default ImageEncoding())
+            
+        Returns:
+            Prediction info plus one visualization entry per class
+        """
+        if target_classes is None:
+            target_classes = list(range(len(self.class_names)))
+        
+        input_tensor = self.preprocessor(image_bytes)
+        
+        heatmaps, outputs = self.gradcam_visualizer.gradcam.generate_for_classes(
+            input_tensor,
+            target_classes
+        )
+        probabilities = torch.softmax(outputs, dim=1)
+        visualizations = self.gradcam_visualizer.render_batch(
+            input_tensor,
+            heatmaps,
+            output_type=output_type
+        )
+        
+        return {
+            **self._format_prediction(probabilities[0]),
+            "visualizations": [
+                self._format_visualization(target, images_dict, encoding)
+                for target, images_dict in zip(target_classes, visualizations)
+            ]
+        }
+    
+    def _preprocess_batch(self, images: List[bytes]) -> Tuple[List[Any], Optional[torch.Tensor], List[int]]:
+        """
+        Decode and preprocess each image, recording failures per slot.
+        
+        Returns:
+            Results list (exceptions filled in for failed images), the input
+            batch of the images that decoded (a reused buffer, see
+            ImagePreprocessor.batch; None if none decoded), and their indices
+        """
+        results: List[Any] = [None] * len(images)
+        pixels = []
+        indices = []
+        
+        for i, image_bytes in enumerate(images):
+            try:
+                pixels.append(self.preprocessor.load(image_bytes))
+                indices.append(i)
+            except Exception as e:
+                results[i] = e
+        
+        if not pixels:
+            return results, None, indices
+        return results, self.preprocessor.batch(pixels), indices
+    
+    def _format_visualization(
+        self,
+        target_class: int,
+        visualizations: Dict[str, Image.Image],
+        encoding: Optional[ImageEncoding] = None
+    ) -> Dict[str, Any]:
+        """Build the visualization part of a Grad-CAM response."""
+        encoding = encoding or ImageEncoding()
+        return {
+            "visualized_class": self.class_names[target_class],
+            "visualized_class_index": target_class,
+            "images": encode_images(visualizations, encoding),
+            "image_media_type": encoding.media_type
+        }
+    
+    def _format_prediction(self, probabilities: torch.Tensor) -> Dict[str, Any]:
+        """Build the prediction response from one row of class probabilities."""
+        confidence, predicted = probabilities.max(0)
+        probs_dict = {
+            name: float(prob)
+            for name, prob in zip(self.class_names, probabilities.tolist())
+        }
+        
+        return {
+            "model": self.model_name,
+            "prediction": self.class_names[predicted.item()],
+            "confidence": float(confidence.item()),
+            "probabilities": probs_dict
+        }
+    
+    @property
+    def backend_tag(self) -> str:
+        """
+        What produces plain predictions, e.g. "torch:dynamic:eager:cpu".
+        
+        Backends can differ numerically, so cached predictions are keyed on
+        this (see also the fallbacks in _setup_inference_model).
+        """
+        backend = self.inference_model.name if self.inference_model else "none"
+        mode = "compiled" if self.compiled else "eager"
+        return f"{backend}:{self.quantization}:{mode}:{self.device.type}"
+    
     def get_model_info(self) -> Dict[str, Any]:
         """Return model metadata."""
         return {
             "model_name": self.model_name,
             "classes": self.class_names,
             "num_classes": len(self.class_names),
-            "device": str(self.device)
+            "device": str(self.device),
+            "backend": self.inference_model.name if self.inference_model else None,
+            "quantization": self.quantization,
+            "compiled": self.compiled
         }
 
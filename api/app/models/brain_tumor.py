@@ -5,14 +5,16 @@ Multi-class classification: glioma, meningioma, pituitary, notumor
 
 import torch
 import torch.nn as nn
-from torchvision import transforms, models
+from torchvision import models
 from PIL import Image
 import json
-import io
 from typing import Dict, Any, Optional
 
 from .base import BaseClassifier
-from ..utils.gradcam import GradCAMVisualizer, image_to_base64
+from ..utils.encoding import ImageEncoding, encode_images
+from ..utils.gradcam import GradCAMVisualizer
+from ..utils.preprocessing import ImagePreprocessor
+from .weights import weights_file_hash
 
 
 class BrainTumorClassifier(BaseClassifier):
@@ -27,7 +29,7 @@ class BrainTumorClassifier(BaseClassifier):
         self.image_size = 224
         self.mean = [0.485, 0.456, 0.406]
         self.std = [0.229, 0.224, 0.225]
-        self.transform = None
+        self.preprocessor = None
         self.config = None
     
     def _build_model(self, num_classes: int) -> nn.Module:
@@ -61,19 +63,14 @@ class BrainTumorClassifier(BaseClassifier):
         self.std = self.config['normalization']['std']
         
         # Build and load model
-        self.model = self._build_model(len(self.class_names))
-        self.model.load_state_dict(
-            torch.load(weights_path, map_location=self.device, weights_only=True)
-        )
+        self.model = self._build_empty_model(len(self.class_names))
+        self._load_weights(weights_path)
         self.model.to(self.device)
         self.model.eval()
+        self.weights_hash = weights_file_hash(weights_path)
         
-        # Setup transforms
-        self.transform = transforms.Compose([
-            transforms.Resize((self.image_size, self.image_size)),
-            transforms.ToTensor(),
-            transforms.Normalize(self.mean, self.std)
-        ])
+        # Setup preprocessing
+        self.preprocessor = ImagePreprocessor(self.image_size, self.mean, self.std, self.device)
         
         # Setup Grad-CAM visualizer (target: last conv layer)
         target_layer = self.model.features[-1]
@@ -85,14 +82,13 @@ class BrainTumorClassifier(BaseClassifier):
             std=self.std
         )
         
+        self._setup_inference_model(weights_path)
+        
         print(f"✓ Brain tumor model loaded on {self.device}")
     
     def preprocess(self, image: Image.Image) -> torch.Tensor:
         """Preprocess PIL Image for model input."""
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        tensor = self.transform(image)
-        return tensor.unsqueeze(0).to(self.device)
+        return self.preprocessor(image)
     
     def predict(self, image_bytes: bytes) -> Dict[str, Any]:
         """
@@ -105,12 +101,11 @@ class BrainTumorClassifier(BaseClassifier):
             Prediction results with confidence scores
         """
         # Load and preprocess image
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        input_tensor = self.preprocess(image)
+        input_tensor = self.preprocessor(image_bytes)
         
         # Inference
         with torch.no_grad():
-            outputs = self.model(input_tensor)
+            outputs = self.inference_model(input_tensor)
             probabilities = torch.softmax(outputs, dim=1)
             confidence, predicted = probabilities.max(1)
         
@@ -131,7 +126,8 @@ class BrainTumorClassifier(BaseClassifier):
         self, 
         image_bytes: bytes, 
         target_class: Optional[int] = None,
-        output_type: str = "all"
+        output_type: str = "all",
+        encoding: Optional[ImageEncoding] = None
     ) -> Dict[str, Any]:
         """
         Generate Grad-CAM visualization.
@@ -140,37 +136,37 @@ class BrainTumorClassifier(BaseClassifier):
             image_bytes: Raw image bytes
             target_class: Class index to visualize (None = predicted class)
             output_type: "heatmap", "overlay", or "all"
+            encoding: Image format and compression (default ImageEncoding())
             
         Returns:
             Dictionary with prediction info and base64-encoded visualizations
         """
         # Load and preprocess image
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        input_tensor = self.preprocess(image)
+        input_tensor = self.preprocessor(image_bytes)
         
-        # Get prediction first
-        with torch.no_grad():
-            outputs = self.model(input_tensor)
-            probabilities = torch.softmax(outputs, dim=1)
-            confidence, predicted = probabilities.max(1)
+        # Get prediction and Grad-CAM from a single forward pass with
+        # gradients enabled: the logits and the backward pass share one graph
+        heatmap, outputs = self.gradcam_visualizer.gradcam.generate_with_logits(
+            input_tensor,
+            target_class=target_class
+        )
+        probabilities = torch.softmax(outputs, dim=1)
+        confidence, predicted = probabilities.max(1)
         
         # Use predicted class if not specified
         if target_class is None:
             target_class = predicted.item()
         
-        # Generate Grad-CAM visualizations
-        # Need to enable gradients for Grad-CAM
-        input_tensor.requires_grad_(True)
-        visualizations = self.gradcam_visualizer.generate_visualization(
+        # Render Grad-CAM visualizations
+        visualizations = self.gradcam_visualizer.render(
             input_tensor,
-            target_class=target_class,
+            heatmap,
             output_type=output_type
         )
         
-        # Convert images to base64
-        images_b64 = {}
-        for name, img in visualizations.items():
-            images_b64[name] = image_to_base64(img)
+        # Encode images (in parallel)
+        encoding = encoding or ImageEncoding()
+        images = encode_images(visualizations, encoding)
         
         # Build response
         probs_dict = {
@@ -185,7 +181,8 @@ class BrainTumorClassifier(BaseClassifier):
             "probabilities": probs_dict,
             "visualized_class": self.class_names[target_class],
             "visualized_class_index": target_class,
-            "images": images_b64
+            "images": images,
+            "image_media_type": encoding.media_type
         }
     
     def predict_with_gradcam(
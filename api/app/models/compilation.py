@@ -0,0 +1,88 @@
+"""
+Graph Compilation
+Frozen TorchScript graphs for the no-grad prediction path.
+
+With COMPILE_MODELS=1 each classifier is traced once, frozen (which inlines
+the weights and folds BatchNorm into the preceding convolutions) and cached
+next to its weights as <name>_model.ts.pt, so later starts only load the
+graph. Eager mode remains the fallback and is always used for Grad-CAM.
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+import torch
+import torch.nn as nn
+
+
+COMPILED_SUFFIX = ".ts.pt"
+_INFO_FILE = "medlens.json"
+
+
+def compile_enabled() -> bool:
+    """Whether predictions should use compiled graphs (COMPILE_MODELS=1)."""
+    return os.getenv("COMPILE_MODELS", "0") == "1"
+
+
+def compiled_model_path(weights_path: str) -> str:
+    """Where the compiled graph for weights_path is cached."""
+    return os.path.splitext(weights_path)[0] + COMPILED_SUFFIX
+
+
+def compile_model(model: nn.Module, example_input: torch.Tensor) -> torch.jit.ScriptModule:
+    """Trace and freeze an eval-mode model."""
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example_input)
+    return torch.jit.freeze(traced)
+
+
+def optimize_for_inference(module: torch.jit.ScriptModule) -> torch.jit.ScriptModule:
+    """
+    Apply backend-specific graph rewrites (e.g. MKLDNN layouts).
+
+    These results cannot be serialized, so they are applied after loading
+    rather than cached. Returns the module unchanged if the rewrite fails.
+    """
+    try:
+        return torch.jit.optimize_for_inference(module)
+    except Exception as e:
+        print(f"⚠ optimize_for_inference failed, using the frozen graph: {e}")
+        return module
+
+
+def save_script_module(module: torch.jit.ScriptModule, path: str, info: Dict[str, str]) -> None:
+    """Save a TorchScript module tagged with info (checked by load_script_module)."""
+    tmp_path = f"{path}.tmp"
+    torch.jit.save(module, tmp_path, _extra_files={_INFO_FILE: json.dumps(info)})
+    os.replace(tmp_path, path)
+
+
+def load_script_module(
+    path: str,
+    expected: Dict[str, str],
+    device: Optional[torch.device] = None
+) -> Optional[torch.jit.ScriptModule]:
+    """
+    Load a cached TorchScript module.
+
+    Returns:
+        The module, or None if there is no cache or any tag in expected
+        differs (e.g. it was built from other weights)
+    """
+    if not os.path.exists(path):
+        return None
+
+    extra_files = {_INFO_FILE: ""}
+    try:
+        module = torch.jit.load(path, map_location=device or "cpu", _extra_files=extra_files)
+        info = json.loads(extra_files[_INFO_FILE] or "{}")
+    except (RuntimeError, ValueError) as e:
+        print(f"⚠ Could not load {os.path.basename(path)}: {e}")
+        return None
+
+    for key, value in expected.items():
+        if info.get(key) != value:
+            print(f"⚠ {os.path.basename(path)} has a different {key}, ignoring it")
+            return None
+    return module
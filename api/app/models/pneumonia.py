@@ -5,14 +5,16 @@ Binary classification: NORMAL vs PNEUMONIA from chest X-rays
 
 import torch
 import torch.nn as nn
-from torchvision import transforms, models
+from torchvision import models
 from PIL import Image
 import json
-import io
 from typing import Dict, Any, Optional
 
 from .base import BaseClassifier
-from ..utils.gradcam import GradCAMVisualizer, image_to_base64
+from ..utils.encoding import ImageEncoding, encode_images
+from ..utils.gradcam import GradCAMVisualizer
+from ..utils.preprocessing import ImagePreprocessor
+from .weights import weights_file_hash
 
 
 class PneumoniaClassifier(BaseClassifier):
@@ -27,7 +29,7 @@ class PneumoniaClassifier(BaseClassifier):
         self.image_size = 224
         self.mean = [0.485, 0.456, 0.406]
         self.std = [0.229, 0.224, 0.225]
-        self.transform = None
+        self.preprocessor = None
         self.config = None
 
     def _build_model(self, num_classes: int) -> nn.Module:
@@ -59,18 +61,13 @@ class PneumoniaClassifier(BaseClassifier):
         self.mean = self.config['normalization']['mean']
         self.std = self.config['normalization']['std']
 
-        self.model = self._build_model(len(self.class_names))
-        self.model.load_state_dict(
-            torch.load(weights_path, map_location=self.device, weights_only=True)
-        )
+        self.model = self._build_empty_model(len(self.class_names))
+        self._load_weights(weights_path)
         self.model.to(self.device)
         self.model.eval()
+        self.weights_hash = weights_file_hash(weights_path)
 
-        self.transform = transforms.Compose([
-            transforms.Resize((self.image_size, self.image_size)),
-            transforms.ToTensor(),
-            transforms.Normalize(self.mean, self.std)
-        ])
+        self.preprocessor = ImagePreprocessor(self.image_size, self.mean, self.std, self.device)
 
         target_layer = self.model.features[-1]
         self.gradcam_visualizer = GradCAMVisualizer(
@@ -81,14 +78,13 @@ class PneumoniaClassifier(BaseClassifier):
             std=self.std
         )
 
+        self._setup_inference_model(weights_path)
+
         print(f"✓ Pneumonia model loaded on {self.device}")
 
     def preprocess(self, image: Image.Image) -> torch.Tensor:
         """Preprocess PIL Image for model input."""
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        tensor = self.transform(image)
-        return tensor.unsqueeze(0).to(self.device)
+        return self.preprocessor(image)
 
     def predict(self, image_bytes: bytes) -> Dict[str, Any]:
         """
@@ -100,11 +96,10 @@ class PneumoniaClassifier(BaseClassifier):
         Returns:
             Prediction results with confidence scores
         """
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        input_tensor = self.preprocess(image)
+        input_tensor = self.preprocessor(image_bytes)
 
         with torch.no_grad():
-            outputs = self.model(input_tensor)
+            outputs = self.inference_model(input_tensor)
             probabilities = torch.softmax(outputs, dim=1)
             confidence, predicted = probabilities.max(1)
 
@@ -124,7 +119,8 @@ class PneumoniaClassifier(BaseClassifier):
         self,
         image_bytes: bytes,
         target_class: Optional[int] = None,
-        output_type: str = "all"
+        output_type: str = "all",
+        encoding: Optional[ImageEncoding] = None
     ) -> Dict[str, Any]:
         """
         Generate Grad-CAM visualization.
@@ -133,31 +129,33 @@ class PneumoniaClassifier(BaseClassifier):
             image_bytes: Raw image bytes
             target_class: Class index to visualize (None = predicted class)
             output_type: "heatmap", "overlay", or "all"
+            encoding: Image format and compression (default ImageEncoding())
 
         Returns:
             Dictionary with prediction info and base64-encoded visualizations
         """
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        input_tensor = self.preprocess(image)
+        input_tensor = self.preprocessor(image_bytes)
 
-        with torch.no_grad():
-            outputs = self.model(input_tensor)
-            probabilities = torch.softmax(outputs, dim=1)
-            confidence, predicted = probabilities.max(1)
+        # Single forward pass with gradients: the logits and the Grad-CAM
+        # backward pass share one graph
+        heatmap, outputs = self.gradcam_visualizer.gradcam.generate_with_logits(
+            input_tensor,
+            target_class=target_class
+        )
+        probabilities = torch.softmax(outputs, dim=1)
+        confidence, predicted = probabilities.max(1)
 
         if target_class is None:
             target_class = predicted.item()
 
-        input_tensor.requires_grad_(True)
-        visualizations = self.gradcam_visualizer.generate_visualization(
+        visualizations = self.gradcam_visualizer.render(
             input_tensor,
-            target_class=target_class,
+            heatmap,
             output_type=output_type
         )
 
-        images_b64 = {}
-        for name, img in visualizations.items():
-            images_b64[name] = image_to_base64(img)
+        encoding = encoding or ImageEncoding()
+        images = encode_images(visualizations, encoding)
 
         probs_dict = {
             name: float(prob)
@@ -171,5 +169,6 @@ class PneumoniaClassifier(BaseClassifier):
             "probabilities": probs_dict,
             "visualized_class": self.class_names[target_class],
             "visualized_class_index": target_class,
-            "images": images_b64
+            "images": images,
+            "image_media_type": encoding.media_type
         }
\ No newline at end of file
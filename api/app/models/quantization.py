@@ -0,0 +1,133 @@
+"""
+Int8 Quantization
+Builds and caches int8 versions of the classifiers for CPU inference.
+
+Modes (the "quantization" key of a model's *_config.json):
+- "none": fp32 (default)
+- "dynamic": Linear layers of the classifier head quantized on the fly at load
+- "static": FX static quantization of the conv backbone plus a dynamic head.
+  Needs calibration data, so it is produced offline by
+  scripts/calibrate_quantization.py and cached as TorchScript next to the
+  weights (<name>_model.int8.pt).
+
+Quantized models cannot be differentiated, so Grad-CAM always uses fp32.
+"""
+
+import copy
+import os
+from typing import Any, Dict, Iterable, Optional
+
+import torch
+import torch.nn as nn
+
+from .compilation import load_script_module, save_script_module
+
+
+QUANTIZATION_MODES = ["none", "dynamic", "static"]
+QUANTIZED_SUFFIX = ".int8.pt"
+
+
+def quantization_mode(config: Dict[str, Any]) -> str:
+    """Quantization mode requested by a model config."""
+    mode = config.get("quantization", "none") or "none"
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"quantization must be one of {QUANTIZATION_MODES}, got '{mode}'")
+    return mode
+
+
+def quantized_model_path(weights_path: str) -> str:
+    """Where the static int8 model for weights_path is cached."""
+    return os.path.splitext(weights_path)[0] + QUANTIZED_SUFFIX
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    """
+    Return a copy of model with int8 dynamically quantized Linear layers.
+
+    Only the modules on the path to a Linear layer are copied; every other
+    submodule (the conv backbone) is the very module of model, so its
+    tensors stay shared (and memory-mapped) rather than duplicated.
+    """
+    if type(model) is nn.Linear:
+        wrapper = torch.ao.quantization.quantize_dynamic(
+            nn.Sequential(model),
+            {nn.Linear},
+            dtype=torch.qint8
+        )
+        return wrapper[0]
+    if not any(type(module) is nn.Linear for module in model.modules()):
+        return model
+
+    quantized = copy.copy(model)
+    quantized._modules = {
+        name: quantize_dynamic(child) if child is not None else None
+        for name, child in model._modules.items()
+    }
+    return quantized
+
+
+def quantize_static(
+    model: nn.Module,
+    calibration_batches: Iterable[torch.Tensor],
+    head_name: str = "classifier"
+) -> torch.jit.ScriptModule:
+    """
+    Statically quantize the conv backbone and dynamically quantize the head.
+
+    Args:
+        model: fp32 model in eval mode (left unchanged)
+        calibration_batches: Preprocessed input batches used to observe
+            activation ranges; a few dozen representative images are enough
+        head_name: Submodule quantized dynamically instead of statically
+
+    Returns:
+        Frozen TorchScript module
+    """
+    from torch.ao.quantization import QConfigMapping, default_dynamic_qconfig, get_default_qconfig
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    batches = iter(calibration_batches)
+    first = next(batches)
+
+    backend = torch.backends.quantized.engine
+    qconfig_mapping = (
+        QConfigMapping()
+        .set_global(get_default_qconfig(backend))
+        .set_module_name(head_name, default_dynamic_qconfig)
+    )
+
+    prepared = prepare_fx(copy.deepcopy(model).eval(), qconfig_mapping, (first,))
+    with torch.no_grad():
+        prepared(first)
+        for batch in batches:
+            prepared(batch)
+    quantized = convert_fx(prepared)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, first[:1])
+    return torch.jit.freeze(traced.eval())
+
+
+def quantization_tags(source_hash: str) -> Dict[str, str]:
+    """What a cached int8 model must match to be reused."""
+    return {
+        "source_sha256": source_hash,
+        "engine": torch.backends.quantized.engine,
+        "torch": torch.__version__
+    }
+
+
+def save_quantized(module: torch.jit.ScriptModule, path: str, source_hash: str) -> None:
+    """Save a quantized TorchScript module, tagged with its fp32 weights' hash."""
+    save_script_module(module, path, quantization_tags(source_hash))
+
+
+def load_quantized(path: str, source_hash: str) -> Optional[torch.jit.ScriptModule]:
+    """
+    Load a cached quantized module.
+
+    Returns:
+        The module, or None if there is no cache or it was built from
+        different weights, for a different quantized engine or torch version
+    """
+    return load_script_module(path, quantization_tags(source_hash))
@@ -0,0 +1,276 @@
+"""
+Model Registry
+Loads classifiers on first use and keeps them within a memory budget.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from .base import BaseClassifier
+from .sharing import process_rss
+from .weights import weights_exist, weights_file_hash
+
+
+class ModelSpec:
+    """Where to find one model's files and which classifier loads them."""
+
+    def __init__(self, name: str, classifier_cls: Type[BaseClassifier], label: str):
+        self.name = name
+        self.classifier_cls = classifier_cls
+        self.label = label
+
+    def weights_path(self, weights_dir: str) -> str:
+        return os.path.join(weights_dir, f"{self.name}_model.pth")
+
+    def config_path(self, weights_dir: str) -> str:
+        return os.path.join(weights_dir, f"{self.name}_config.json")
+
+
+def _model_bytes(classifiers: Iterable[BaseClassifier]) -> int:
+    """
+    Total size of the tensors held by classifiers, counting shared tensors once.
+
+    Compiled, int8 and ONNX backends hold a separate copy of the weights,
+    which is added per classifier (see BaseClassifier.backend_bytes).
+    """
+    storages = {}
+    backends = 0
+    for classifier in classifiers:
+        for tensor in list(classifier.model.parameters()) + list(classifier.model.buffers()):
+            storages[tensor.data_ptr()] = tensor.numel() * tensor.element_size()
+        backends += classifier.backend_bytes
+    return sum(storages.values()) + backends
+
+
+class ModelRegistry:
+    """
+    Lazily loaded set of classifiers.
+
+    A model is registered up front but only built and loaded the first time
+    ``get`` asks for it. Loaded models are kept in least-recently-used order;
+    once their combined size exceeds ``memory_budget`` the least recently used
+    ones are unloaded again (the model being requested is never evicted).
+    Requests already holding an evicted classifier finish normally.
+    """
+
+    def __init__(
+        self,
+        weights_dir: str,
+        memory_budget: int = 0,
+        share_backbone: bool = False
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            weights_dir: Directory holding <name>_model.pth and <name>_config.json
+            memory_budget: Bytes of model tensors to keep loaded (0 = unlimited)
+            share_backbone: Share tensors identical to an already loaded model's
+        """
+        self.weights_dir = weights_dir
+        self.memory_budget = memory_budget
+        self.share_backbone = share_backbone
+
+        self._specs: Dict[str, ModelSpec] = {}
+        self._loaded: "OrderedDict[str, BaseClassifier]" = OrderedDict()
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._weights_hashes: Dict[str, str] = {}
+        self._backend_tags: Dict[str, str] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.RLock()
+
+        self.loads: Dict[str, int] = {}
+        self.evictions: Dict[str, int] = {}
+        self.load_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, classifier_cls: Type[BaseClassifier], label: str) -> None:
+        """Register a model without loading it."""
+        self._specs[name] = ModelSpec(name, classifier_cls, label)
+        self._load_locks[name] = threading.Lock()
+        self.loads[name] = 0
+        self.evictions[name] = 0
+
+    @property
+    def available(self) -> List[str]:
+        """Registered models whose weights and config exist on disk."""
+        return [
+            name for name, spec in self._specs.items()
+            if weights_exist(spec.weights_path(self.weights_dir))
+            and os.path.exists(spec.config_path(self.weights_dir))
+        ]
+
+    @property
+    def loaded(self) -> List[str]:
+        """Currently loaded models, least recently used first."""
+        with self._lock:
+            return list(self._loaded.keys())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.available
+
+    def get(self, name: str) -> BaseClassifier:
+        """
+        Return the classifier for name, loading it if needed.
+
+        Blocking; call from a worker thread. Concurrent calls for the same
+        model wait for a single load.
+
+        Raises:
+            KeyError: If the model is not available
+        """
+        with self._lock:
+            classifier = self._loaded.get(name)
+            if classifier is not None:
+                self._loaded.move_to_end(name)
+                return classifier
+
+        if name not in self:
+            raise KeyError(f"Model '{name}' not found. Available: {self.available}")
+
+        with self._load_locks[name]:
+            with self._lock:
+                classifier = self._loaded.get(name)
+                if classifier is not None:
+                    self._loaded.move_to_end(name)
+                    return classifier
+
+            classifier = self._load(name)
+
+            with self._lock:
+                self._loaded[name] = classifier
+                self._evict(keep=name)
+        return classifier
+
+    def get_loaded(self, name: str) -> Optional[BaseClassifier]:
+        """Return the classifier for name if it is loaded, without loading it."""
+        with self._lock:
+            return self._loaded.get(name)
+
+    def preload(self, names: Iterable[str]) -> None:
+        """Load each of names now, logging (not raising) failures."""
+        for name in names:
+            if name not in self:
+                print(f"✗ {name} model files not found in {self.weights_dir}")
+                continue
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"✗ Failed to load {self._specs[name].label} model: {e}")
+
+    def warm_metadata(self) -> None:
+        """
+        Read every available model's config and hash its weights.
+
+        Blocking; call at startup. Afterwards ``config`` and ``weights_hash``
+        are dictionary lookups, cheap enough for the request path.
+        """
+        for name in self.available:
+            try:
+                self.config(name)
+                self.weights_hash(name)
+            except (OSError, ValueError) as e:
+                print(f"⚠ {name}: could not read model metadata: {e}")
+
+    def unload(self, name: str) -> bool:
+        """Drop a loaded model. Returns whether it was loaded."""
+        with self._lock:
+            classifier = self._loaded.pop(name, None)
+        if classifier is None:
+            return False
+        self.evictions[name] += 1
+        return True
+
+    def config(self, name: str) -> Dict[str, Any]:
+        """Model config (class names etc.), read without loading the model."""
+        config = self._configs.get(name)
+        if config is None:
+            with open(self._specs[name].config_path(self.weights_dir), 'r') as f:
+                config = json.load(f)
+            self._configs[name] = config
+        return config
+
+    def class_names(self, name: str) -> List[str]:
+        classifier = self.get_loaded(name)
+        if classifier is not None:
+            return classifier.class_names
+        return self.config(name)['class_names']
+
+    def weights_hash(self, name: str) -> str:
+        """
+        Hash of the model's weights file, computed once per process.
+
+        Blocking on first use (see warm_metadata).
+        """
+        weights_hash = self._weights_hashes.get(name)
+        if weights_hash is None:
+            weights_hash = weights_file_hash(self._specs[name].weights_path(self.weights_dir))
+            self._weights_hashes[name] = weights_hash
+        return weights_hash
+
+    def backend_tag(self, name: str) -> Optional[str]:
+        """
+        Backend tag of the model as last loaded (see BaseClassifier.backend_tag).
+
+        Kept after eviction and never loads the model, so it is cheap enough
+        for the request path; None until the model has been loaded once.
+        """
+        return self._backend_tags.get(name)
+
+    def memory_bytes(self) -> int:
+        """Combined size of the loaded models' tensors."""
+        with self._lock:
+            return _model_bytes(self._loaded.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return per-model load state for health reporting."""
+        loaded = self.loaded
+        return {
+            "memory_bytes": self.memory_bytes(),
+            "memory_budget_bytes": self.memory_budget,
+            "models": {
+                name: {
+                    "loaded": name in loaded,
+                    "loads": self.loads[name],
+                    "evictions": self.evictions[name],
+                    "load_seconds": self.load_seconds.get(name)
+                }
+                for name in self.available
+            }
+        }
+
+    def _load(self, name: str) -> BaseClassifier:
+        spec = self._specs[name]
+        start = time.perf_counter()
+
+        classifier = spec.classifier_cls()
+        if self.share_backbone:
+            # Shared before the inference backend is built (see
+            # BaseClassifier._setup_inference_model)
+            with self._lock:
+                classifier.share_with = [other.model for other in self._loaded.values()]
+        classifier.load_model(
+            spec.weights_path(self.weights_dir),
+            spec.config_path(self.weights_dir)
+        )
+        self._weights_hashes[name] = classifier.weights_hash
+        self._backend_tags[name] = classifier.backend_tag
+
+        self.loads[name] += 1
+        self.load_seconds[name] = round(time.perf_counter() - start, 3)
+        rss = process_rss()
+        rss_info = f", process RSS {rss / 1024 / 1024:.0f} MB" if rss is not None else ""
+        print(f"✓ {name}: load took {self.load_seconds[name]:.2f}s{rss_info}")
+        return classifier
+
+    def _evict(self, keep: str) -> None:
+        """Unload least recently used models until within budget. Caller holds the lock."""
+        if self.memory_budget <= 0:
+            return
+        while len(self._loaded) > 1 and _model_bytes(self._loaded.values()) > self.memory_budget:
+            victim = next(name for name in self._loaded if name != keep)
+            self.unload(victim)
+            print(f"✓ Unloaded {self._specs[victim].label} model (memory budget)")
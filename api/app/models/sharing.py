@@ -0,0 +1,198 @@
+"""
+Parameter Sharing
+Deduplicates identical tensors across loaded classifiers and reports their memory.
+"""
+
+import hashlib
+import os
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+
+def _named_tensors(model: nn.Module) -> Iterator[Tuple[str, nn.Module, str, torch.Tensor, bool]]:
+    """Yield (qualified name, owning module, attribute, tensor, is_parameter)."""
+    for module_name, module in model.named_modules():
+        prefix = f"{module_name}." if module_name else ""
+        for attr, param in module._parameters.items():
+            if param is not None:
+                yield prefix + attr, module, attr, param, True
+        for attr, buffer in module._buffers.items():
+            if buffer is not None:
+                yield prefix + attr, module, attr, buffer, False
+
+
+def _fingerprint(tensor: torch.Tensor, samples: int = 64) -> Tuple[Any, ...]:
+    """
+    Cheap identity key: shape, dtype, device and a hash of a strided sample.
+
+    Only about ``samples`` elements are read, so fingerprinting a
+    memory-mapped tensor touches a handful of pages rather than all of them.
+    """
+    flat = tensor.detach().reshape(-1)
+    step = max(1, flat.numel() // samples)
+    sample = flat[::step][:samples].contiguous().cpu()
+    digest = hashlib.sha1(sample.view(torch.uint8).numpy().tobytes()).hexdigest()
+    return tuple(tensor.shape), tensor.dtype, tensor.device, digest
+
+
+def share_identical_tensors(model: nn.Module, others: List[nn.Module]) -> int:
+    """
+    Point model's parameters and buffers at equal tensors of other models.
+
+    Tensors are matched by name and fingerprint (see _fingerprint) and only
+    then compared in full, so layers left untouched by fine-tuning (or a
+    backbone trained once and reused) end up stored once, while layers that
+    differ keep their own copy without every page of them being read.
+
+    Args:
+        model: Newly loaded model whose tensors may be replaced
+        others: Already loaded models to share with
+
+    Returns:
+        Number of bytes no longer held separately by model
+    """
+    candidates: Dict[str, List[torch.Tensor]] = defaultdict(list)
+    for other in others:
+        for name, _, _, tensor, _ in _named_tensors(other):
+            candidates[name].append(tensor)
+
+    fingerprints: Dict[int, Tuple[Any, ...]] = {}
+
+    def fingerprint(tensor: torch.Tensor) -> Tuple[Any, ...]:
+        if id(tensor) not in fingerprints:
+            fingerprints[id(tensor)] = _fingerprint(tensor)
+        return fingerprints[id(tensor)]
+
+    saved = 0
+    with torch.no_grad():
+        for name, module, attr, tensor, is_param in list(_named_tensors(model)):
+            for candidate in candidates.get(name, []):
+                if candidate is tensor:
+                    break
+                if (
+                    candidate.shape != tensor.shape
+                    or candidate.dtype != tensor.dtype
+                    or candidate.device != tensor.device
+                    or fingerprint(candidate) != fingerprint(tensor)
+                    or not torch.equal(candidate, tensor)
+                ):
+                    continue
+
+                if is_param:
+                    module._parameters[attr] = candidate
+                else:
+                    module._buffers[attr] = candidate
+                saved += tensor.numel() * tensor.element_size()
+                break
+
+    return saved
+
+
+def module_bytes(module: nn.Module, exclude: Optional[nn.Module] = None) -> int:
+    """
+    Size of the tensors a module holds, counting each storage once.
+
+    Besides parameters and buffers this covers packed int8 weights (which
+    only appear in the state dict) and the constants a frozen TorchScript
+    graph inlines its weights into. Run it before optimize_for_inference,
+    whose prepacked weights are opaque.
+
+    Args:
+        module: Module to measure
+        exclude: Module whose tensors module reuses and should not count
+    """
+    tensors = []
+    for value in module.state_dict().values():
+        tensors.extend(value if isinstance(value, tuple) else [value])
+    if isinstance(module, torch.jit.ScriptModule):
+        for node in module.graph.findAllNodes("prim::Constant"):
+            tensors.append(node.output().toIValue())
+
+    excluded = set()
+    if exclude is not None:
+        excluded = {tensor.data_ptr() for _, _, _, tensor, _ in _named_tensors(exclude)}
+
+    storages = {}
+    for tensor in tensors:
+        if isinstance(tensor, torch.Tensor) and tensor.data_ptr() not in excluded:
+            storages[tensor.data_ptr()] = tensor.numel() * tensor.element_size()
+    return sum(storages.values())
+
+
+def process_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (Linux only)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mapped_rss(path: str) -> Optional[int]:
+    """Resident bytes of this process's memory mappings of path (Linux only)."""
+    try:
+        real_path = os.path.realpath(path)
+        rss = 0
+        in_mapping = False
+        with open("/proc/self/smaps", "r") as f:
+            for line in f:
+                fields = line.split()
+                if "-" in fields[0] and len(fields) >= 5:
+                    in_mapping = fields[-1] == real_path
+                elif in_mapping and fields[0] == "Rss:":
+                    rss += int(fields[1]) * 1024
+        return rss
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def memory_report(classifiers: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Estimate the memory each loaded classifier actually holds.
+
+    Storages shared by several models are split evenly between them.
+    For memory-mapped weights only the pages currently resident count.
+
+    Returns:
+        Per-model byte counts: total parameter size, shared part, size of
+        a separate inference backend copy, and estimated resident size
+    """
+    sharers: Dict[int, int] = defaultdict(int)
+    storages: Dict[str, Dict[int, int]] = {}
+
+    for name, classifier in classifiers.items():
+        model_storages = {}
+        for _, _, _, tensor, _ in _named_tensors(classifier.model):
+            model_storages[tensor.data_ptr()] = tensor.numel() * tensor.element_size()
+        storages[name] = model_storages
+        for ptr in model_storages:
+            sharers[ptr] += 1
+
+    report = {}
+    for name, classifier in classifiers.items():
+        model_storages = storages[name]
+        total = sum(model_storages.values())
+        shared = sum(size for ptr, size in model_storages.items() if sharers[ptr] > 1)
+        shared_resident = sum(
+            size / sharers[ptr] for ptr, size in model_storages.items() if sharers[ptr] > 1
+        )
+
+        unique_resident = total - shared
+        if getattr(classifier, "weights_mmap", False):
+            mapped = _mapped_rss(classifier.weights_path)
+            if mapped is not None:
+                unique_resident = min(unique_resident, mapped)
+        backend = getattr(classifier, "backend_bytes", 0)
+
+        report[name] = {
+            "parameter_bytes": total,
+            "shared_bytes": shared,
+            "backend_bytes": backend,
+            "resident_bytes": int(unique_resident + shared_resident + backend),
+            "memory_mapped": getattr(classifier, "weights_mmap", False)
+        }
+
+    return report
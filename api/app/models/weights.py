@@ -0,0 +1,202 @@
+"""
+Weight Loading
+Reads classifier checkpoints, memory-mapped instead of copied where possible.
+
+Besides regular .pth checkpoints, weights can be stored in a flat
+safetensors-compatible file (see scripts/convert_weights.py): an 8-byte
+header length, a JSON header giving each tensor's dtype, shape and byte
+range, then the raw tensor data. Such a file is mapped once and every
+parameter is a view into it, so nothing is deserialized or copied and
+several processes on one host share the same physical pages.
+"""
+
+import json
+import os
+import struct
+import threading
+from typing import Dict, Optional, Tuple
+
+import torch
+
+from ..utils.cache import hash_file
+
+
+FLAT_SUFFIX = ".safetensors"
+
+_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+_DTYPE_NAMES = {dtype: name for name, dtype in _DTYPES.items()}
+
+# Checkpoint hashes by (real path, size, mtime_ns), so reloading a model
+# (e.g. after an eviction) does not read the whole checkpoint again
+_hashes: Dict[Tuple[str, int, int], str] = {}
+_hashes_lock = threading.Lock()
+
+
+def mmap_enabled() -> bool:
+    """Whether checkpoints should be memory-mapped (WEIGHTS_MMAP, on by default)."""
+    return os.getenv("WEIGHTS_MMAP", "1") == "1"
+
+
+def flat_weights_path(weights_path: str) -> str:
+    """Path of the flat file converted from weights_path."""
+    return os.path.splitext(weights_path)[0] + FLAT_SUFFIX
+
+
+def resolve_weights_path(weights_path: str) -> str:
+    """
+    Prefer the flat version of a checkpoint if one exists and is up to date.
+
+    The flat file is also used when the checkpoint itself has been removed
+    (see scripts/convert_weights.py --remove-source).
+    """
+    flat_path = flat_weights_path(weights_path)
+    if weights_path == flat_path or not os.path.exists(flat_path):
+        return weights_path
+    if not os.path.exists(weights_path) or os.path.getmtime(flat_path) >= os.path.getmtime(weights_path):
+        return flat_path
+    return weights_path
+
+
+def weights_exist(weights_path: str) -> bool:
+    """Whether a checkpoint or its flat version exists."""
+    return os.path.exists(resolve_weights_path(weights_path))
+
+
+def _read_header(path: str) -> Tuple[Dict, int]:
+    """Return a flat file's JSON header and the offset where its data starts."""
+    with open(path, 'rb') as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(header_size)), 8 + header_size
+
+
+def weights_file_hash(weights_path: str) -> str:
+    """
+    SHA-256 of a .pth checkpoint.
+
+    Taken from the flat file's metadata when an up-to-date one exists, so the
+    checkpoint does not have to be read (or even be present) just to hash
+    it. Otherwise the file is hashed once per process and the digest reused
+    while its size and modification time stay the same.
+    """
+    flat_path = resolve_weights_path(weights_path)
+    if flat_path != weights_path:
+        try:
+            source_hash = _read_header(flat_path)[0].get("__metadata__", {}).get("source_sha256")
+            if source_hash:
+                return source_hash
+        except (OSError, ValueError, struct.error):
+            pass
+
+    if not os.path.exists(weights_path):
+        weights_path = flat_path  # Converted without a source hash; hash the flat file
+
+    stat = os.stat(weights_path)
+    key = (os.path.realpath(weights_path), stat.st_size, stat.st_mtime_ns)
+    with _hashes_lock:
+        digest = _hashes.get(key)
+    if digest is None:
+        digest = hash_file(weights_path)
+        with _hashes_lock:
+            _hashes[key] = digest
+    return digest
+
+
+def save_flat(
+    state_dict: Dict[str, torch.Tensor],
+    path: str,
+    metadata: Optional[Dict[str, str]] = None
+) -> None:
+    """
+    Write a state dict as a flat safetensors-compatible file.
+
+    Tensors are laid out by decreasing element size so every tensor starts at
+    an offset aligned to its dtype, which lets the loader view them in place.
+    """
+    tensors = sorted(
+        ((name, tensor.detach().cpu().contiguous()) for name, tensor in state_dict.items()),
+        key=lambda item: (-item[1].element_size(), item[0])
+    )
+
+    header = {}
+    offset = 0
+    for name, tensor in tensors:
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": _DTYPE_NAMES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + size]
+        }
+        offset += size
+    if metadata:
+        header["__metadata__"] = metadata
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    header_bytes += b" " * (-len(header_bytes) % 8)  # Keep the data 8-byte aligned
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for _, tensor in tensors:
+            f.write(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_flat(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a flat weights file and return views of its tensors.
+
+    The mapping is private (copy-on-write): pages are read from the page
+    cache on first access and only copied if a tensor is modified.
+    """
+    header, data_start = _read_header(path)
+    header.pop("__metadata__", None)
+
+    size = os.path.getsize(path)
+    data = torch.from_file(path, shared=False, size=size, dtype=torch.uint8)[data_start:]
+
+    state_dict = {}
+    for name, info in header.items():
+        begin, end = info["data_offsets"]
+        state_dict[name] = data[begin:end].view(_DTYPES[info["dtype"]]).reshape(info["shape"])
+    return state_dict
+
+
+def load_state_dict(
+    weights_path: str,
+    device: torch.device,
+    mmap: bool = False
+) -> Dict[str, torch.Tensor]:
+    """
+    Load a state dict from a .pth checkpoint or its flat version.
+
+    Args:
+        weights_path: Path to .pth weights file (its flat version is read
+            instead if the checkpoint has been removed)
+        device: Device to map tensors to
+        mmap: Memory-map the file instead of reading it into fresh tensors.
+            Pages are then loaded on first access and stay shared with the
+            page cache until written. Only effective on CPU.
+
+    Returns:
+        The state dict
+    """
+    mmap = mmap and device.type == 'cpu'
+    path = resolve_weights_path(weights_path)
+    if path.endswith(FLAT_SUFFIX) and (mmap or not os.path.exists(weights_path)):
+        state_dict = load_flat(path)
+        if not mmap:
+            state_dict = {name: tensor.to(device, copy=True) for name, tensor in state_dict.items()}
+        return state_dict
+    return torch.load(weights_path, map_location=device, weights_only=True, mmap=mmap)
@@ -1,12 +1,19 @@
 # Utils package
-from .gradcam import GradCAM, GradCAMVisualizer, image_to_base64, base64_to_image
-from .llm import generate_explanation, get_fallback_explanation
+from .gradcam import GradCAM, GradCAMContext, GradCAMVisualizer, image_to_base64, base64_to_image
+from .encoding import ImageEncoding, encode_images
+from .llm import generate_explanation, generate_explanation_async, get_fallback_explanation
+from .batching import MicroBatcher
 
 __all__ = [
     "GradCAM", 
+    "GradCAMContext",
     "GradCAMVisualizer", 
     "image_to_base64", 
     "base64_to_image",
+    "ImageEncoding",
+    "encode_images",
     "generate_explanation",
-    "get_fallback_explanation"
+    "generate_explanation_async",
+    "get_fallback_explanation",
+    "MicroBatcher"
 ]
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Batch Uploads
+Collects the images of a batch request from plain image files and zip/tar archives.
+"""
+
+import os
+import tarfile
+import zipfile
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from .preprocessing import ImageTooLargeError
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp"}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-gtar",
+    "application/x-bzip2",
+    "application/x-xz",
+}
+
+# (name, image bytes or the error that makes this item unusable)
+BatchItem = Tuple[str, Union[bytes, Exception]]
+
+
+class BatchTooLargeError(ValueError):
+    """Raised when a batch upload has too many images or bytes."""
+    pass
+
+
+def is_archive(filename: Optional[str], content_type: Optional[str]) -> bool:
+    """Whether an upload looks like a zip or tar archive."""
+    if content_type in ARCHIVE_CONTENT_TYPES:
+        return True
+    return bool(filename) and filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _is_image_name(name: str) -> bool:
+    """Whether an archive member is an image worth predicting (skips macOS/hidden files)."""
+    base = os.path.basename(name)
+    if not base or base.startswith(".") or name.startswith("__MACOSX/"):
+        return False
+    return os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+
+class BatchCollector:
+    """
+    Gathers the images of one batch request, enforcing its limits.
+
+    Items that cannot be used (oversized members, unreadable files) are kept
+    as errors so they show up in the per-image results; exceeding the image
+    count or total size fails the whole request.
+    """
+
+    def __init__(self, max_images: int, max_total_bytes: int, max_image_bytes: int):
+        """
+        Initialize the collector.
+
+        Args:
+            max_images: Images allowed per request
+            max_total_bytes: Combined (uncompressed) size allowed per request
+            max_image_bytes: Size allowed per image
+        """
+        self.max_images = max_images
+        self.max_total_bytes = max_total_bytes
+        self.max_image_bytes = max_image_bytes
+        self.items: List[BatchItem] = []
+        self.total_bytes = 0
+
+    def add(self, name: str, data: Union[bytes, Exception]) -> None:
+        """Append one item, raising BatchTooLargeError past the limits."""
+        if len(self.items) >= self.max_images:
+            raise BatchTooLargeError(f"Batch has more than {self.max_images} images")
+        if isinstance(data, bytes):
+            self.total_bytes += len(data)
+            if self.total_bytes > self.max_total_bytes:
+                raise BatchTooLargeError(f"Batch is larger than {self.max_total_bytes} bytes")
+        self.items.append((name, data))
+
+    def add_image(self, name: str, fileobj: BinaryIO) -> None:
+        """Read one image file, at most max_image_bytes."""
+        data = fileobj.read(self.max_image_bytes + 1)
+        if len(data) > self.max_image_bytes:
+            self.add(name, ImageTooLargeError(f"Image is larger than {self.max_image_bytes} bytes"))
+        else:
+            self.add(name, data)
+
+    def add_archive(self, filename: str, fileobj: BinaryIO) -> None:
+        """
+        Add every image of a zip or tar archive (tar may be gzip/bz2/xz compressed).
+
+        Members are named "<archive>/<path>"; non-image members are skipped.
+        """
+        try:
+            if zipfile.is_zipfile(fileobj):
+                fileobj.seek(0)
+                self._add_zip(filename, fileobj)
+            else:
+                fileobj.seek(0)
+                self._add_tar(filename, fileobj)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+            self.add(filename, ValueError(f"Could not read archive: {e}"))
+
+    def _add_zip(self, filename: str, fileobj: BinaryIO) -> None:
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _is_image_name(info.filename):
+                    continue
+                name = f"{filename}/{info.filename}"
+                # file_size comes from the archive's own header, so check
+                # the bytes actually read as well
+                if info.file_size > self.max_image_bytes:
+                    self.add(name, ImageTooLargeError(f"Image is larger than {self.max_image_bytes} bytes"))
+                    continue
+                with archive.open(info) as member:
+                    self.add_image(name, member)
+
+    def _add_tar(self, filename: str, fileobj: BinaryIO) -> None:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for info in archive:
+                if not info.isfile() or not _is_image_name(info.name):
+                    continue
+                name = f"{filename}/{info.name}"
+                if info.size > self.max_image_bytes:
+                    self.add(name, ImageTooLargeError(f"Image is larger than {self.max_image_bytes} bytes"))
+                    continue
+                self.add_image(name, archive.extractfile(info))
@@ -0,0 +1,136 @@
+"""
+Dynamic Micro-Batching
+Collects concurrent inference requests for a model into a single batched call.
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Tuple
+
+
+def _fail_batch(batch: List[Tuple[Any, asyncio.Future]], error: BaseException) -> None:
+    """Fail every still-pending request of a batch with error."""
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+class MicroBatcher:
+    """
+    Per-model request queue that groups concurrent requests into batches.
+
+    The first request to arrive opens a window of ``max_wait_ms``; every request
+    queued before the window closes (up to ``max_batch_size``) is run through
+    ``run_batch`` in one call and the results are fanned back to the callers.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            run_batch: Blocking function mapping a list of inputs to a list of
+                results. A result that is an Exception is raised to its caller.
+            max_batch_size: Maximum number of requests per batch
+            max_wait_ms: How long to wait for more requests after the first one
+            executor: Pool to run batches on (defaults to the loop's executor)
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_task: Optional[asyncio.Task] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one input and wait for its result."""
+        loop = asyncio.get_running_loop()
+
+        if self._worker_task is None or self._worker_task.done():
+            # A worker that died leaves its queued callers waiting forever
+            self._fail_queued(RuntimeError("Batcher worker stopped"))
+            self._queue = asyncio.Queue()
+            self._worker_task = loop.create_task(self._worker())
+
+        future = loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop the worker task and fail any requests still queued."""
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+            self._worker_task = None
+
+        self._fail_queued(RuntimeError("Batcher shut down"))
+
+    def _fail_queued(self, error: Exception) -> None:
+        """Fail every request still in the queue with error."""
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(error)
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        """Wait for the first request, then gather more until the window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            except asyncio.CancelledError:
+                _fail_batch(batch, RuntimeError("Batcher shut down"))
+                raise
+
+        # Drop callers that gave up while we were waiting
+        return [(item, future) for item, future in batch if not future.cancelled()]
+
+    async def _worker(self) -> None:
+        """Run batches one after another for as long as the batcher lives."""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.run_batch, [item for item, _ in batch]
+                )
+            except asyncio.CancelledError:
+                # Closed mid-batch: the callers would otherwise wait forever
+                _fail_batch(batch, RuntimeError("Batcher shut down"))
+                raise
+            except Exception as e:
+                _fail_batch(batch, e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,254 @@
+"""
+Result Cache
+Content-addressed cache for prediction and Grad-CAM responses.
+"""
+
+import base64
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def hash_bytes(data: bytes) -> str:
+    """Return the SHA-256 hex digest of raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a JSON-like response in bytes."""
+    if isinstance(value, dict):
+        return sum(len(str(k)) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_size(v) for v in value)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 8
+
+
+def _json_default(value: Any) -> Any:
+    """Store bytes (binary-mode images) on disk as tagged base64."""
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_object_hook(value: Dict[str, Any]) -> Any:
+    """Inverse of _json_default."""
+    if len(value) == 1 and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+class ResultCache:
+    """
+    Two-tier cache for JSON-serializable responses (bytes values allowed).
+
+    The memory tier is an LRU bounded by the estimated size of its entries.
+    The optional disk tier stores one JSON file per entry and is pruned by
+    modification time once it exceeds its size budget. Disk hits are promoted
+    back into memory.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Size budget of the in-memory tier (0 disables it)
+            disk_dir: Directory for the on-disk tier (None disables it)
+            disk_max_bytes: Size budget of the on-disk tier
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_size = sum(size for _, _, size in self._disk_files())
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or bool(self.disk_dir)
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        weights_hash: str,
+        image_bytes: bytes,
+        target_class: Any = None,
+        output_type: str = "predict"
+    ) -> str:
+        """
+        Build a cache key from everything that determines a response.
+
+        Args:
+            model_name: Model the request was sent to
+            weights_hash: Hash of the loaded weights, so retrained models miss
+            image_bytes: Raw uploaded image
+            target_class: Requested Grad-CAM class(es), if any
+            output_type: Endpoint-specific output selector
+        """
+        parts = [model_name, weights_hash, hash_bytes(image_bytes), repr(target_class), output_type]
+        return hash_bytes("\x1f".join(parts).encode())
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(entry[0])
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_set(key, value)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a copy of value in both tiers."""
+        if not self.enabled:
+            return
+
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._memory_set(key, value)
+        self._disk_set(key, value)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and tier sizes."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "memory_bytes": self._size,
+            "memory_max_bytes": self.max_bytes,
+            "disk_bytes": self._disk_size if self.disk_dir else None
+        }
+
+    def _memory_set(self, key: str, value: Any) -> None:
+        """Insert into the LRU and evict until within budget. Caller holds the lock."""
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self._size += size
+
+        while self._size > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_files(self):
+        """Yield (path, mtime, size) for every entry in the disk tier."""
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f, object_hook=_json_object_hook)
+            os.utime(path)  # Mark as recently used for pruning
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _disk_set(self, key: str, value: Any) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f, default=_json_default)
+            size = os.path.getsize(tmp_path)
+            try:
+                size -= os.path.getsize(path)  # Overwriting an entry only adds the difference
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            print(f"WARNING: Could not write result cache entry: {e}")
+            return
+
+        with self._lock:
+            self._disk_size += size
+            over_budget = self._disk_size > self.disk_max_bytes
+        if over_budget:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Delete least recently used disk entries until at 90% of the budget."""
+        files = sorted(self._disk_files(), key=lambda f: f[1])
+        total = sum(size for _, _, size in files)
+        target = int(self.disk_max_bytes * 0.9)
+
+        for path, _, size in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
+
+        with self._lock:
+            self._disk_size = total
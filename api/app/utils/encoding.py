@@ -0,0 +1,174 @@
+"""
+Image Encoding
+Encodes Grad-CAM visualizations for responses as PNG, JPEG or WebP.
+"""
+
+import base64
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image
+
+
+# Output format -> (PIL format name, media type)
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+# Valid (min, max) of each numeric option
+QUALITY_RANGE = (1, 100)
+COMPRESS_LEVEL_RANGE = (0, 9)
+WEBP_METHOD_RANGE = (0, 6)
+
+
+def _check_format(name: str, value: str) -> None:
+    if value not in IMAGE_FORMATS:
+        raise ValueError(f"{name} must be one of {list(IMAGE_FORMATS)}, got '{value}'")
+
+
+def _check_range(name: str, value: int, bounds: Tuple[int, int]) -> None:
+    low, high = bounds
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}, got {value}")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got '{value}'") from None
+
+
+# Defaults favour latency: zlib level 1 PNG is ~4x faster to write than
+# PIL's default level 6 at a slightly larger size, and WebP uses its
+# fastest method. They are checked here, so a bad setting stops the API at
+# startup instead of failing every Grad-CAM request.
+DEFAULT_FORMAT = os.getenv("GRADCAM_IMAGE_FORMAT", "png").lower()
+DEFAULT_QUALITY = _env_int("GRADCAM_IMAGE_QUALITY", 85)
+DEFAULT_COMPRESS_LEVEL = _env_int("GRADCAM_PNG_COMPRESS_LEVEL", 1)
+WEBP_METHOD = _env_int("GRADCAM_WEBP_METHOD", 0)
+
+_check_format("GRADCAM_IMAGE_FORMAT", DEFAULT_FORMAT)
+_check_range("GRADCAM_IMAGE_QUALITY", DEFAULT_QUALITY, QUALITY_RANGE)
+_check_range("GRADCAM_PNG_COMPRESS_LEVEL", DEFAULT_COMPRESS_LEVEL, COMPRESS_LEVEL_RANGE)
+_check_range("GRADCAM_WEBP_METHOD", WEBP_METHOD, WEBP_METHOD_RANGE)
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class ImageEncoding(NamedTuple):
+    """
+    How visualizations are encoded.
+
+    quality applies to JPEG and WebP (1-100), compress_level to PNG (0-9).
+    With binary set, images are returned as raw bytes rather than base64
+    strings, for responses that carry them as binary parts.
+    """
+
+    format: str = DEFAULT_FORMAT
+    quality: int = DEFAULT_QUALITY
+    compress_level: int = DEFAULT_COMPRESS_LEVEL
+    binary: bool = False
+
+    @classmethod
+    def create(
+        cls,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        compress_level: Optional[int] = None,
+        binary: bool = False
+    ) -> "ImageEncoding":
+        """
+        Build a validated encoding, using the defaults for missing options.
+
+        Raises:
+            ValueError: If an option is out of range
+        """
+        encoding = cls(
+            format=(format or DEFAULT_FORMAT).lower(),
+            quality=DEFAULT_QUALITY if quality is None else quality,
+            compress_level=DEFAULT_COMPRESS_LEVEL if compress_level is None else compress_level,
+            binary=binary
+        )
+        _check_format("output_format", encoding.format)
+        _check_range("quality", encoding.quality, QUALITY_RANGE)
+        _check_range("compress_level", encoding.compress_level, COMPRESS_LEVEL_RANGE)
+        return encoding
+
+    @property
+    def media_type(self) -> str:
+        return IMAGE_FORMATS[self.format][1]
+
+    @property
+    def tag(self) -> str:
+        """Short identifier of the options that affect the output, e.g. "png1" or "jpeg85:bin"."""
+        tag = f"png{self.compress_level}" if self.format == "png" else f"{self.format}{self.quality}"
+        return f"{tag}:bin" if self.binary else tag
+
+    def save_options(self) -> Dict[str, int]:
+        """Keyword arguments for Image.save."""
+        if self.format == "png":
+            return {"compress_level": self.compress_level}
+        if self.format == "webp":
+            return {"quality": self.quality, "method": WEBP_METHOD}
+        return {"quality": self.quality}
+
+
+def encode_image(image: Image.Image, encoding: ImageEncoding) -> bytes:
+    """Encode one image."""
+    buffer = io.BytesIO()
+    image.save(buffer, format=IMAGE_FORMATS[encoding.format][0], **encoding.save_options())
+    return buffer.getvalue()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    """Shared encoder threads (ENCODE_THREADS, default 4)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("ENCODE_THREADS", "4")),
+                thread_name_prefix="encode"
+            )
+        return _pool
+
+
+def encode_images(
+    images: Dict[str, Image.Image],
+    encoding: Optional[ImageEncoding] = None
+) -> Dict[str, Union[str, bytes]]:
+    """
+    Encode several images, in parallel.
+
+    PIL releases the GIL while compressing, so the images of one response
+    encode concurrently on the shared encoder threads.
+
+    Args:
+        images: Images by name
+        encoding: Encoding options (default ImageEncoding())
+
+    Returns:
+        Base64 strings (raw bytes if encoding.binary) by name
+    """
+    if encoding is None:
+        encoding = ImageEncoding()
+
+    def encode(image: Image.Image) -> Union[str, bytes]:
+        data = encode_image(image, encoding)
+        return data if encoding.binary else base64.b64encode(data).decode()
+
+    if len(images) <= 1:
+        return {name: encode(image) for name, image in images.items()}
+
+    names = list(images)
+    encoded = _get_pool().map(encode, images.values())
+    return dict(zip(names, encoded))
@@ -0,0 +1,123 @@
+"""
+Inference Executor
+Runs blocking PyTorch, Grad-CAM and image-encoding work off the asyncio event loop.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when the inference queue is full and a request should be shed."""
+    pass
+
+
+class InferenceExecutor:
+    """
+    Bounded executor for blocking inference work.
+
+    At most ``max_workers`` jobs run at once and at most ``max_queue`` more may
+    wait for a worker. Anything beyond that is rejected immediately with
+    ExecutorBusyError so latency stays bounded under overload.
+
+    Grad-CAM can optionally run in a process pool (``gradcam_mode="process"``),
+    whose workers load their own copy of the models via ``process_initializer``.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queue: int = 32,
+        gradcam_mode: str = "thread",
+        gradcam_processes: int = 1,
+        process_initializer: Optional[Callable[[], None]] = None
+    ):
+        """
+        Initialize the executor.
+
+        Args:
+            max_workers: Number of inference threads
+            max_queue: Requests allowed to wait once all workers are busy
+            gradcam_mode: "thread" or "process"
+            gradcam_processes: Size of the Grad-CAM process pool
+            process_initializer: Called once in each Grad-CAM worker process
+        """
+        if gradcam_mode not in ["thread", "process"]:
+            raise ValueError("gradcam_mode must be 'thread' or 'process'")
+
+        self.max_workers = max(1, max_workers)
+        self.max_pending = self.max_workers + max(0, max_queue)
+        self.gradcam_mode = gradcam_mode
+        self.pending = 0
+        self.rejected = 0
+
+        self.pool: Executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="inference"
+        )
+        self.gradcam_pool: Executor = self.pool
+        if gradcam_mode == "process":
+            # Spawn rather than fork: forking a process that already holds
+            # PyTorch thread pools can deadlock the child.
+            self.gradcam_pool = ProcessPoolExecutor(
+                max_workers=max(1, gradcam_processes),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=process_initializer
+            )
+
+    @asynccontextmanager
+    async def reserve(self):
+        """
+        Hold one slot of the queue for the duration of the block.
+
+        Raises:
+            ExecutorBusyError: If the queue is already full
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorBusyError(
+                f"Inference queue full ({self.pending}/{self.max_pending} pending)"
+            )
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function on the inference thread pool."""
+        async with self.reserve():
+            return await self._submit(self.pool, fn, *args, **kwargs)
+
+    async def run_gradcam(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run Grad-CAM work on the configured pool.
+
+        In process mode ``fn`` and its arguments must be picklable.
+        """
+        async with self.reserve():
+            return await self._submit(self.gradcam_pool, fn, *args, **kwargs)
+
+    async def _submit(self, pool: Executor, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue depth and configuration for health reporting."""
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "gradcam_mode": self.gradcam_mode
+        }
+
+    def shutdown(self) -> None:
+        """Shut down the worker pools."""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.gradcam_pool is not self.pool:
+            self.gradcam_pool.shutdown(wait=False, cancel_futures=True)
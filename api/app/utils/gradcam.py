@@ -8,15 +8,33 @@ import torch.nn.functional as F
 import numpy as np
 from PIL import Image
 import cv2
-from typing import Tuple, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Tuple, Optional
 import io
 import base64
 
 
+class GradCAMContext:
+    """
+    State captured during a single Grad-CAM computation.
+    
+    Each call gets its own context, so concurrent calls on the same model
+    never see each other's activations.
+    """
+    
+    def __init__(self):
+        self.activations: Optional[torch.Tensor] = None
+
+
 class GradCAM:
     """
     Grad-CAM implementation for CNN visualization.
     Works with EfficientNet and other architectures with convolutional backbones.
+    
+    Safe to call from several threads at once: the target-layer hook writes
+    into the GradCAMContext of the calling thread, and gradients are taken
+    with torch.autograd.grad instead of being accumulated on the model.
     """
     
     def __init__(self, model: torch.nn.Module, target_layer: torch.nn.Module):
@@ -29,23 +47,39 @@ class GradCAM:
         """
         self.model = model
         self.target_layer = target_layer
-        self.gradients = None
-        self.activations = None
+        
+        # Context of the Grad-CAM call running in the current thread, if any
+        self._active: ContextVar[Optional[GradCAMContext]] = ContextVar(
+            f"gradcam_{id(self)}", default=None
+        )
         
         # Register hooks
         self._register_hooks()
     
     def _register_hooks(self):
-        """Register forward and backward hooks on the target layer."""
+        """Register the forward hook on the target layer."""
         
         def forward_hook(module, input, output):
-            self.activations = output.detach()
+            # Plain (no-grad) predictions pass through without capturing
+            context = self._active.get()
+            if context is not None:
+                context.activations = output
         
-        def backward_hook(module, grad_input, grad_output):
-            self.gradients = grad_output[0].detach()
-        
-        self.target_layer.register_forward_hook(forward_hook)
-        self.target_layer.register_full_backward_hook(backward_hook)
+        self._hook_handle = self.target_layer.register_forward_hook(forward_hook)
+    
+    def remove_hooks(self):
+        """Detach the hook from the target layer."""
+        self._hook_handle.remove()
+    
+    @contextmanager
+    def capture(self):
+        """Scope a GradCAMContext to the forward pass run inside the block."""
+        context = GradCAMContext()
+        token = self._active.set(context)
+        try:
+            yield context
+        finally:
+            self._active.reset(token)
     
     def generate(
         self, 
@@ -62,33 +96,146 @@ class GradCAM:
         Returns:
             Heatmap as numpy array (H, W) with values in [0, 1]
         """
+        cam, _ = self.generate_with_logits(input_tensor, target_class)
+        return cam
+    
+    def generate_with_logits(
+        self, 
+        input_tensor: torch.Tensor, 
+        target_class: Optional[int] = None
+    ) -> Tuple[np.ndarray, torch.Tensor]:
+        """
+        Generate Grad-CAM heatmap and return the model output alongside it.
+        
+        The logits come from the same forward pass the backward pass runs
+        through, so callers get class probabilities without a second,
+        no-grad forward pass.
+        
+        Args:
+            input_tensor: Preprocessed input image tensor (1, C, H, W)
+            target_class: Class index to visualize. If None, uses predicted class.
+            
+        Returns:
+            Tuple of heatmap (H, W) in [0, 1] and detached logits (1, num_classes)
+        """
+        cams, logits = self.generate_batch(input_tensor, [target_class])
+        return cams[0], logits
+    
+    def generate_batch(
+        self,
+        input_tensor: torch.Tensor,
+        target_classes: Optional[List[Optional[int]]] = None
+    ) -> Tuple[np.ndarray, torch.Tensor]:
+        """
+        Generate one heatmap per image with a single forward and backward pass.
+        
+        In eval mode the samples of a batch are independent, so backpropagating
+        a one-hot row per sample yields each sample's own gradients.
+        
+        Args:
+            input_tensor: Preprocessed input image tensors (N, C, H, W)
+            target_classes: Class index per image (None entries, or None for
+                the whole list, use the predicted class)
+            
+        Returns:
+            Tuple of heatmaps (N, H, W) in [0, 1] and detached logits (N, num_classes)
+        """
         self.model.eval()
         
-        # Forward pass
-        output = self.model(input_tensor)
+        # Forward pass (with gradients, for both logits and Grad-CAM)
+        with torch.enable_grad(), self.capture() as context:
+            output = self.model(input_tensor)
         
-        if target_class is None:
-            target_class = output.argmax(dim=1).item()
+        predicted = output.argmax(dim=1).tolist()
+        if target_classes is None:
+            target_classes = [None] * len(predicted)
+        targets = [
+            pred if target is None else target
+            for target, pred in zip(target_classes, predicted)
+        ]
         
-        # Backward pass
-        self.model.zero_grad()
+        # Backward pass, only down to the target layer and without
+        # touching the parameters' .grad
         one_hot = torch.zeros_like(output)
-        one_hot[0, target_class] = 1
-        output.backward(gradient=one_hot, retain_graph=True)
+        one_hot[torch.arange(len(targets)), targets] = 1
+        gradients, = torch.autograd.grad(
+            output, context.activations, grad_outputs=one_hot
+        )
         
-        # Generate heatmap
+        cams = self._compute_cams(gradients, context.activations.detach())
+        return cams, output.detach()
+    
+    def generate_for_classes(
+        self,
+        input_tensor: torch.Tensor,
+        target_classes: List[int]
+    ) -> Tuple[np.ndarray, torch.Tensor]:
+        """
+        Generate heatmaps for several classes of one image.
+        
+        Runs one forward pass and a single vectorized backward pass over all
+        requested classes (falling back to one backward per class on builds
+        where batched gradients are not supported for the model's ops).
+        
+        Args:
+            input_tensor: Preprocessed input image tensor (1, C, H, W)
+            target_classes: Class indices to visualize
+            
+        Returns:
+            Tuple of heatmaps (len(target_classes), H, W) in [0, 1] and
+            detached logits (1, num_classes)
+        """
+        self.model.eval()
+        
+        with torch.enable_grad(), self.capture() as context:
+            output = self.model(input_tensor)
+        activations = context.activations
+        
+        # One (1, num_classes) one-hot per requested class
+        one_hot = torch.zeros(
+            (len(target_classes),) + tuple(output.shape),
+            dtype=output.dtype,
+            device=output.device
+        )
+        one_hot[torch.arange(len(target_classes)), 0, target_classes] = 1
+        
+        try:
+            gradients, = torch.autograd.grad(
+                output, activations, grad_outputs=one_hot, is_grads_batched=True
+            )
+            gradients = gradients[:, 0]
+        except RuntimeError:
+            gradients = torch.cat([
+                torch.autograd.grad(
+                    output, activations, grad_outputs=one_hot[i], retain_graph=True
+                )[0]
+                for i in range(len(target_classes))
+            ])
+        
+        activations = activations.detach().expand(len(target_classes), -1, -1, -1)
+        cams = self._compute_cams(gradients, activations)
+        return cams, output.detach()
+    
+    def _compute_cams(
+        self,
+        gradients: torch.Tensor,
+        activations: torch.Tensor
+    ) -> np.ndarray:
+        """Turn target-layer gradients and activations (N, C, h, w) into heatmaps."""
         # Global average pooling of gradients
-        weights = self.gradients.mean(dim=(2, 3), keepdim=True)
+        weights = gradients.mean(dim=(2, 3), keepdim=True)
         
         # Weighted combination of activation maps
-        cam = (weights * self.activations).sum(dim=1, keepdim=True)
+        cam = (weights * activations).sum(dim=1)
         
         # ReLU and normalize
         cam = F.relu(cam)
-        cam = cam.squeeze().cpu().numpy()
+        cam = cam.cpu().numpy()
         
-        # Normalize to [0, 1]
-        cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)
+        # Normalize each heatmap to [0, 1]
+        cam_min = cam.min(axis=(1, 2), keepdims=True)
+        cam_max = cam.max(axis=(1, 2), keepdims=True)
+        cam = (cam - cam_min) / (cam_max - cam_min + 1e-8)
         
         return cam
     
@@ -96,15 +243,24 @@ class GradCAM:
 class GradCAMVisualizer:
     """
     High-level visualizer that generates various Grad-CAM outputs.
+    
+    Rendering resizes each heatmap once and colors it with an RGB lookup
+    table built at init; the overlay is blended directly on uint8 pixels, and
+    the comparison is assembled from the same heatmap and overlay pixels under a
+    label header that is drawn once per width.
     """
     
+    LABEL_HEIGHT = 30
+    
     def __init__(
         self, 
         model: torch.nn.Module,
         target_layer: torch.nn.Module,
         image_size: int = 224,
         mean: list = [0.485, 0.456, 0.406],
-        std: list = [0.229, 0.224, 0.225]
+        std: list = [0.229, 0.224, 0.225],
+        alpha: float = 0.4,
+        colormap: int = cv2.COLORMAP_JET
     ):
         """
         Initialize the visualizer.
@@ -115,54 +271,88 @@ class GradCAMVisualizer:
             image_size: Size images are resized to
             mean: Normalization mean values
             std: Normalization std values
+            alpha: Opacity of the heatmap in the overlay
+            colormap: OpenCV colormap to use
         """
         self.model = model
         self.gradcam = GradCAM(model, target_layer)
         self.image_size = image_size
         self.mean = np.array(mean)
         self.std = np.array(std)
+        self.alpha = alpha
+        
+        # Normalized value -> 0-255 pixel, as one multiply-add per channel
+        self._pixel_scale = [float(s) * 255 for s in std]
+        self._pixel_offset = [float(m) * 255 for m in mean]
+        
+        # (256, 1, 3) RGB lookup table for the colormap, applied as-is by
+        # cv2.applyColorMap so no per-request BGR -> RGB conversion is needed
+        levels = np.arange(256, dtype=np.uint8).reshape(256, 1)
+        self.colormap_lut = cv2.cvtColor(
+            cv2.applyColorMap(levels, colormap), cv2.COLOR_BGR2RGB
+        )
+        
+        self._headers = {}
     
     def _denormalize(self, tensor: torch.Tensor) -> np.ndarray:
-        """Convert normalized tensor back to displayable image."""
-        img = tensor.squeeze().detach().cpu().numpy().transpose(1, 2, 0)
-        img = img * self.std + self.mean
-        img = np.clip(img * 255, 0, 255).astype(np.uint8)
-        return img
+        """
+        Convert normalized tensors back to displayable images.
+        
+        Each channel is scaled, offset, rounded and saturated to uint8 in one
+        OpenCV pass. The inputs were normalized from uint8 pixels, so they
+        never map meaningfully below 0 and the absolute value taken by
+        convertScaleAbs does not change them.
+        
+        Args:
+            tensor: Preprocessed images (N, C, H, W)
+            
+        Returns:
+            uint8 RGB images (N, H, W, 3)
+        """
+        planes = tensor.detach().cpu().numpy()
+        return np.stack([
+            cv2.merge([
+                cv2.convertScaleAbs(image[c], alpha=self._pixel_scale[c], beta=self._pixel_offset[c])
+                for c in range(image.shape[0])
+            ])
+            for image in planes
+        ])
     
-    def _apply_heatmap(
-        self, 
-        image: np.ndarray, 
-        heatmap: np.ndarray,
-        alpha: float = 0.4,
-        colormap: int = cv2.COLORMAP_JET
+    def _colorize(self, heatmap: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+        """
+        Resize a heatmap and map it through the colormap.
+        
+        Args:
+            heatmap: Grad-CAM heatmap (h, w) normalized to [0, 1]
+            size: Output (width, height)
+            
+        Returns:
+            Colored heatmap (height, width, 3) in RGB
+        """
+        resized = cv2.resize(heatmap.astype(np.float32, copy=False), size)
+        levels = cv2.convertScaleAbs(resized, alpha=255)
+        return cv2.applyColorMap(levels, self.colormap_lut)
+    
+    def _blend(
+        self,
+        image: np.ndarray,
+        heatmap_colored: np.ndarray,
+        out: Optional[np.ndarray] = None
     ) -> np.ndarray:
         """
-        Overlay heatmap on original image.
+        Overlay a colored heatmap on an image.
         
         Args:
             image: Original image (H, W, 3) in RGB
-            heatmap: Grad-CAM heatmap (H, W) normalized to [0, 1]
-            alpha: Transparency of heatmap overlay
-            colormap: OpenCV colormap to use
+            heatmap_colored: Colored heatmap (H, W, 3) in RGB
+            out: Array to write the result into
             
         Returns:
-            Overlaid image as numpy array
+            Overlaid image as uint8 numpy array
         """
-        # Resize heatmap to image size
-        heatmap_resized = cv2.resize(heatmap, (image.shape[1], image.shape[0]))
-        
-        # Apply colormap
-        heatmap_colored = cv2.applyColorMap(
-            (heatmap_resized * 255).astype(np.uint8), 
-            colormap
+        return cv2.addWeighted(
+            image, 1 - self.alpha, heatmap_colored, self.alpha, 0, dst=out
         )
-        heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
-        
-        # Blend with original image
-        overlaid = (1 - alpha) * image + alpha * heatmap_colored
-        overlaid = np.clip(overlaid, 0, 255).astype(np.uint8)
-        
-        return overlaid
     
     def generate_visualization(
         self,
@@ -184,78 +374,105 @@ class GradCAMVisualizer:
         # Generate heatmap
         heatmap = self.gradcam.generate(input_tensor, target_class)
         
-        # Get original image
-        original = self._denormalize(input_tensor)
-        
-        results = {}
-        
-        if output_type in ["heatmap", "all"]:
-            # Pure heatmap
-            heatmap_resized = cv2.resize(heatmap, (self.image_size, self.image_size))
-            heatmap_colored = cv2.applyColorMap(
-                (heatmap_resized * 255).astype(np.uint8), 
-                cv2.COLORMAP_JET
-            )
-            heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
-            results["heatmap"] = Image.fromarray(heatmap_colored)
-        
-        if output_type in ["overlay", "all"]:
-            # Overlay on original
-            overlaid = self._apply_heatmap(original, heatmap)
-            results["overlay"] = Image.fromarray(overlaid)
+        return self.render(input_tensor, heatmap, output_type)
+    
+    def render_batch(
+        self,
+        input_tensor: torch.Tensor,
+        heatmaps: np.ndarray,
+        output_type: str = "all"
+    ) -> List[dict]:
+        """
+        Build visualizations for a batch of heatmaps.
         
-        if output_type == "all":
-            # Original image
-            results["original"] = Image.fromarray(original)
+        Args:
+            input_tensor: Preprocessed images (N, C, H, W), or a single image
+                (1, C, H, W) shared by all heatmaps
+            heatmaps: Grad-CAM heatmaps (N, H, W) normalized to [0, 1]
+            output_type: One of "heatmap", "overlay", "all"
             
-            # Side-by-side comparison
-            comparison = self._create_comparison(
-                original, 
-                heatmap,
-                results["overlay"]
-            )
-            results["comparison"] = comparison
-        
-        return results
+        Returns:
+            One dictionary of PIL Images per heatmap
+        """
+        if output_type == "heatmap":
+            return [self._render_image(None, heatmap, output_type) for heatmap in heatmaps]
+        
+        originals = self._denormalize(input_tensor)
+        return [
+            self._render_image(originals[0 if len(originals) == 1 else i], heatmap, output_type)
+            for i, heatmap in enumerate(heatmaps)
+        ]
     
-    def _create_comparison(
-        self, 
-        original: np.ndarray, 
+    def render(
+        self,
+        input_tensor: torch.Tensor,
         heatmap: np.ndarray,
-        overlay: Image.Image
-    ) -> Image.Image:
-        """Create side-by-side comparison image."""
-        h, w = original.shape[:2]
-        
-        # Create heatmap image
-        heatmap_resized = cv2.resize(heatmap, (w, h))
-        heatmap_colored = cv2.applyColorMap(
-            (heatmap_resized * 255).astype(np.uint8), 
-            cv2.COLORMAP_JET
-        )
-        heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
+        output_type: str = "all"
+    ) -> dict:
+        """
+        Build visualization(s) from an already computed heatmap.
         
-        # Create comparison (original | heatmap | overlay)
-        overlay_np = np.array(overlay)
+        Args:
+            input_tensor: Preprocessed input image tensor (1, C, H, W)
+            heatmap: Grad-CAM heatmap (H, W) normalized to [0, 1]
+            output_type: One of "heatmap", "overlay", "all"
+            
+        Returns:
+            Dictionary containing requested visualizations as PIL Images
+        """
+        original = None if output_type == "heatmap" else self._denormalize(input_tensor)[0]
+        return self._render_image(original, heatmap, output_type)
+    
+    def _render_image(
+        self,
+        original: Optional[np.ndarray],
+        heatmap: np.ndarray,
+        output_type: str
+    ) -> dict:
+        """Build the requested visualizations of one denormalized image (None for "heatmap")."""
+        results = {}
         
-        # Add labels
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        label_height = 30
+        if output_type == "heatmap":
+            results["heatmap"] = Image.fromarray(self._colorize(heatmap, (self.image_size, self.image_size)))
+            return results
         
-        comparison = np.zeros((h + label_height, w * 3, 3), dtype=np.uint8)
-        comparison.fill(255)  # White background
+        h, w = original.shape[:2]
+        heatmap_colored = self._colorize(heatmap, (w, h))
         
-        # Add images
-        comparison[label_height:, :w] = original
-        comparison[label_height:, w:2*w] = heatmap_colored
-        comparison[label_height:, 2*w:] = overlay_np
+        if output_type == "overlay":
+            results["overlay"] = Image.fromarray(self._blend(original, heatmap_colored))
+            return results
         
-        # Add labels
-        cv2.putText(comparison, "Original", (w//2 - 40, 20), font, 0.6, (0, 0, 0), 2)
-        cv2.putText(comparison, "Grad-CAM", (w + w//2 - 45, 20), font, 0.6, (0, 0, 0), 2)
-        cv2.putText(comparison, "Overlay", (2*w + w//2 - 35, 20), font, 0.6, (0, 0, 0), 2)
+        if output_type == "all":
+            # Side-by-side comparison (original | heatmap | overlay); the
+            # overlay is blended straight into its panel
+            comparison = self._create_comparison(h, w)
+            panels = comparison[self.LABEL_HEIGHT:]
+            panels[:, :w] = original
+            panels[:, w:2 * w] = heatmap_colored
+            overlaid = self._blend(original, heatmap_colored, out=panels[:, 2 * w:])
+            
+            results["heatmap"] = Image.fromarray(heatmap_colored)
+            results["overlay"] = Image.fromarray(overlaid)
+            results["original"] = Image.fromarray(original)
+            results["comparison"] = Image.fromarray(comparison)
         
-        return Image.fromarray(comparison)
+        return results
+    
+    def _create_comparison(self, h: int, w: int) -> np.ndarray:
+        """New comparison canvas (h + label height, 3 * w) with the labels drawn in."""
+        header = self._headers.get(w)
+        if header is None:
+            font = cv2.FONT_HERSHEY_SIMPLEX
+            header = np.full((self.LABEL_HEIGHT, w * 3, 3), 255, dtype=np.uint8)  # White background
+            cv2.putText(header, "Original", (w//2 - 40, 20), font, 0.6, (0, 0, 0), 2)
+            cv2.putText(header, "Grad-CAM", (w + w//2 - 45, 20), font, 0.6, (0, 0, 0), 2)
+            cv2.putText(header, "Overlay", (2*w + w//2 - 35, 20), font, 0.6, (0, 0, 0), 2)
+            self._headers[w] = header
+        
+        comparison = np.empty((h + self.LABEL_HEIGHT, w * 3, 3), dtype=np.uint8)
+        comparison[:self.LABEL_HEIGHT] = header
+        return comparison
 
 
 def image_to_base64(image: Image.Image, format: str = "PNG") -> str:
@@ -0,0 +1,391 @@
+"""
+Background Jobs
+SQLite-backed jobs for workloads too large or slow for one HTTP request.
+
+A job holds the uploaded images and the request options. Workers take
+queued jobs, process their images in chunks and store each result as it
+finishes, so clients can follow progress and read results while the job
+runs. Inputs and results live in SQLite, so unfinished jobs resume after a
+restart; finished jobs are deleted once they are older than the retention.
+
+JobStore is blocking; from async code call it through asyncio.to_thread.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .archives import BatchItem
+from .executor import ExecutorBusyError
+
+
+JOB_STATUSES = ["queued", "running", "done", "failed"]
+FINISHED_STATUSES = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    filename TEXT,
+    image BLOB,
+    status TEXT NOT NULL,
+    result TEXT,
+    seq INTEGER,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_seq ON job_items (job_id, seq);
+"""
+
+
+class JobStore:
+    """
+    Persistent job state in one SQLite database.
+
+    Items are "pending" until processed, then "done" or "failed" with their
+    result (a JSON object, with an "error" key on failure) and a sequence
+    number giving the order they finished in. The input image is dropped
+    once an item is finished.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (and if needed create) the database.
+
+        Args:
+            path: SQLite file
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def create(self, model_name: str, params: Dict[str, Any], items: List[BatchItem]) -> Dict[str, Any]:
+        """
+        Store a new queued job.
+
+        Items whose data is an exception are stored as already failed.
+
+        Returns:
+            The job summary (see ``get``)
+        """
+        job_id = uuid.uuid4().hex
+        failed = sum(isinstance(data, Exception) for _, data in items)
+
+        rows = []
+        seq = 0
+        for idx, (filename, data) in enumerate(items):
+            if isinstance(data, Exception):
+                seq += 1
+                rows.append((job_id, idx, filename, None, "failed", json.dumps({"error": str(data)}), seq))
+            else:
+                rows.append((job_id, idx, filename, data, "pending", None, None))
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, model_name, params, status, total, failed, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, model_name, json.dumps(params), len(items), failed, time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, idx, filename, image, status, result, seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job summary with progress counters, or None if unknown."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        finished = row["completed"] + row["failed"]
+        return {
+            "job_id": row["id"],
+            "model": row["model_name"],
+            "params": json.loads(row["params"]),
+            "status": row["status"],
+            "total": row["total"],
+            "completed": row["completed"],
+            "failed": row["failed"],
+            "progress": round(finished / row["total"], 4) if row["total"] else 1.0,
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+
+    def set_status(self, job_id: str, status: str) -> None:
+        """Move a job to "running", "done" or "failed", recording when."""
+        column = {"running": "started_at", "done": "finished_at", "failed": "finished_at"}.get(status)
+        with self._lock, self._conn:
+            if column is None:
+                self._conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (status, job_id))
+            else:
+                self._conn.execute(
+                    f"UPDATE jobs SET status = ?, {column} = COALESCE({column}, ?) WHERE id = ?",
+                    (status, time.time(), job_id)
+                )
+
+    def pending_items(self, job_id: str, limit: int) -> List[Tuple[int, BatchItem]]:
+        """The next unprocessed items of a job, as (index, (filename, image bytes))."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, filename, image FROM job_items "
+                "WHERE job_id = ? AND status = 'pending' ORDER BY idx LIMIT ?",
+                (job_id, limit)
+            ).fetchall()
+        return [(row["idx"], (row["filename"], bytes(row["image"]))) for row in rows]
+
+    def finish_items(self, job_id: str, results: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """Store the results of processed items (an "error" key marks a failure)."""
+        with self._lock, self._conn:
+            (seq,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            completed = failed = 0
+            for idx, result in results:
+                seq += 1
+                status = "failed" if "error" in result else "done"
+                if status == "failed":
+                    failed += 1
+                else:
+                    completed += 1
+                self._conn.execute(
+                    "UPDATE job_items SET status = ?, result = ?, seq = ?, image = NULL "
+                    "WHERE job_id = ? AND idx = ? AND status = 'pending'",
+                    (status, json.dumps(result), seq, job_id, idx)
+                )
+            self._conn.execute(
+                "UPDATE jobs SET completed = completed + ?, failed = failed + ? WHERE id = ?",
+                (completed, failed, job_id)
+            )
+
+    def results(self, job_id: str, after_seq: int = 0, limit: int = 100) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Finished items in the order they finished.
+
+        Returns:
+            (seq, entry) pairs with seq > after_seq; each entry is the item's
+            result plus its "index" and "filename"
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, filename, result, seq FROM job_items "
+                "WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after_seq, limit)
+            ).fetchall()
+        return [
+            (row["seq"], {"index": row["idx"], "filename": row["filename"], **json.loads(row["result"])})
+            for row in rows
+        ]
+
+    def unfinished_jobs(self) -> List[str]:
+        """Ids of queued or interrupted jobs, oldest first; running jobs are requeued."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def delete_finished(self, older_than: float) -> int:
+        """Delete jobs that finished before the given timestamp. Returns how many."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (older_than,)
+            )
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are already waiting."""
+    pass
+
+
+# Processes one chunk of a job: (job summary, items) -> one result per item
+ChunkProcessor = Callable[[Dict[str, Any], List[BatchItem]], Awaitable[List[Dict[str, Any]]]]
+
+
+class JobManager:
+    """
+    Runs stored jobs on a fixed number of asyncio workers.
+
+    Each worker processes one job at a time, chunk_size items per call of
+    ``process_chunk``. When the inference executor is full the chunk is
+    retried after a short pause instead of failing, so jobs soak up spare
+    capacity without starving interactive requests. A job whose processing
+    breaks down outside ``process_chunk`` (e.g. a database error) is marked
+    "failed". Store calls run on a thread so SQLite never blocks the loop.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        process_chunk: ChunkProcessor,
+        workers: int = 2,
+        max_queued: int = 100,
+        chunk_size: int = 8,
+        retention_seconds: float = 86400,
+        busy_retry_seconds: float = 0.5
+    ):
+        """
+        Initialize the manager.
+
+        Args:
+            store: Where jobs are persisted
+            process_chunk: Coroutine producing one result per item
+            workers: Jobs processed concurrently
+            max_queued: Jobs allowed to wait for a worker
+            chunk_size: Items per process_chunk call
+            retention_seconds: How long finished jobs are kept
+            busy_retry_seconds: Pause before retrying a chunk the executor rejected
+        """
+        self.store = store
+        self.process_chunk = process_chunk
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.chunk_size = max(1, chunk_size)
+        self.retention_seconds = retention_seconds
+        self.busy_retry_seconds = busy_retry_seconds
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> int:
+        """
+        Start the workers and retention sweep, resuming unfinished jobs.
+
+        Returns:
+            Number of jobs resumed
+        """
+        self._queue = asyncio.Queue()
+        resumed = await asyncio.to_thread(self.store.unfinished_jobs)
+        for job_id in resumed:
+            self._queue.put_nowait(job_id)
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+        return len(resumed)
+
+    async def stop(self) -> None:
+        """Stop the workers; interrupted jobs resume on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self.store.close)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, job_id: str) -> None:
+        """Queue a stored job for processing."""
+        self._queue.put_nowait(job_id)
+
+    def check_capacity(self) -> None:
+        """
+        Raises:
+            JobQueueFullError: If max_queued jobs are already waiting
+        """
+        if self.queued >= self.max_queued:
+            raise JobQueueFullError(f"Job queue full ({self.queued}/{self.max_queued} waiting)")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "jobs": await asyncio.to_thread(self.store.get_stats),
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠ Job {job_id} failed: {e}")
+                try:
+                    await asyncio.to_thread(self.store.set_status, job_id, "failed")
+                except Exception as e:
+                    print(f"⚠ Could not mark job {job_id} failed: {e}")
+
+    async def _run(self, job_id: str) -> None:
+        """Process every pending item of a job, then mark it done."""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return
+        await asyncio.to_thread(self.store.set_status, job_id, "running")
+
+        while True:
+            pending = await asyncio.to_thread(self.store.pending_items, job_id, self.chunk_size)
+            if not pending:
+                break
+            items = [item for _, item in pending]
+
+            while True:
+                try:
+                    results = await self.process_chunk(job, items)
+                    break
+                except ExecutorBusyError:
+                    await asyncio.sleep(self.busy_retry_seconds)
+                except Exception as e:
+                    results = [{"error": f"Processing failed: {e}"} for _ in items]
+                    break
+
+            await asyncio.to_thread(
+                self.store.finish_items,
+                job_id,
+                [(idx, result) for (idx, _), result in zip(pending, results)]
+            )
+
+        await asyncio.to_thread(self.store.set_status, job_id, "done")
+
+    async def _sweep(self) -> None:
+        """Delete expired jobs now and then."""
+        interval = min(600.0, max(1.0, self.retention_seconds / 10))
+        while True:
+            deleted = await asyncio.to_thread(self.store.delete_finished, time.time() - self.retention_seconds)
+            if deleted:
+                print(f"✓ Deleted {deleted} expired job(s)")
+            await asyncio.sleep(interval)
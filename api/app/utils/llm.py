@@ -3,9 +3,17 @@ LLM Integration for generating plain-English explanations of predictions.
 """
 
 import os
-from typing import Optional
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 import anthropic
 
+from .cache import hash_bytes
+
 MODEL_CONTEXT = {
     'brain_tumor': {'scan_type': 'brain MRI'},
     'pneumonia': {'scan_type': 'chest X-ray'},
@@ -13,35 +21,201 @@ MODEL_CONTEXT = {
     'bone_fracture': {'scan_type': 'bone X-ray'},
 }
 
+# Bump whenever the prompt changes so cached explanations are not reused
+PROMPT_VERSION = "1"
 
-def generate_explanation(
-    model_name: str,
-    prediction: str,
-    confidence: float,
-    probabilities: dict,
-    original_image_b64: Optional[str] = None,
-    overlay_image_b64: Optional[str] = None,
-    comparison_image_b64: Optional[str] = None,
-) -> Optional[str]:
+
+class ExplanationCache:
     """
-    Generate a plain-English explanation using Claude with vision.
+    TTL + LRU cache of generated explanations with in-flight coalescing.
+    
+    Concurrent requests for the same key share a single upstream call: the
+    first caller claims the key and the others wait on its future.
     """
-    api_key = os.getenv("ANTHROPIC_API_KEY")
     
-    if not api_key:
-        print("WARNING: ANTHROPIC_API_KEY not set")
-        return None
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 86400):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_entries: Maximum number of explanations kept
+            ttl_seconds: How long an explanation stays valid
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
     
-    image_b64 = comparison_image_b64 or original_image_b64 or overlay_image_b64
+    @staticmethod
+    def make_key(model_name: str, image_hash: str, prediction: str, confidence: float) -> str:
+        """Build a key from everything that goes into the prompt."""
+        confidence_pct = round(confidence * 100, 1)
+        parts = [model_name, image_hash, prediction, str(confidence_pct), PROMPT_VERSION]
+        return hash_bytes("\x1f".join(parts).encode())
     
-    if not image_b64:
-        print("WARNING: No images provided for explanation")
-        return None
+    def get(self, key: str) -> Optional[str]:
+        """Return a fresh cached explanation, or None."""
+        with self._lock:
+            return self._get_locked(key)
+    
+    def set(self, key: str, explanation: str) -> None:
+        """Store an explanation, evicting the least recently used if full."""
+        with self._lock:
+            self._entries[key] = (explanation, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Look up a key, joining or starting the upstream call for it.
+        
+        Returns:
+            Tuple of a future resolving to the explanation (or None on
+            failure) and whether the caller owns the call and must
+            ``release`` the key when done
+        """
+        with self._lock:
+            explanation = self._get_locked(key)
+            if explanation is not None:
+                self.hits += 1
+                future = Future()
+                future.set_result(explanation)
+                return future, False
+            
+            if key in self._inflight:
+                self.coalesced += 1
+                return self._inflight[key], False
+            
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+    
+    def release(self, key: str, explanation: Optional[str]) -> None:
+        """Publish the owner's result to waiters and cache it if it succeeded."""
+        if explanation is not None:
+            self.set(key, explanation)
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(explanation)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "max_entries": self.max_entries
+        }
+    
+    def _get_locked(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        explanation, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return explanation
+
+
+EXPLANATION_CACHE = ExplanationCache(
+    max_entries=int(os.getenv("EXPLANATION_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("EXPLANATION_CACHE_TTL", "86400"))
+)
+
+
+LLM_MODEL = "claude-haiku-4-5-20251001"
+
+# Shared clients, created on first use so connections and TLS sessions are
+# reused across requests (see get_client / get_async_client)
+_client: Optional[anthropic.Anthropic] = None
+_async_client: Optional[anthropic.AsyncAnthropic] = None
+_async_semaphore: Optional[asyncio.Semaphore] = None
+_client_lock = threading.Lock()
+
+
+def client_options() -> Dict[str, Any]:
+    """
+    Client settings from the environment, as AsyncAnthropic/Anthropic kwargs.
+    
+    ANTHROPIC_BASE_URL points the client at another server (e.g. a local
+    stub in tests); LLM_TIMEOUT and LLM_MAX_RETRIES bound each call.
+    Scripts that need their own client start from these.
+    """
+    return {
+        "api_key": os.getenv("ANTHROPIC_API_KEY"),
+        "base_url": os.getenv("ANTHROPIC_BASE_URL") or None,
+        "timeout": float(os.getenv("LLM_TIMEOUT", "20")),
+        "max_retries": int(os.getenv("LLM_MAX_RETRIES", "2")),
+    }
+
+
+def get_client() -> anthropic.Anthropic:
+    """Return the shared synchronous client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = anthropic.Anthropic(**client_options())
+        return _client
+
+
+def get_async_client() -> anthropic.AsyncAnthropic:
+    """Return the shared async client."""
+    global _async_client
+    if _async_client is None:
+        _async_client = anthropic.AsyncAnthropic(**client_options())
+    return _async_client
+
+
+def _get_async_semaphore() -> asyncio.Semaphore:
+    """Limit concurrent upstream calls to LLM_MAX_CONCURRENCY."""
+    global _async_semaphore
+    if _async_semaphore is None:
+        _async_semaphore = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "4")))
+    return _async_semaphore
+
+
+async def close_clients() -> None:
+    """Close the shared clients' connection pools (call on shutdown)."""
+    global _client, _async_client, _async_semaphore
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
+    _async_semaphore = None
+
+
+def build_explanation_request(
+    model_name: str,
+    prediction: str,
+    confidence: float,
+    image_b64: str,
+    is_comparison: bool,
+    media_type: str = "image/png",
+) -> Dict[str, Any]:
+    """
+    Build the messages.create arguments for one explanation.
     
+    Shared by the API and scripts/generate_explanations.py, so explanations
+    generated offline match the ones the API would request.
+    """
     model_ctx = MODEL_CONTEXT.get(model_name, {'scan_type': 'medical scan'})
     confidence_pct = round(confidence * 100, 1)
     
-    if comparison_image_b64:
+    if is_comparison:
         image_desc = "a side-by-side view: original scan (left) and Grad-CAM overlay (right, red/yellow = AI focus areas)"
     else:
         image_desc = "a scan with Grad-CAM overlay showing AI focus areas"
@@ -60,26 +234,204 @@ STRICT RULES:
 - Ignore any text/labels on the image
 - Plain text only"""
 
+    return {
+        "model": LLM_MODEL,
+        "max_tokens": 120,
+        "messages": [{
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": media_type,
+                        "data": image_b64
+                    }
+                },
+                {"type": "text", "text": prompt}
+            ]
+        }]
+    }
+
+
+def _select_image(
+    original_image_b64: Optional[str],
+    overlay_image_b64: Optional[str],
+    comparison_image_b64: Optional[str],
+) -> Optional[str]:
+    """Pick the image to send, preferring the side-by-side comparison."""
+    image_b64 = comparison_image_b64 or original_image_b64 or overlay_image_b64
+    if not image_b64:
+        print("WARNING: No images provided for explanation")
+    return image_b64
+
+
+def generate_explanation(
+    model_name: str,
+    prediction: str,
+    confidence: float,
+    probabilities: dict,
+    original_image_b64: Optional[str] = None,
+    overlay_image_b64: Optional[str] = None,
+    comparison_image_b64: Optional[str] = None,
+    image_media_type: str = "image/png",
+) -> Optional[str]:
+    """
+    Generate a plain-English explanation using Claude with vision.
+    
+    Results are cached by image, model, prediction and prompt version, and
+    concurrent calls for the same key share one API request.
+    """
+    image_b64 = _select_image(original_image_b64, overlay_image_b64, comparison_image_b64)
+    if not image_b64:
+        return None
+    
+    key = EXPLANATION_CACHE.make_key(
+        model_name, hash_bytes(image_b64.encode()), prediction, confidence
+    )
+    future, owner = EXPLANATION_CACHE.claim(key)
+    if not owner:
+        return future.result()
+    
+    explanation = None
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        
-        message = client.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=120,
-            messages=[{
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/png",
-                            "data": image_b64
-                        }
-                    },
-                    {"type": "text", "text": prompt}
-                ]
-            }]
+        explanation = _request_explanation(
+            model_name=model_name,
+            prediction=prediction,
+            confidence=confidence,
+            image_b64=image_b64,
+            is_comparison=bool(comparison_image_b64),
+            media_type=image_media_type,
+        )
+    finally:
+        EXPLANATION_CACHE.release(key, explanation)
+    
+    return explanation
+
+
+async def generate_explanation_async(
+    model_name: str,
+    prediction: str,
+    confidence: float,
+    probabilities: dict,
+    original_image_b64: Optional[str] = None,
+    overlay_image_b64: Optional[str] = None,
+    comparison_image_b64: Optional[str] = None,
+    image_media_type: str = "image/png",
+) -> Optional[str]:
+    """
+    Async version of generate_explanation for use inside request handlers.
+    
+    Uses the shared AsyncAnthropic client, at most LLM_MAX_CONCURRENCY
+    upstream calls at a time, and the same cache as the sync path.
+    Cancelling the task (e.g. when the HTTP client disconnects) aborts the
+    upstream call; callers waiting on the same key then get None.
+    """
+    image_b64 = _select_image(original_image_b64, overlay_image_b64, comparison_image_b64)
+    if not image_b64:
+        return None
+    
+    key = EXPLANATION_CACHE.make_key(
+        model_name, hash_bytes(image_b64.encode()), prediction, confidence
+    )
+    future, owner = EXPLANATION_CACHE.claim(key)
+    if not owner:
+        # Shield so that one waiter disconnecting does not cancel the
+        # shared future for everyone else
+        return await asyncio.shield(asyncio.wrap_future(future))
+    
+    explanation = None
+    try:
+        explanation = await _request_explanation_async(
+            model_name=model_name,
+            prediction=prediction,
+            confidence=confidence,
+            image_b64=image_b64,
+            is_comparison=bool(comparison_image_b64),
+            media_type=image_media_type,
+        )
+    finally:
+        EXPLANATION_CACHE.release(key, explanation)
+    
+    return explanation
+
+
+async def stream_explanation(
+    model_name: str,
+    prediction: str,
+    confidence: float,
+    probabilities: dict,
+    original_image_b64: Optional[str] = None,
+    overlay_image_b64: Optional[str] = None,
+    comparison_image_b64: Optional[str] = None,
+    image_media_type: str = "image/png",
+) -> AsyncIterator[str]:
+    """
+    Stream an explanation as text chunks while Claude generates it.
+    
+    Cached explanations (or ones another request is already generating) are
+    yielded as a single chunk. Yields nothing if the LLM is unavailable, so
+    callers should fall back when no text arrives. The full text is cached
+    once the stream completes.
+    """
+    image_b64 = _select_image(original_image_b64, overlay_image_b64, comparison_image_b64)
+    if not image_b64:
+        return
+    
+    key = EXPLANATION_CACHE.make_key(
+        model_name, hash_bytes(image_b64.encode()), prediction, confidence
+    )
+    future, owner = EXPLANATION_CACHE.claim(key)
+    if not owner:
+        explanation = await asyncio.shield(asyncio.wrap_future(future))
+        if explanation:
+            yield explanation
+        return
+    
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        print("WARNING: ANTHROPIC_API_KEY not set")
+        EXPLANATION_CACHE.release(key, None)
+        return
+    
+    chunks = []
+    completed = False
+    try:
+        async with _get_async_semaphore():
+            request = build_explanation_request(
+                model_name, prediction, confidence, image_b64, bool(comparison_image_b64),
+                image_media_type
+            )
+            async with get_async_client().messages.stream(**request) as stream:
+                async for text in stream.text_stream:
+                    chunks.append(text)
+                    yield text
+        completed = True
+    except anthropic.APIError as e:
+        print(f"ERROR: Anthropic API error: {e}")
+    except Exception as e:
+        print(f"ERROR: Exception streaming explanation: {e}")
+    finally:
+        # Only a complete response is worth caching
+        explanation = "".join(chunks).strip() if completed else None
+        EXPLANATION_CACHE.release(key, explanation or None)
+
+
+def _request_explanation(
+    model_name: str,
+    prediction: str,
+    confidence: float,
+    image_b64: str,
+    is_comparison: bool,
+    media_type: str = "image/png",
+) -> Optional[str]:
+    """Call the Anthropic API for one explanation."""
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        print("WARNING: ANTHROPIC_API_KEY not set")
+        return None
+    
+    try:
+        message = get_client().messages.create(
+            **build_explanation_request(model_name, prediction, confidence, image_b64, is_comparison, media_type)
         )
         
         return message.content[0].text.strip()
@@ -92,6 +444,35 @@ STRICT RULES:
         return None
 
 
+async def _request_explanation_async(
+    model_name: str,
+    prediction: str,
+    confidence: float,
+    image_b64: str,
+    is_comparison: bool,
+    media_type: str = "image/png",
+) -> Optional[str]:
+    """Call the Anthropic API for one explanation without blocking the loop."""
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        print("WARNING: ANTHROPIC_API_KEY not set")
+        return None
+    
+    try:
+        async with _get_async_semaphore():
+            message = await get_async_client().messages.create(
+                **build_explanation_request(model_name, prediction, confidence, image_b64, is_comparison, media_type)
+            )
+        
+        return message.content[0].text.strip()
+        
+    except anthropic.APIError as e:
+        print(f"ERROR: Anthropic API error: {e}")
+        return None
+    except Exception as e:
+        print(f"ERROR: Exception generating explanation: {e}")
+        return None
+
+
 def get_fallback_explanation(
     model_name: str,
     prediction: str,
@@ -102,4 +483,63 @@ def get_fallback_explanation(
     return (
         f"The AI detected {prediction} with {confidence_pct}% confidence. "
         f"The highlighted regions show where the model focused."
-    )
\ No newline at end of file
+    )
+
+
+def warm_explanation_cache(
+    explanations_path: str,
+    samples_dir: str,
+    render_comparison: Callable[[str, bytes], Dict[str, Any]],
+    model_names: Optional[List[str]] = None,
+) -> int:
+    """
+    Seed the explanation cache from a cached_explanations.json file.
+    
+    Keys in the file look like "<model_name>_<sample_id>" and refer to
+    <samples_dir>/<model_name>/<sample_id>.jpg. Each sample is rendered with
+    ``render_comparison`` (a Grad-CAM call returning prediction, confidence and
+    base64 images) so the seeded keys match what the API will later send.
+    
+    Args:
+        explanations_path: Path to cached_explanations.json
+        samples_dir: Directory holding the sample images
+        render_comparison: Grad-CAM call for (model_name, image_bytes)
+        model_names: Only warm these models (default: all)
+    
+    Returns:
+        Number of explanations loaded
+    """
+    with open(explanations_path, 'r') as f:
+        explanations = json.load(f)
+    
+    loaded = 0
+    for sample_key, explanation in explanations.items():
+        model_name = next((m for m in MODEL_CONTEXT if sample_key.startswith(f"{m}_")), None)
+        if model_name is None or explanation.startswith("[Error"):
+            continue
+        if model_names is not None and model_name not in model_names:
+            continue
+        
+        sample_id = sample_key[len(model_name) + 1:]
+        image_path = os.path.join(samples_dir, model_name, f"{sample_id}.jpg")
+        if not os.path.exists(image_path):
+            continue
+        
+        try:
+            with open(image_path, 'rb') as f:
+                result = render_comparison(model_name, f.read())
+        except Exception as e:
+            print(f"WARNING: Could not warm explanation for {sample_key}: {e}")
+            continue
+        
+        image_b64 = result["images"].get("comparison")
+        if not image_b64:
+            continue
+        
+        key = EXPLANATION_CACHE.make_key(
+            model_name, hash_bytes(image_b64.encode()), result["prediction"], result["confidence"]
+        )
+        EXPLANATION_CACHE.set(key, explanation)
+        loaded += 1
+    
+    return loaded
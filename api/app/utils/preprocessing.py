@@ -0,0 +1,194 @@
+"""
+Image Preprocessing
+Decodes uploads straight to uint8 arrays and normalizes them into reusable batch buffers.
+"""
+
+import io
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size or pixel limits."""
+    pass
+
+
+# Uploads with more pixels than this are rejected before decoding
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+# Only JPEGs at least this many times larger than the model input are
+# decoded at reduced size; closer to the input size the full decode is cheap
+DRAFT_MIN_RATIO = float(os.getenv("DRAFT_MIN_RATIO", "2"))
+
+
+def decode_image(
+    image_bytes: bytes,
+    target_size: int,
+    max_pixels: Optional[int] = None
+) -> Image.Image:
+    """
+    Decode an upload to an RGB image.
+
+    Large JPEGs are decoded in draft mode: libjpeg scales by 1/2, 1/4 or 1/8
+    in the DCT domain while decoding, to the smallest size that is still at
+    least target_size on both sides, so a 4000 px X-ray is never decoded at
+    full resolution only to be resized to 224 px.
+
+    Args:
+        image_bytes: Raw upload
+        target_size: Side length the image will be resized to
+        max_pixels: Pixel limit (default MAX_IMAGE_PIXELS, 0 disables it)
+
+    Raises:
+        ImageTooLargeError: If the image has more than max_pixels pixels
+    """
+    if max_pixels is None:
+        max_pixels = MAX_IMAGE_PIXELS
+
+    # Opening only parses the header, so the size is known before decoding
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height} ({width * height} pixels), limit is {max_pixels}"
+        )
+
+    if image.format == "JPEG" and min(width, height) >= DRAFT_MIN_RATIO * target_size:
+        image.draft("RGB", (target_size, target_size))
+    return image.convert("RGB")
+
+
+class ImagePreprocessor:
+    """
+    Resize + normalize for one model, without torchvision transforms.
+
+    Each image is resized once (bilinear, like transforms.Resize on PIL
+    images), then converted and normalized in a single pass:
+    ``pixel * scale + offset`` with ``scale = 1 / (255 * std)`` and
+    ``offset = -mean / std``, which equals ToTensor() followed by
+    Normalize(mean, std).
+
+    Batches are written into a per-thread buffer that is reused across calls,
+    so steady-state preprocessing allocates no new input tensors.
+    """
+
+    def __init__(
+        self,
+        image_size: int,
+        mean: Sequence[float],
+        std: Sequence[float],
+        device: Union[str, torch.device] = "cpu"
+    ):
+        """
+        Initialize the preprocessor.
+
+        Args:
+            image_size: Square model input size
+            mean: Per-channel normalization mean (0-1 scale)
+            std: Per-channel normalization std (0-1 scale)
+            device: Device the model runs on
+        """
+        self.image_size = image_size
+        self.device = torch.device(device)
+        # Preprocessors with equal specs produce identical tensors
+        self.spec: Tuple = (image_size, tuple(mean), tuple(std), str(self.device))
+        std_tensor = torch.tensor(std, dtype=torch.float32).view(3, 1, 1)
+        mean_tensor = torch.tensor(mean, dtype=torch.float32).view(3, 1, 1)
+        self.scale = 1.0 / (255.0 * std_tensor)
+        self.offset = -mean_tensor / std_tensor
+        self._local = threading.local()
+
+    def load(self, image: Union[bytes, Image.Image]) -> np.ndarray:
+        """Decode (if needed) and resize to an (H, W, 3) uint8 array."""
+        if isinstance(image, (bytes, bytearray)):
+            image = decode_image(image, self.image_size)
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        size = (self.image_size, self.image_size)
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+        return np.array(image)
+
+    def normalize_into(self, pixels: np.ndarray, out: torch.Tensor) -> torch.Tensor:
+        """Write normalized (3, H, W) float values of a uint8 (H, W, 3) array into out."""
+        out.copy_(torch.from_numpy(pixels).permute(2, 0, 1))
+        return out.mul_(self.scale).add_(self.offset)
+
+    def __call__(self, image: Union[bytes, Image.Image]) -> torch.Tensor:
+        """
+        Preprocess one image into a new (1, 3, H, W) tensor.
+
+        Unlike ``batch`` the result does not share memory with anything, so it
+        is safe to keep.
+        """
+        return self.tensor(self.load(image))
+
+    def tensor(self, pixels: np.ndarray) -> torch.Tensor:
+        """Normalize one loaded image into a new (1, 3, H, W) tensor."""
+        out = torch.empty(1, 3, self.image_size, self.image_size)
+        self.normalize_into(pixels, out[0])
+        return out.to(self.device)
+
+    def batch(self, images: List[np.ndarray]) -> torch.Tensor:
+        """
+        Normalize already loaded images into one (N, 3, H, W) batch.
+
+        The batch is a view of this thread's reusable buffer: it is only valid
+        until the next ``batch`` call on the same thread, so consume it (run
+        the model on it) before preprocessing more images.
+        """
+        buffer = self._buffer(len(images))
+        for pixels, out in zip(images, buffer):
+            self.normalize_into(pixels, out)
+        return buffer.to(self.device)
+
+    def _buffer(self, batch_size: int) -> torch.Tensor:
+        """This thread's input buffer, grown as needed, viewed at batch_size."""
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = torch.empty(batch_size, 3, self.image_size, self.image_size)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+
+def preprocess_shared(
+    image_bytes: bytes,
+    preprocessors: Dict[str, ImagePreprocessor]
+) -> Dict[str, torch.Tensor]:
+    """
+    Preprocess one upload for several models, sharing the work between them.
+
+    The image is decoded once (draft-decoded for the largest input size),
+    resized once per input size and normalized once per distinct spec; models
+    whose preprocessors have the same spec get the same tensor. The tensors
+    are new (not batch buffers) and must be treated as read-only.
+
+    Args:
+        image_bytes: Raw upload
+        preprocessors: Preprocessor by model name
+
+    Returns:
+        Input tensor by model name
+
+    Raises:
+        ImageTooLargeError: If the image exceeds MAX_IMAGE_PIXELS
+    """
+    image = decode_image(image_bytes, max(p.image_size for p in preprocessors.values()))
+
+    resized: Dict[int, np.ndarray] = {}
+    tensors: Dict[Tuple, torch.Tensor] = {}
+    for preprocessor in preprocessors.values():
+        if preprocessor.spec in tensors:
+            continue
+        pixels = resized.get(preprocessor.image_size)
+        if pixels is None:
+            pixels = resized[preprocessor.image_size] = preprocessor.load(image)
+        tensors[preprocessor.spec] = preprocessor.tensor(pixels)
+
+    return {name: tensors[preprocessor.spec] for name, preprocessor in preprocessors.items()}
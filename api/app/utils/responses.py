@@ -0,0 +1,100 @@
+"""
+Binary Responses
+Grad-CAM responses that carry images as raw bytes instead of base64 JSON.
+
+Two containers are supported:
+
+- ``multipart/mixed``: a JSON part named "metadata" followed by one image
+  part per visualization, named after it (e.g. "overlay").
+- ``application/x-medlens-gradcam``: a 4-byte big-endian header length, the
+  JSON header, then the image bytes back to back. The header is the response
+  metadata with ``images`` mapping each name to its ``offset`` (from the end
+  of the header) and ``length``. ``unpack_binary`` reads it back.
+"""
+
+import json
+import struct
+import uuid
+from typing import Any, Dict, Tuple
+
+
+RESPONSE_FORMATS = ["json", "multipart", "binary"]
+BINARY_MEDIA_TYPE = "application/x-medlens-gradcam"
+
+_LENGTH = struct.Struct(">I")
+_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+
+
+def split_images(result: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+    """Separate a binary-mode Grad-CAM result into metadata and raw images."""
+    metadata = {key: value for key, value in result.items() if key != "images"}
+    return metadata, result["images"]
+
+
+def pack_multipart(
+    metadata: Dict[str, Any],
+    images: Dict[str, bytes],
+    media_type: str
+) -> Tuple[bytes, str]:
+    """
+    Build a multipart/mixed body.
+
+    Returns:
+        Tuple of body and its Content-Type (with the boundary)
+    """
+    boundary = uuid.uuid4().hex
+    extension = _EXTENSIONS.get(media_type, "bin")
+
+    parts = [
+        (
+            "Content-Type: application/json\r\n"
+            'Content-Disposition: inline; name="metadata"\r\n',
+            json.dumps(metadata).encode()
+        )
+    ]
+    for name, data in images.items():
+        parts.append((
+            f"Content-Type: {media_type}\r\n"
+            f'Content-Disposition: inline; name="{name}"; filename="{name}.{extension}"\r\n'
+            f"Content-Length: {len(data)}\r\n",
+            data
+        ))
+
+    chunks = []
+    for headers, data in parts:
+        chunks.append(f"--{boundary}\r\n{headers}\r\n".encode())
+        chunks.append(data)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode())
+
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
+
+
+def pack_binary(metadata: Dict[str, Any], images: Dict[str, bytes]) -> bytes:
+    """Build an application/x-medlens-gradcam body."""
+    index = {}
+    offset = 0
+    for name, data in images.items():
+        index[name] = {"offset": offset, "length": len(data)}
+        offset += len(data)
+
+    header = json.dumps({**metadata, "images": index}).encode()
+    return b"".join([_LENGTH.pack(len(header)), header, *images.values()])
+
+
+def unpack_binary(body: bytes) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+    """
+    Read an application/x-medlens-gradcam body.
+
+    Returns:
+        Tuple of metadata (without ``images``) and raw images by name
+    """
+    (header_length,) = _LENGTH.unpack_from(body)
+    start = _LENGTH.size + header_length
+    metadata = json.loads(body[_LENGTH.size:start])
+
+    images = {
+        name: body[start + entry["offset"]:start + entry["offset"] + entry["length"]]
+        for name, entry in metadata.pop("images").items()
+    }
+    return metadata, images
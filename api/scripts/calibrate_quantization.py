@@ -0,0 +1,218 @@
+"""
+Calibrate and cache static int8 models, and report their accuracy delta.
+
+Loads each fp32 model, observes activation ranges on calibration images,
+saves <name>_model.int8.pt next to the weights, then compares fp32 and int8
+predictions. The API uses the int8 model for /predict once the model's
+config sets "quantization": "static".
+
+Evaluation images are read from <eval_dir>/<model>/<class_name>/*.jpg when
+--eval-dir is given, so accuracy can be reported; otherwise the calibration
+images are reused and only fp32/int8 agreement is reported (optimistic, since
+they were also used for calibration).
+
+Usage:
+  cd api
+  python scripts/calibrate_quantization.py [--models pneumonia,...] [--eval-dir DIR] [--report report.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import BrainTumorClassifier, PneumoniaClassifier, BoneFractureClassifier, RetinalOCTClassifier
+from app.models.quantization import quantize_static, quantized_model_path, save_quantized
+
+# Configuration
+SAMPLES_DIR = Path(__file__).parent.parent.parent / "frontend" / "public" / "samples"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+CLASSIFIERS = {
+    "brain_tumor": BrainTumorClassifier,
+    "pneumonia": PneumoniaClassifier,
+    "bone_fracture": BoneFractureClassifier,
+    "retinal_oct": RetinalOCTClassifier,
+}
+
+
+def find_images(directory: Path) -> List[Path]:
+    """All images below directory, sorted."""
+    if not directory.exists():
+        return []
+    return sorted(p for p in directory.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def load_batches(classifier, paths: List[Path], batch_size: int) -> List[torch.Tensor]:
+    """Preprocess images into input batches."""
+    tensors = [classifier.preprocessor(path.read_bytes()) for path in paths]
+    return [torch.cat(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+
+
+def labelled_images(eval_dir: Path, class_names: List[str]) -> Tuple[List[Path], List[int]]:
+    """Images of <eval_dir>/<class_name>/ with their class indices."""
+    paths, labels = [], []
+    for index, name in enumerate(class_names):
+        for path in find_images(eval_dir / name):
+            paths.append(path)
+            labels.append(index)
+    return paths, labels
+
+
+def evaluate(
+    fp32_model,
+    int8_model,
+    batches: List[torch.Tensor],
+    labels: Optional[List[int]]
+) -> Dict[str, float]:
+    """Compare fp32 and int8 predictions on the same inputs."""
+    fp32_probs, int8_probs = [], []
+    fp32_time = int8_time = 0.0
+
+    with torch.no_grad():
+        for batch in batches:
+            start = time.perf_counter()
+            fp32_probs.append(torch.softmax(fp32_model(batch), dim=1))
+            fp32_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            int8_probs.append(torch.softmax(int8_model(batch), dim=1))
+            int8_time += time.perf_counter() - start
+
+    fp32_probs = torch.cat(fp32_probs)
+    int8_probs = torch.cat(int8_probs)
+    fp32_pred = fp32_probs.argmax(1)
+    int8_pred = int8_probs.argmax(1)
+    delta = (fp32_probs - int8_probs).abs()
+
+    report = {
+        "images": len(fp32_pred),
+        "top1_agreement": round((fp32_pred == int8_pred).float().mean().item(), 4),
+        "mean_abs_prob_delta": round(delta.mean().item(), 6),
+        "max_abs_prob_delta": round(delta.max().item(), 6),
+        "fp32_seconds": round(fp32_time, 3),
+        "int8_seconds": round(int8_time, 3),
+        "speedup": round(fp32_time / int8_time, 2) if int8_time else None
+    }
+
+    if labels is not None:
+        target = torch.tensor(labels)
+        report["fp32_accuracy"] = round((fp32_pred == target).float().mean().item(), 4)
+        report["int8_accuracy"] = round((int8_pred == target).float().mean().item(), 4)
+        report["accuracy_delta"] = round(report["int8_accuracy"] - report["fp32_accuracy"], 4)
+
+    return report
+
+
+def calibrate(
+    model_name: str,
+    weights_dir: str,
+    calibration_dir: Path,
+    eval_dir: Optional[Path],
+    max_images: int,
+    batch_size: int
+) -> Optional[Dict[str, float]]:
+    """Build, save and evaluate the int8 model for one classifier."""
+    weights_path = os.path.join(weights_dir, f"{model_name}_model.pth")
+    config_path = os.path.join(weights_dir, f"{model_name}_config.json")
+    if not os.path.exists(weights_path) or not os.path.exists(config_path):
+        print(f"✗ {model_name}: weights not found in {weights_dir}")
+        return None
+
+    classifier = CLASSIFIERS[model_name]()
+    classifier.load_model(weights_path, config_path)
+
+    calibration_paths = find_images(calibration_dir / model_name)[:max_images]
+    if not calibration_paths:
+        print(f"✗ {model_name}: no calibration images in {calibration_dir / model_name}")
+        return None
+    calibration_batches = load_batches(classifier, calibration_paths, batch_size)
+
+    start = time.perf_counter()
+    quantized = quantize_static(classifier.model, calibration_batches)
+    output_path = quantized_model_path(weights_path)
+    save_quantized(quantized, output_path, classifier.weights_hash)
+    print(
+        f"✓ {model_name}: calibrated on {len(calibration_paths)} images "
+        f"in {time.perf_counter() - start:.1f}s -> {os.path.basename(output_path)}"
+    )
+
+    labels = None
+    eval_batches = calibration_batches
+    if eval_dir is not None:
+        eval_paths, labels = labelled_images(eval_dir / model_name, classifier.class_names)
+        if eval_paths:
+            eval_batches = load_batches(classifier, eval_paths, batch_size)
+        else:
+            print(f"⚠ {model_name}: no labelled images in {eval_dir / model_name}, reusing calibration set")
+            labels = None
+
+    report = evaluate(classifier.model, quantized, eval_batches, labels)
+    report["evaluated_on"] = "eval_dir" if labels is not None else "calibration_images"
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate static int8 models")
+    parser.add_argument("--models", default=",".join(CLASSIFIERS), help="Comma-separated model names")
+    parser.add_argument("--weights-dir", default=os.getenv("WEIGHTS_DIR", "./weights"))
+    parser.add_argument("--calibration-dir", type=Path, default=SAMPLES_DIR,
+                        help="Directory with <model>/ subfolders of calibration images")
+    parser.add_argument("--eval-dir", type=Path, default=None,
+                        help="Directory with <model>/<class_name>/ labelled evaluation images")
+    parser.add_argument("--max-images", type=int, default=64, help="Calibration images per model")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--report", type=Path, default=None, help="Write the report as JSON here")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("MedLens - Int8 Calibration")
+    print("=" * 60)
+    print(f"Quantized engine: {torch.backends.quantized.engine}\n")
+
+    reports = {}
+    for model_name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        if model_name not in CLASSIFIERS:
+            print(f"✗ Unknown model: {model_name}")
+            continue
+        report = calibrate(
+            model_name,
+            args.weights_dir,
+            args.calibration_dir,
+            args.eval_dir,
+            args.max_images,
+            args.batch_size
+        )
+        if report is not None:
+            reports[model_name] = report
+
+    print("\n" + "=" * 60)
+    print("Accuracy delta (int8 vs fp32)")
+    print("=" * 60)
+    for model_name, report in reports.items():
+        line = (
+            f"{model_name:15s} agreement {report['top1_agreement']:.2%}  "
+            f"max prob delta {report['max_abs_prob_delta']:.4f}  "
+            f"speedup {report['speedup']}x"
+        )
+        if "accuracy_delta" in report:
+            line += (
+                f"  accuracy {report['fp32_accuracy']:.2%} -> {report['int8_accuracy']:.2%} "
+                f"({report['accuracy_delta']:+.2%})"
+            )
+        print(line)
+
+    if args.report:
+        args.report.write_text(json.dumps(reports, indent=2))
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
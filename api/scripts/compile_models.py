@@ -0,0 +1,78 @@
+"""
+Compile the classifiers ahead of time.
+
+Loads each model with COMPILE_MODELS=1, which traces and freezes it and
+caches the graph as <name>_model.ts.pt next to the weights. Run this at
+image build time for deployments that set COMPILE_MODELS=1, so their first
+requests load the graphs instead of tracing each model (several seconds
+each). The default deployment leaves compilation off: frozen graphs hold a
+second copy of every weight.
+Compare eager and compiled latency with --benchmark.
+
+Usage:
+  cd api
+  python scripts/compile_models.py [weights_dir] [--benchmark]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+os.environ["COMPILE_MODELS"] = "1"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import BrainTumorClassifier, PneumoniaClassifier, BoneFractureClassifier, RetinalOCTClassifier
+from app.models.weights import weights_exist
+
+CLASSIFIERS = {
+    "brain_tumor": BrainTumorClassifier,
+    "pneumonia": PneumoniaClassifier,
+    "bone_fracture": BoneFractureClassifier,
+    "retinal_oct": RetinalOCTClassifier,
+}
+
+
+def benchmark(model, example: torch.Tensor, runs: int = 10) -> float:
+    """Mean seconds per forward pass after two warm-up runs."""
+    with torch.no_grad():
+        model(example)
+        model(example)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(example)
+    return (time.perf_counter() - start) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile classifiers to frozen TorchScript")
+    parser.add_argument("weights_dir", nargs="?", default=os.getenv("WEIGHTS_DIR", "./weights"))
+    parser.add_argument("--benchmark", action="store_true", help="Compare eager and compiled latency")
+    args = parser.parse_args()
+
+    for model_name, classifier_cls in CLASSIFIERS.items():
+        weights_path = os.path.join(args.weights_dir, f"{model_name}_model.pth")
+        config_path = os.path.join(args.weights_dir, f"{model_name}_config.json")
+        if not weights_exist(weights_path) or not os.path.exists(config_path):
+            print(f"✗ {model_name}: weights not found in {args.weights_dir}")
+            continue
+
+        start = time.perf_counter()
+        classifier = classifier_cls()
+        classifier.load_model(weights_path, config_path)
+        if not classifier.compiled:
+            print(f"✗ {model_name}: not compiled (quantization: {classifier.quantization})")
+            continue
+        print(f"✓ {model_name}: compiled in {time.perf_counter() - start:.1f}s")
+
+        if args.benchmark:
+            example = torch.randn(1, 3, classifier.image_size, classifier.image_size, device=classifier.device)
+            eager = benchmark(classifier.model, example)
+            compiled = benchmark(classifier.inference_model, example)
+            print(f"  eager {eager * 1000:.1f} ms, compiled {compiled * 1000:.1f} ms ({eager / compiled:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
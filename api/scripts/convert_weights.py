@@ -0,0 +1,71 @@
+"""
+Convert .pth checkpoints to flat, memory-mappable weight files.
+
+The API loads <name>_model.safetensors instead of <name>_model.pth when it
+exists and is newer. Its tensors are views into one read-only file mapping,
+so a cold start reads nothing up front and uvicorn workers on the same host
+share the pages. With --remove-source the checkpoints are deleted afterwards
+and the API loads the flat files alone (as the Docker image does).
+
+Usage:
+  cd api
+  python scripts/convert_weights.py [weights_dir] [--verify] [--remove-source]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models.weights import flat_weights_path, load_flat, save_flat
+from app.utils.cache import hash_file
+
+
+def convert(weights_path: str, verify: bool = False) -> str:
+    """Convert one checkpoint and return the path written."""
+    state_dict = torch.load(weights_path, map_location="cpu", weights_only=True)
+    flat_path = flat_weights_path(weights_path)
+    save_flat(state_dict, flat_path, metadata={
+        "format": "pt",
+        "source_sha256": hash_file(weights_path)
+    })
+
+    if verify:
+        loaded = load_flat(flat_path)
+        assert loaded.keys() == state_dict.keys(), "tensor names differ"
+        for name, tensor in state_dict.items():
+            assert torch.equal(loaded[name], tensor), f"{name} differs"
+
+    return flat_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("weights_dir", nargs="?", default=os.getenv("WEIGHTS_DIR", "./weights"))
+    parser.add_argument("--verify", action="store_true", help="Reload and compare every tensor")
+    parser.add_argument("--remove-source", action="store_true", help="Delete each .pth once converted")
+    args = parser.parse_args()
+
+    checkpoints = sorted(
+        name for name in os.listdir(args.weights_dir) if name.endswith("_model.pth")
+    )
+    if not checkpoints:
+        print(f"No *_model.pth files found in {args.weights_dir}")
+        return
+
+    for name in checkpoints:
+        weights_path = os.path.join(args.weights_dir, name)
+        start = time.perf_counter()
+        flat_path = convert(weights_path, verify=args.verify)
+        size_mb = os.path.getsize(flat_path) / 1024 / 1024
+        print(f"✓ {name} -> {os.path.basename(flat_path)} ({size_mb:.1f} MB, {time.perf_counter() - start:.2f}s)")
+        if args.remove_source:
+            os.remove(weights_path)
+
+
+if __name__ == "__main__":
+    main()
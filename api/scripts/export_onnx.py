@@ -0,0 +1,75 @@
+"""
+Export the classifiers to ONNX for the ONNX Runtime backend.
+
+Writes <name>_model.onnx next to each <name>_model.pth with a dynamic batch
+axis. Set "backend": "onnxruntime" in a model's config (or
+INFERENCE_BACKEND=onnxruntime for all models) to serve /predict with it.
+If onnxruntime is installed, each export is checked against eager PyTorch.
+
+Usage:
+  cd api
+  python scripts/export_onnx.py [weights_dir] [--opset 17]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+os.environ["INFERENCE_BACKEND"] = "torch"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import BrainTumorClassifier, PneumoniaClassifier, BoneFractureClassifier, RetinalOCTClassifier
+from app.models.backends import OnnxRuntimeBackend, export_onnx, onnx_model_path
+
+CLASSIFIERS = {
+    "brain_tumor": BrainTumorClassifier,
+    "pneumonia": PneumoniaClassifier,
+    "bone_fracture": BoneFractureClassifier,
+    "retinal_oct": RetinalOCTClassifier,
+}
+
+
+def verify(classifier, onnx_path: str) -> None:
+    """Compare ONNX Runtime and eager outputs on a random batch of two."""
+    try:
+        backend = OnnxRuntimeBackend(onnx_path)
+    except ImportError:
+        print("  (onnxruntime not installed, skipping verification)")
+        return
+
+    batch = torch.randn(2, 3, classifier.image_size, classifier.image_size)
+    with torch.no_grad():
+        expected = classifier.model(batch)
+    diff = (backend(batch) - expected).abs().max().item()
+    print(f"  max logit difference vs PyTorch: {diff:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export classifiers to ONNX")
+    parser.add_argument("weights_dir", nargs="?", default=os.getenv("WEIGHTS_DIR", "./weights"))
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    for model_name, classifier_cls in CLASSIFIERS.items():
+        weights_path = os.path.join(args.weights_dir, f"{model_name}_model.pth")
+        config_path = os.path.join(args.weights_dir, f"{model_name}_config.json")
+        if not os.path.exists(weights_path) or not os.path.exists(config_path):
+            print(f"✗ {model_name}: weights not found in {args.weights_dir}")
+            continue
+
+        classifier = classifier_cls()
+        classifier.load_model(weights_path, config_path)
+
+        start = time.perf_counter()
+        onnx_path = onnx_model_path(weights_path)
+        export_onnx(classifier.model, onnx_path, classifier.image_size, opset=args.opset)
+        size_mb = os.path.getsize(onnx_path) / 1024 / 1024
+        print(f"✓ {model_name} -> {os.path.basename(onnx_path)} ({size_mb:.1f} MB, {time.perf_counter() - start:.1f}s)")
+        verify(classifier, onnx_path)
+
+
+if __name__ == "__main__":
+    main()
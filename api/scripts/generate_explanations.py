@@ -2,202 +2,453 @@
 Batch generate LLM explanations for all sample images.
 Run this once to get real, image-specific explanations for Learn Mode.
 
+Works offline from the API: the classifiers are loaded directly and samples
+are discovered from <samples_dir>/<model>/*.jpg. Grad-CAM runs locally in
+batches on a background thread while the explanation requests for finished
+images are already in flight, at most --concurrency at a time and no more
+than --rpm per minute (token bucket). Rate limits, overloads, 5xx errors and
+dropped connections are retried with exponential backoff, honouring
+Retry-After.
+
+Progress is checkpointed to cached_explanations.json (the file the API's
+EXPLANATION_CACHE_WARM_FILE reads) and a manifest next to it, which records
+the hashes of each explanation's source image and model weights plus the
+prompt version. Re-runs (including after an interruption) only ask for
+explanations whose inputs changed; --force asks again for all of them.
+
+To try it without the real API, point it at a local fake server that speaks
+the Messages API:
+  ANTHROPIC_API_KEY=test python scripts/generate_explanations.py --base-url http://127.0.0.1:8765
+
 Usage:
   cd api
-  python scripts/generate_explanations.py
+  python scripts/generate_explanations.py [--models pneumonia,...] [--concurrency 4] [--rpm 50] [--force]
 
 Output:
-  Prints JavaScript object to paste into sampleData.js
+  Writes scripts/cached_explanations.json and prints a JavaScript object to
+  paste into sampleData.js
 """
 
+import argparse
+import asyncio
+import json
 import os
+import random
 import sys
-import json
-import base64
-import requests
+import time
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import anthropic
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import BrainTumorClassifier, PneumoniaClassifier, BoneFractureClassifier, RetinalOCTClassifier
+from app.models.weights import weights_file_hash
+from app.utils.cache import hash_file
+from app.utils.llm import LLM_MODEL, PROMPT_VERSION, build_explanation_request, client_options
 
 # Configuration
-API_URL = "http://localhost:8000"
 SAMPLES_DIR = Path(__file__).parent.parent.parent / "frontend" / "public" / "samples"
+OUTPUT_FILE = Path(__file__).parent / "cached_explanations.json"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+MANIFEST_VERSION = 1
 
-# Sample images structure (matches sampleData.js)
-SAMPLE_IMAGES = {
-    "brain_tumor": [
-        {"id": "glioma_1", "label": "Glioma", "path": "brain_tumor/glioma_1.jpg"},
-        {"id": "glioma_2", "label": "Glioma", "path": "brain_tumor/glioma_2.jpg"},
-        {"id": "meningioma_1", "label": "Meningioma", "path": "brain_tumor/meningioma_1.jpg"},
-        {"id": "meningioma_2", "label": "Meningioma", "path": "brain_tumor/meningioma_2.jpg"},
-        {"id": "pituitary_1", "label": "Pituitary", "path": "brain_tumor/pituitary_1.jpg"},
-        {"id": "pituitary_2", "label": "Pituitary", "path": "brain_tumor/pituitary_2.jpg"},
-        {"id": "notumor_1", "label": "No Tumor", "path": "brain_tumor/notumor_1.jpg"},
-        {"id": "notumor_2", "label": "No Tumor", "path": "brain_tumor/notumor_2.jpg"},
-    ],
-    "pneumonia": [
-        {"id": "normal_1", "label": "Normal", "path": "pneumonia/normal_1.jpg"},
-        {"id": "normal_2", "label": "Normal", "path": "pneumonia/normal_2.jpg"},
-        {"id": "pneumonia_1", "label": "Pneumonia", "path": "pneumonia/pneumonia_1.jpg"},
-        {"id": "pneumonia_2", "label": "Pneumonia", "path": "pneumonia/pneumonia_2.jpg"},
-    ],
-    "retinal_oct": [
-        {"id": "cnv_1", "label": "CNV", "path": "retinal_oct/cnv_1.jpg"},
-        {"id": "cnv_2", "label": "CNV", "path": "retinal_oct/cnv_2.jpg"},
-        {"id": "dme_1", "label": "DME", "path": "retinal_oct/dme_1.jpg"},
-        {"id": "dme_2", "label": "DME", "path": "retinal_oct/dme_2.jpg"},
-        {"id": "drusen_1", "label": "Drusen", "path": "retinal_oct/drusen_1.jpg"},
-        {"id": "drusen_2", "label": "Drusen", "path": "retinal_oct/drusen_2.jpg"},
-        {"id": "normal_1", "label": "Normal", "path": "retinal_oct/normal_1.jpg"},
-        {"id": "normal_2", "label": "Normal", "path": "retinal_oct/normal_2.jpg"},
-    ],
-    "bone_fracture": [
-        {"id": "fractured_1", "label": "Fractured", "path": "bone_fracture/fractured_1.jpg"},
-        {"id": "fractured_2", "label": "Fractured", "path": "bone_fracture/fractured_2.jpg"},
-        {"id": "fractured_3", "label": "Fractured", "path": "bone_fracture/fractured_3.jpg"},
-        {"id": "fractured_4", "label": "Fractured", "path": "bone_fracture/fractured_4.jpg"},
-        {"id": "normal_1", "label": "Not Fractured", "path": "bone_fracture/normal_1.jpg"},
-        {"id": "normal_2", "label": "Not Fractured", "path": "bone_fracture/normal_2.jpg"},
-        {"id": "normal_3", "label": "Not Fractured", "path": "bone_fracture/normal_3.jpg"},
-        {"id": "normal_4", "label": "Not Fractured", "path": "bone_fracture/normal_4.jpg"},
-    ],
+CLASSIFIERS = {
+    "brain_tumor": BrainTumorClassifier,
+    "pneumonia": PneumoniaClassifier,
+    "bone_fracture": BoneFractureClassifier,
+    "retinal_oct": RetinalOCTClassifier,
 }
 
+# HTTP statuses worth retrying besides 5xx
+RETRY_STATUSES = {408, 409, 429}
 
-def check_api():
-    """Check if API is running."""
-    try:
-        response = requests.get(f"{API_URL}/health")
-        if response.status_code == 200:
-            data = response.json()
-            if not data.get("llm_enabled"):
-                print("WARNING: LLM not enabled. Set ANTHROPIC_API_KEY in .env")
-                return False
-            return True
-    except requests.ConnectionError:
-        pass
-    
-    print(f"ERROR: Cannot connect to API at {API_URL}")
-    print("Make sure the API is running: uvicorn app.main:app --reload")
-    return False
-
-
-def get_explanation(model: str, image_path: Path) -> dict:
+# (explanation key "<model>_<id>", source image path)
+Sample = Tuple[str, Path]
+
+
+class TokenBucket:
+    """
+    Request rate limiter: ``rate`` requests per second with bursts of up to
+    ``capacity``. ``pause`` empties the bucket for a while, e.g. after a 429.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every request for at least seconds."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class Checkpoint:
     """
-    Get prediction and explanation for a single image.
-    Returns dict with prediction, confidence, and explanation.
+    cached_explanations.json plus its manifest, saved atomically.
+
+    Saves are throttled to one per ``interval`` seconds; call ``save(force=True)``
+    at the end of a run.
     """
-    if not image_path.exists():
-        return {"error": f"File not found: {image_path}"}
-    
-    # Step 1: Get Grad-CAM prediction
-    with open(image_path, "rb") as f:
-        files = {"file": (image_path.name, f, "image/jpeg")}
-        response = requests.post(
-            f"{API_URL}/predict/{model}/gradcam",
-            files=files
+
+    def __init__(self, output_path: Path, interval: float):
+        self.output_path = output_path
+        self.manifest_path = output_path.with_suffix(".manifest.json")
+        self.interval = interval
+        self.saved_at = 0.0
+        self.explanations: Dict[str, str] = {}
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+
+        try:
+            self.explanations = json.loads(output_path.read_text())
+        except (OSError, ValueError):
+            pass
+        try:
+            manifest = json.loads(self.manifest_path.read_text())
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.manifest = manifest.get("explanations", {})
+        except (OSError, ValueError):
+            pass
+
+    def is_current(self, key: str, expected: Dict[str, Any]) -> bool:
+        """Whether key has an explanation generated from the same inputs."""
+        entry = self.manifest.get(key)
+        if entry is None or key not in self.explanations:
+            return False
+        return all(entry.get(field) == value for field, value in expected.items())
+
+    def record(self, key: str, explanation: str, entry: Dict[str, Any]) -> None:
+        self.explanations[key] = explanation
+        self.manifest[key] = entry
+        self.save()
+
+    def save(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self.saved_at < self.interval:
+            return
+        # Explanations first, so the manifest never vouches for a missing entry
+        _write_json(self.output_path, dict(sorted(self.explanations.items())))
+        _write_json(
+            self.manifest_path,
+            {"version": MANIFEST_VERSION, "explanations": dict(sorted(self.manifest.items()))}
         )
-    
-    if response.status_code != 200:
-        return {"error": f"Gradcam failed: {response.text}"}
-    
-    result = response.json()
-    prediction = result["prediction"]
-    confidence = result["confidence"]
-    comparison_b64 = result["images"].get("comparison")
-    
-    if not comparison_b64:
-        return {"error": "No comparison image returned"}
-    
-    # Step 2: Get explanation
-    comparison_bytes = base64.b64decode(comparison_b64)
-    
-    files = {"file": ("comparison.png", comparison_bytes, "image/png")}
-    params = {"prediction": prediction, "confidence": str(confidence)}
-    
-    response = requests.post(
-        f"{API_URL}/explain/{model}",
-        files=files,
-        params=params
+        self.saved_at = time.monotonic()
+
+
+def _write_json(path: Path, data: Any) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2) + "\n")
+    os.replace(tmp_path, path)
+
+
+def find_samples(samples_dir: Path, model_name: str) -> List[Sample]:
+    """Sample images of one model, keyed <model>_<id>, sorted."""
+    model_dir = samples_dir / model_name
+    if not model_dir.is_dir():
+        return []
+    return [
+        (f"{model_name}_{path.stem}", path)
+        for path in sorted(model_dir.iterdir())
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+
+
+def retry_delay(error: Exception, attempt: int, max_backoff: float) -> Optional[float]:
+    """Seconds to wait before retrying error, or None if it is not retryable."""
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code not in RETRY_STATUSES and error.status_code < 500:
+            return None
+        retry_after = error.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(max_backoff, float(retry_after))
+            except ValueError:
+                pass
+    elif not isinstance(error, anthropic.APIConnectionError):
+        return None
+    # Exponential backoff with jitter so parallel retries spread out
+    return min(max_backoff, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+async def request_explanation(
+    client: anthropic.AsyncAnthropic,
+    limiter: TokenBucket,
+    model_name: str,
+    key: str,
+    result: Dict[str, Any],
+    max_retries: int,
+    max_backoff: float
+) -> str:
+    """
+    Ask for one explanation of a Grad-CAM result, retrying transient errors.
+
+    Raises:
+        anthropic.APIError: If the request fails for good
+    """
+    request = build_explanation_request(
+        model_name,
+        result["prediction"],
+        result["confidence"],
+        result["images"]["comparison"],
+        True,
+        result["image_media_type"]
+    )
+
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            message = await client.messages.create(**request)
+            return message.content[0].text.strip()
+        except anthropic.APIError as e:
+            delay = retry_delay(e, attempt, max_backoff)
+            if delay is None or attempt == max_retries:
+                raise
+            if isinstance(e, anthropic.RateLimitError):
+                limiter.pause(delay)
+            print(f"  ⚠ {key}: {type(e).__name__}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def load_classifier(model_name: str, weights_dir: str):
+    classifier = CLASSIFIERS[model_name]()
+    classifier.load_model(
+        os.path.join(weights_dir, f"{model_name}_model.pth"),
+        os.path.join(weights_dir, f"{model_name}_config.json")
     )
-    
-    if response.status_code != 200:
-        return {"error": f"Explanation failed: {response.text}"}
-    
-    explanation_data = response.json()
-    
-    return {
-        "prediction": prediction,
-        "confidence": confidence,
-        "explanation": explanation_data.get("explanation", "")
-    }
+    return classifier
+
+
+def render_batch(classifier, samples: List[Sample]) -> List[Any]:
+    """Grad-CAM (with the side-by-side comparison) for a batch of samples."""
+    images = []
+    for _, path in samples:
+        try:
+            images.append(path.read_bytes())
+        except OSError as e:
+            images.append(e)
+    readable = [i for i, data in enumerate(images) if isinstance(data, bytes)]
+    results = list(images)
+    rendered = classifier.get_gradcam_batch([images[i] for i in readable], output_type="all")
+    for i, result in zip(readable, rendered):
+        results[i] = result
+    return results
+
+
+async def run(args, tasks: Dict[str, List[Sample]], expected: Dict[str, Dict[str, Any]], checkpoint: Checkpoint):
+    """Render Grad-CAM and request explanations concurrently."""
+    options = client_options()
+    if args.base_url:
+        options["base_url"] = args.base_url
+    # Retries are handled here, with the shared rate limiter
+    options["max_retries"] = 0
+    client = anthropic.AsyncAnthropic(**options)
+    limiter = TokenBucket(rate=args.rpm / 60, capacity=args.concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2 * args.concurrency)
+    counts = {"done": 0, "failed": 0}
+    total = sum(len(samples) for samples in tasks.values())
+
+    async def produce():
+        for model_name, samples in tasks.items():
+            try:
+                classifier = await asyncio.to_thread(load_classifier, model_name, args.weights_dir)
+            except Exception as e:
+                print(f"✗ {model_name}: could not load model: {e}")
+                counts["failed"] += len(samples)
+                continue
+            for start in range(0, len(samples), args.batch_size):
+                chunk = samples[start:start + args.batch_size]
+                try:
+                    results = await asyncio.to_thread(render_batch, classifier, chunk)
+                except Exception as e:
+                    results = [e] * len(chunk)
+                for (key, _), result in zip(chunk, results):
+                    await queue.put((model_name, key, result))
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            model_name, key, result = item
+            if isinstance(result, Exception):
+                counts["failed"] += 1
+                print(f"  ✗ {key}: Grad-CAM failed: {result}")
+                continue
+            try:
+                explanation = await request_explanation(
+                    client, limiter, model_name, key, result, args.max_retries, args.max_backoff
+                )
+            except anthropic.APIError as e:
+                counts["failed"] += 1
+                print(f"  ✗ {key}: {e}")
+                continue
+            if not explanation:
+                counts["failed"] += 1
+                print(f"  ✗ {key}: empty explanation")
+                continue
+
+            checkpoint.record(key, explanation, {
+                **expected[key],
+                "prediction": result["prediction"],
+                "confidence": round(result["confidence"], 4)
+            })
+            counts["done"] += 1
+            done = counts["done"] + counts["failed"]
+            print(f"  ({done}/{total}) {key}: OK ({result['prediction']}, {result['confidence'] * 100:.1f}%)")
+
+    try:
+        await asyncio.gather(produce(), *(consume() for _ in range(args.concurrency)))
+    finally:
+        await client.close()
+
+    return counts
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate LLM explanations for the sample images")
+    parser.add_argument("--models", default=",".join(CLASSIFIERS), help="Comma-separated model names")
+    parser.add_argument("--weights-dir", default=os.getenv("WEIGHTS_DIR", "./weights"))
+    parser.add_argument("--samples-dir", type=Path, default=SAMPLES_DIR,
+                        help="Directory with <model>/ subfolders of sample images")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE, help="Explanations JSON to update")
+    parser.add_argument("--base-url", default=None,
+                        help="Messages API base URL (default ANTHROPIC_BASE_URL or the real API)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per Grad-CAM pass")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM requests in flight")
+    parser.add_argument("--rpm", type=float, default=50, help="LLM requests per minute")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per request")
+    parser.add_argument("--max-backoff", type=float, default=60, help="Longest wait between retries (s)")
+    parser.add_argument("--checkpoint-seconds", type=float, default=2, help="Minimum time between checkpoints")
+    parser.add_argument("--force", action="store_true", help="Regenerate all explanations")
+    parser.add_argument("--trust-existing", action="store_true",
+                        help="Adopt explanations that have no manifest entry yet instead of regenerating them")
+    args = parser.parse_args()
+    args.batch_size = max(1, args.batch_size)
+    args.concurrency = max(1, args.concurrency)
+
     print("=" * 60)
     print("MedLens - Batch Generate Explanations")
     print("=" * 60)
-    
-    # Check API
-    if not check_api():
+
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        print("\nERROR: ANTHROPIC_API_KEY not set. Set it in .env")
         sys.exit(1)
-    
-    print(f"\nSamples directory: {SAMPLES_DIR}")
-    
-    if not SAMPLES_DIR.exists():
-        print(f"ERROR: Samples directory not found: {SAMPLES_DIR}")
-        print("Update SAMPLES_DIR path in this script.")
+    if not args.samples_dir.exists():
+        print(f"\nERROR: Samples directory not found: {args.samples_dir}")
         sys.exit(1)
-    
-    # Generate explanations
-    explanations = {}
-    total = sum(len(samples) for samples in SAMPLE_IMAGES.values())
-    current = 0
-    
-    print(f"\nGenerating explanations for {total} images...")
-    print("This will take ~{} minutes\n".format(total * 4 // 60 + 1))
-    
-    for model, samples in SAMPLE_IMAGES.items():
-        print(f"\n[{model}]")
-        
-        for sample in samples:
-            current += 1
-            image_path = SAMPLES_DIR / sample["path"]
-            key = f"{model}_{sample['id']}"
-            
-            print(f"  ({current}/{total}) {sample['id']}...", end=" ", flush=True)
-            
-            result = get_explanation(model, image_path)
-            
-            if "error" in result:
-                print(f"ERROR: {result['error']}")
-                explanations[key] = f"[Error generating explanation for {sample['label']}]"
+
+    checkpoint = Checkpoint(args.output, args.checkpoint_seconds)
+    if args.force:
+        checkpoint.manifest = {}
+
+    print(f"\nSamples directory: {args.samples_dir}")
+    print(f"Output: {args.output}\n")
+
+    # Work out what needs generating
+    tasks: Dict[str, List[Sample]] = {}
+    expected: Dict[str, Dict[str, Any]] = {}
+    total = reused = 0
+
+    for model_name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        if model_name not in CLASSIFIERS:
+            print(f"✗ Unknown model: {model_name}")
+            continue
+        weights_path = os.path.join(args.weights_dir, f"{model_name}_model.pth")
+        config_path = os.path.join(args.weights_dir, f"{model_name}_config.json")
+        if not os.path.exists(weights_path) or not os.path.exists(config_path):
+            print(f"✗ {model_name}: weights not found in {args.weights_dir}")
+            continue
+
+        samples = find_samples(args.samples_dir, model_name)
+        weights_hash = weights_file_hash(weights_path)
+        pending = []
+        for key, path in samples:
+            expected[key] = {
+                "source": path.relative_to(args.samples_dir).as_posix(),
+                "source_sha256": hash_file(str(path)),
+                "weights_sha256": weights_hash,
+                "prompt_version": PROMPT_VERSION,
+                "llm_model": LLM_MODEL
+            }
+            if (
+                args.trust_existing
+                and key not in checkpoint.manifest
+                and not checkpoint.explanations.get(key, "[Error").startswith("[Error")
+            ):
+                checkpoint.manifest[key] = expected[key]
+            if checkpoint.is_current(key, expected[key]):
+                reused += 1
             else:
-                print(f"OK ({result['prediction']}, {result['confidence']*100:.1f}%)")
-                explanations[key] = result["explanation"]
-    
+                pending.append((key, path))
+
+        total += len(samples)
+        print(f"[{model_name}] {len(samples)} samples, {len(pending)} to generate")
+        if pending:
+            tasks[model_name] = pending
+
+    counts = {"done": 0, "failed": 0}
+    start = time.perf_counter()
+    if tasks:
+        print(f"\nGenerating with {args.concurrency} concurrent request(s), up to {args.rpm:g}/min...\n")
+        try:
+            counts = asyncio.run(run(args, tasks, expected, checkpoint))
+        except KeyboardInterrupt:
+            print("\n⚠ Interrupted, progress saved; run again to resume")
+            sys.exit(130)
+        finally:
+            checkpoint.save(force=True)
+    else:
+        checkpoint.save(force=True)
+
     # Output as JavaScript
     print("\n" + "=" * 60)
     print("COPY THE FOLLOWING INTO sampleData.js:")
     print("=" * 60 + "\n")
-    
+
     print("// Pre-cached LLM explanations for Learn Mode (auto-generated)")
     print("// Generated by: python scripts/generate_explanations.py")
     print("export const cachedExplanations = {")
-    
-    for key, explanation in explanations.items():
+
+    for key, explanation in sorted(checkpoint.explanations.items()):
         # Escape quotes and newlines
         escaped = explanation.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
         print(f'  "{key}": "{escaped}",')
-    
+
     print("};")
-    
-    # Also save as JSON for backup
-    output_file = Path(__file__).parent / "cached_explanations.json"
-    with open(output_file, "w") as f:
-        json.dump(explanations, f, indent=2)
-    
-    print(f"\n\nAlso saved to: {output_file}")
-    print("Done!")
+
+    # Summary
+    print("\n" + "=" * 60)
+    print(
+        f"Complete! {counts['done']} generated, {reused} unchanged, {counts['failed']} failed "
+        f"({total} samples, {time.perf_counter() - start:.1f}s)"
+    )
+    print(f"Saved to: {args.output}")
+    print("=" * 60)
+
+    if counts["failed"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
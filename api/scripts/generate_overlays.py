@@ -2,172 +2,271 @@
 Batch generate Grad-CAM overlay images for all sample images.
 Run this once to pre-cache overlays for instant quiz feedback.
 
+Works offline: the classifiers are loaded directly (no running API needed).
+Samples are discovered from <samples_dir>/<model>/*.jpg, and each model's
+images are rendered in batches (one forward and one backward pass per batch)
+in a pool of worker processes, one model per task.
+
+A manifest (overlays/manifest.json) records the hashes of each overlay's
+source image, model weights and render settings, plus the overlay itself.
+Overlays whose inputs are unchanged are skipped, so re-runs only render new
+or changed samples; --force renders everything again.
+
 Usage:
   cd api
-  python scripts/generate_overlays.py
+  python scripts/generate_overlays.py [--models pneumonia,...] [--workers 2] [--batch-size 8] [--force]
 
 Output:
-  Saves overlay images to frontend/public/samples/overlays/
+  Saves overlay images to frontend/public/samples/overlays/<model>_<id>.png
 """
 
+import argparse
+import json
+import multiprocessing
 import os
 import sys
-import base64
-import requests
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import BrainTumorClassifier, PneumoniaClassifier, BoneFractureClassifier, RetinalOCTClassifier
+from app.models.weights import weights_file_hash
+from app.utils.cache import hash_file
+from app.utils.encoding import ImageEncoding
 
 # Configuration
-API_URL = "http://localhost:8000"
 SAMPLES_DIR = Path(__file__).parent.parent.parent / "frontend" / "public" / "samples"
-OUTPUT_DIR = SAMPLES_DIR / "overlays"
-
-# Sample images structure (matches sampleData.js)
-SAMPLE_IMAGES = {
-    "brain_tumor": [
-        {"id": "glioma_1", "path": "brain_tumor/glioma_1.jpg"},
-        {"id": "glioma_2", "path": "brain_tumor/glioma_2.jpg"},
-        {"id": "meningioma_1", "path": "brain_tumor/meningioma_1.jpg"},
-        {"id": "meningioma_2", "path": "brain_tumor/meningioma_2.jpg"},
-        {"id": "pituitary_1", "path": "brain_tumor/pituitary_1.jpg"},
-        {"id": "pituitary_2", "path": "brain_tumor/pituitary_2.jpg"},
-        {"id": "notumor_1", "path": "brain_tumor/notumor_1.jpg"},
-        {"id": "notumor_2", "path": "brain_tumor/notumor_2.jpg"},
-    ],
-    "pneumonia": [
-        {"id": "normal_1", "path": "pneumonia/normal_1.jpg"},
-        {"id": "normal_2", "path": "pneumonia/normal_2.jpg"},
-        {"id": "pneumonia_1", "path": "pneumonia/pneumonia_1.jpg"},
-        {"id": "pneumonia_2", "path": "pneumonia/pneumonia_2.jpg"},
-    ],
-    "retinal_oct": [
-        {"id": "cnv_1", "path": "retinal_oct/cnv_1.jpg"},
-        {"id": "cnv_2", "path": "retinal_oct/cnv_2.jpg"},
-        {"id": "dme_1", "path": "retinal_oct/dme_1.jpg"},
-        {"id": "dme_2", "path": "retinal_oct/dme_2.jpg"},
-        {"id": "drusen_1", "path": "retinal_oct/drusen_1.jpg"},
-        {"id": "drusen_2", "path": "retinal_oct/drusen_2.jpg"},
-        {"id": "normal_1", "path": "retinal_oct/normal_1.jpg"},
-        {"id": "normal_2", "path": "retinal_oct/normal_2.jpg"},
-    ],
-    "bone_fracture": [
-        {"id": "fractured_1", "path": "bone_fracture/fractured_1.jpg"},
-        {"id": "fractured_2", "path": "bone_fracture/fractured_2.jpg"},
-        {"id": "fractured_3", "path": "bone_fracture/fractured_3.jpg"},
-        {"id": "fractured_4", "path": "bone_fracture/fractured_4.jpg"},
-        {"id": "normal_1", "path": "bone_fracture/normal_1.jpg"},
-        {"id": "normal_2", "path": "bone_fracture/normal_2.jpg"},
-        {"id": "normal_3", "path": "bone_fracture/normal_3.jpg"},
-        {"id": "normal_4", "path": "bone_fracture/normal_4.jpg"},
-    ],
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+CLASSIFIERS = {
+    "brain_tumor": BrainTumorClassifier,
+    "pneumonia": PneumoniaClassifier,
+    "bone_fracture": BoneFractureClassifier,
+    "retinal_oct": RetinalOCTClassifier,
 }
 
+# (output filename, source image path)
+Sample = Tuple[str, Path]
 
-def check_api():
-    """Check if API is running."""
+
+def find_samples(samples_dir: Path, model_name: str) -> List[Sample]:
+    """Sample images of one model, as <model>_<id>.png outputs, sorted."""
+    model_dir = samples_dir / model_name
+    if not model_dir.is_dir():
+        return []
+    return [
+        (f"{model_name}_{path.stem}.png", path)
+        for path in sorted(model_dir.iterdir())
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+
+
+def load_manifest(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Manifest entries by output filename (empty if missing or outdated)."""
     try:
-        response = requests.get(f"{API_URL}/health")
-        return response.status_code == 200
-    except requests.ConnectionError:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("overlays", {})
+
+
+def save_manifest(path: Path, entries: Dict[str, Dict[str, Any]]) -> None:
+    """Write the manifest atomically, so an interrupted run leaves a valid one."""
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(
+        {"version": MANIFEST_VERSION, "overlays": dict(sorted(entries.items()))},
+        indent=2
+    ))
+    os.replace(tmp_path, path)
+
+
+def is_current(entry: Optional[Dict[str, Any]], expected: Dict[str, Any], output_path: Path) -> bool:
+    """Whether an overlay was rendered from the same inputs and is still on disk, unmodified."""
+    if entry is None or not output_path.exists():
+        return False
+    if any(entry.get(key) != value for key, value in expected.items()):
         return False
+    return entry.get("output_sha256") == hash_file(str(output_path))
 
 
-def generate_overlay(model: str, image_path: Path) -> bytes | None:
+def render_model(
+    model_name: str,
+    weights_dir: str,
+    samples: List[Sample],
+    batch_size: int,
+    compress_level: int,
+    threads: int
+) -> List[Tuple[str, Optional[bytes], Optional[str]]]:
     """
-    Generate Grad-CAM overlay for a single image.
-    Returns overlay image bytes or None on error.
+    Render the overlays of one model. Runs in a worker process.
+
+    Returns:
+        (output filename, PNG bytes or None, error or None) per sample
     """
-    if not image_path.exists():
-        print(f"File not found: {image_path}")
-        return None
-    
-    with open(image_path, "rb") as f:
-        files = {"file": (image_path.name, f, "image/jpeg")}
-        response = requests.post(
-            f"{API_URL}/predict/{model}/gradcam",
-            files=files
-        )
-    
-    if response.status_code != 200:
-        print(f"API error: {response.text}")
-        return None
-    
-    result = response.json()
-    overlay_b64 = result.get("images", {}).get("overlay")
-    
-    if not overlay_b64:
-        print("No overlay in response")
-        return None
-    
-    return base64.b64decode(overlay_b64)
+    import torch
+    torch.set_num_threads(threads)
+
+    classifier = CLASSIFIERS[model_name]()
+    classifier.load_model(
+        os.path.join(weights_dir, f"{model_name}_model.pth"),
+        os.path.join(weights_dir, f"{model_name}_config.json")
+    )
+    encoding = ImageEncoding.create("png", compress_level=compress_level, binary=True)
+
+    rendered = []
+    for start in range(0, len(samples), batch_size):
+        chunk = samples[start:start + batch_size]
+        images = []
+        for _, path in chunk:
+            try:
+                images.append(path.read_bytes())
+            except OSError as e:
+                images.append(b"")
+                print(f"⚠ Could not read {path}: {e}")
+
+        results = classifier.get_gradcam_batch(images, output_type="overlay", encoding=encoding)
+        for (output_name, _), result in zip(chunk, results):
+            if isinstance(result, Exception):
+                rendered.append((output_name, None, str(result)))
+            else:
+                rendered.append((output_name, result["images"]["overlay"], None))
+
+    return rendered
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Render Grad-CAM overlays for the sample images")
+    parser.add_argument("--models", default=",".join(CLASSIFIERS), help="Comma-separated model names")
+    parser.add_argument("--weights-dir", default=os.getenv("WEIGHTS_DIR", "./weights"))
+    parser.add_argument("--samples-dir", type=Path, default=SAMPLES_DIR,
+                        help="Directory with <model>/ subfolders of sample images")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Worker processes (one model per process at a time)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per Grad-CAM pass")
+    parser.add_argument("--compress-level", type=int, default=6, help="PNG compression level (0-9)")
+    parser.add_argument("--force", action="store_true", help="Render all overlays, even unchanged ones")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("MedLens - Generate Grad-CAM Overlays")
     print("=" * 60)
-    
-    # Check API
-    if not check_api():
-        print(f"\nERROR: Cannot connect to API at {API_URL}")
-        print("Make sure the API is running: uvicorn app.main:app --reload")
-        sys.exit(1)
-    
-    print(f"\n✓ API connected")
-    print(f"Samples directory: {SAMPLES_DIR}")
-    print(f"Output directory: {OUTPUT_DIR}")
-    
-    if not SAMPLES_DIR.exists():
-        print(f"\nERROR: Samples directory not found: {SAMPLES_DIR}")
+
+    if not args.samples_dir.exists():
+        print(f"\nERROR: Samples directory not found: {args.samples_dir}")
         sys.exit(1)
-    
-    # Create output directory
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    print(f"✓ Output directory ready")
-    
-    # Generate overlays
-    total = sum(len(samples) for samples in SAMPLE_IMAGES.values())
-    current = 0
-    success = 0
-    failed = 0
-    
-    print(f"\nGenerating {total} overlays...\n")
-    
-    for model, samples in SAMPLE_IMAGES.items():
-        print(f"[{model}]")
-        
-        for sample in samples:
-            current += 1
-            image_path = SAMPLES_DIR / sample["path"]
-            output_filename = f"{model}_{sample['id']}.png"
-            output_path = OUTPUT_DIR / output_filename
-            
-            print(f"  ({current}/{total}) {sample['id']}...", end=" ", flush=True)
-            
-            # Skip if already exists
-            if output_path.exists():
-                print("SKIPPED (exists)")
-                success += 1
-                continue
-            
-            overlay_bytes = generate_overlay(model, image_path)
-            
-            if overlay_bytes:
-                with open(output_path, "wb") as f:
-                    f.write(overlay_bytes)
-                print(f"OK ({len(overlay_bytes) // 1024}KB)")
-                success += 1
+
+    output_dir = args.samples_dir / "overlays"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = {} if args.force else load_manifest(manifest_path)
+    settings = f"overlay:png{args.compress_level}"
+
+    print(f"Samples directory: {args.samples_dir}")
+    print(f"Output directory: {output_dir}\n")
+
+    # Work out what needs rendering
+    tasks: Dict[str, List[Sample]] = {}
+    expected: Dict[str, Dict[str, Any]] = {}
+    total = skipped = 0
+
+    for model_name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        if model_name not in CLASSIFIERS:
+            print(f"✗ Unknown model: {model_name}")
+            continue
+        weights_path = os.path.join(args.weights_dir, f"{model_name}_model.pth")
+        config_path = os.path.join(args.weights_dir, f"{model_name}_config.json")
+        if not os.path.exists(weights_path) or not os.path.exists(config_path):
+            print(f"✗ {model_name}: weights not found in {args.weights_dir}")
+            continue
+
+        samples = find_samples(args.samples_dir, model_name)
+        weights_hash = weights_file_hash(weights_path)
+        pending = []
+        for output_name, path in samples:
+            expected[output_name] = {
+                "source": path.relative_to(args.samples_dir).as_posix(),
+                "source_sha256": hash_file(str(path)),
+                "weights_sha256": weights_hash,
+                "settings": settings
+            }
+            if is_current(manifest.get(output_name), expected[output_name], output_dir / output_name):
+                skipped += 1
             else:
-                print("FAILED")
-                failed += 1
-    
+                pending.append((output_name, path))
+
+        total += len(samples)
+        print(f"[{model_name}] {len(samples)} samples, {len(pending)} to render")
+        if pending:
+            tasks[model_name] = pending
+
+    rendered = failed = 0
+    start = time.perf_counter()
+
+    if tasks:
+        workers = max(1, min(args.workers, len(tasks)))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"\nRendering in {workers} process(es), {threads} thread(s) each...\n")
+
+        # Spawn rather than fork: forking a process that already holds
+        # PyTorch thread pools can deadlock the child.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(
+                    render_model,
+                    model_name,
+                    args.weights_dir,
+                    samples,
+                    max(1, args.batch_size),
+                    args.compress_level,
+                    threads
+                ): model_name
+                for model_name, samples in tasks.items()
+            }
+
+            for future in as_completed(futures):
+                model_name = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"✗ {model_name}: {e}")
+                    failed += len(tasks[model_name])
+                    continue
+
+                for output_name, data, error in results:
+                    if data is None:
+                        print(f"  ✗ {output_name}: {error}")
+                        failed += 1
+                        continue
+                    output_path = output_dir / output_name
+                    output_path.write_bytes(data)
+                    manifest[output_name] = {
+                        **expected[output_name],
+                        "output_sha256": hash_file(str(output_path))
+                    }
+                    rendered += 1
+
+                # Record progress per model so an interrupted run resumes
+                save_manifest(manifest_path, manifest)
+                print(f"✓ {model_name}: {len(results)} overlays ({time.perf_counter() - start:.1f}s)")
+    else:
+        save_manifest(manifest_path, manifest)
+
     # Summary
     print("\n" + "=" * 60)
-    print(f"Complete! {success}/{total} overlays generated")
-    if failed > 0:
-        print(f"Failed: {failed}")
-    print(f"\nOverlays saved to: {OUTPUT_DIR}")
+    print(f"Complete! {rendered} rendered, {skipped} unchanged, {failed} failed ({total} samples)")
+    print(f"\nOverlays saved to: {output_dir}")
     print("=" * 60)
 
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
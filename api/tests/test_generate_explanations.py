@@ -0,0 +1,113 @@
+"""
+Tests for the retry and rate limiting logic of scripts/generate_explanations.py.
+
+The Anthropic client is replaced with a fake, so no request leaves the
+process.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from generate_explanations import TokenBucket, request_explanation, retry_delay
+
+RESULT = {
+    "prediction": "PNEUMONIA",
+    "confidence": 0.93,
+    "images": {"comparison": "aW1hZ2U="},
+    "image_media_type": "image/jpeg",
+}
+
+
+def status_error(status: int, headers=None) -> anthropic.APIStatusError:
+    request = httpx.Request("POST", "http://test/v1/messages")
+    response = httpx.Response(status, headers=headers, request=request)
+    error_cls = anthropic.RateLimitError if status == 429 else anthropic.APIStatusError
+    return error_cls(f"HTTP {status}", response=response, body=None)
+
+
+class FakeMessages:
+    """Raises the queued errors in turn, then succeeds."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.call_times = []
+
+    async def create(self, **kwargs):
+        self.call_times.append(time.monotonic())
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(content=[SimpleNamespace(text=" Explanation ")])
+
+
+def run_request(messages, limiter, max_retries=3):
+    client = SimpleNamespace(messages=messages)
+    return asyncio.run(request_explanation(
+        client, limiter, "pneumonia", "pneumonia_1", RESULT, max_retries, max_backoff=5.0
+    ))
+
+
+def test_rate_limit_pauses_bucket_and_retries():
+    messages = FakeMessages([status_error(429, {"retry-after": "0.3"})])
+    limiter = TokenBucket(rate=100, capacity=10)
+    start = time.monotonic()
+
+    assert run_request(messages, limiter) == "Explanation"
+
+    assert len(messages.call_times) == 2
+    assert limiter.paused_until >= start + 0.3
+    assert messages.call_times[1] - messages.call_times[0] >= 0.3
+
+
+def test_server_errors_are_retried():
+    messages = FakeMessages([status_error(500), status_error(529)])
+    limiter = TokenBucket(rate=100, capacity=10)
+
+    assert run_request(messages, limiter) == "Explanation"
+    assert len(messages.call_times) == 3
+    assert limiter.paused_until == 0.0  # Only rate limits pause the bucket
+
+
+def test_client_errors_are_not_retried():
+    messages = FakeMessages([status_error(400)])
+
+    with pytest.raises(anthropic.APIStatusError):
+        run_request(messages, TokenBucket(rate=100, capacity=10))
+    assert len(messages.call_times) == 1
+
+
+def test_retries_give_up_after_max_retries():
+    messages = FakeMessages([status_error(429, {"retry-after": "0"})] * 3)
+
+    with pytest.raises(anthropic.RateLimitError):
+        run_request(messages, TokenBucket(rate=100, capacity=10), max_retries=2)
+    assert len(messages.call_times) == 3
+
+
+def test_retry_delay():
+    assert retry_delay(status_error(429, {"retry-after": "2"}), 0, max_backoff=30) == 2.0
+    assert retry_delay(status_error(429, {"retry-after": "120"}), 0, max_backoff=30) == 30
+    assert 0.5 <= retry_delay(status_error(503), 0, max_backoff=30) <= 1.0
+    assert retry_delay(status_error(404), 0, max_backoff=30) is None
+    assert retry_delay(ValueError("bad"), 0, max_backoff=30) is None
+
+
+def test_token_bucket_limits_rate():
+    limiter = TokenBucket(rate=20, capacity=1)
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(4):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    # One token up front, then one every 50 ms
+    assert asyncio.run(run()) >= 0.14
@@ -0,0 +1,95 @@
+"""
+Tests for the explanation cache and async explanation requests.
+
+The Anthropic client is replaced with a fake, so no request leaves the
+process.
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.utils import llm
+from app.utils.llm import ExplanationCache
+
+
+class FakeMessages:
+    """Stands in for AsyncAnthropic.messages: counts calls, fails on request."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.failures = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise anthropic.APIConnectionError(request=httpx.Request("POST", "http://test/v1/messages"))
+        return SimpleNamespace(content=[SimpleNamespace(text=f" Explanation {self.calls} ")])
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setattr(llm, "EXPLANATION_CACHE", ExplanationCache())
+    monkeypatch.setattr(llm, "_async_semaphore", None)
+    fake = FakeMessages()
+    monkeypatch.setattr(llm, "_async_client", SimpleNamespace(messages=fake))
+    return fake
+
+
+def explain(image_b64: str = "aW1hZ2U="):
+    return llm.generate_explanation_async(
+        "pneumonia", "PNEUMONIA", 0.93, {}, comparison_image_b64=image_b64
+    )
+
+
+def test_concurrent_identical_calls_share_one_upstream_call(messages):
+    async def run():
+        return await asyncio.gather(*(explain() for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert messages.calls == 1
+    assert results == ["Explanation 1"] * 5
+    assert llm.EXPLANATION_CACHE.coalesced == 4
+
+
+def test_different_images_are_requested_separately(messages):
+    async def run():
+        return await asyncio.gather(explain("YQ=="), explain("Yg=="))
+
+    asyncio.run(run())
+
+    assert messages.calls == 2
+
+
+def test_cached_explanation_skips_upstream(messages):
+    assert asyncio.run(explain()) == "Explanation 1"
+    assert asyncio.run(explain()) == "Explanation 1"
+    assert messages.calls == 1
+
+
+def test_failed_call_is_not_cached(messages):
+    messages.failures = 1
+
+    async def run():
+        return await asyncio.gather(*(explain() for _ in range(3)))
+
+    # Everyone waiting on the failed call gets None...
+    assert asyncio.run(run()) == [None, None, None]
+    assert messages.calls == 1
+    assert llm.EXPLANATION_CACHE.get_stats()["entries"] == 0
+
+    # ...and the next request asks again
+    assert asyncio.run(explain()) == "Explanation 2"
+    assert messages.calls == 2